@@ -0,0 +1,110 @@
+import pathlib
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterator, Optional
+
+from terraflex.cli.daemon import DaemonInfo
+from terraflex.cli.forwarder import UnixSocketForwarder
+from terraflex.cli.server_process import DEFAULT_STARTUP_TIMEOUT, ForkedServer, ThreadedServer
+from terraflex.server.config import get_settings
+from terraflex.server.transport import bind_socket, bind_unix_socket, project_socket_path
+
+LOCALHOST = "127.0.0.1"
+
+
+def backend_environment(port: int, stack_name: str) -> dict[str, str]:
+    """Terraform http backend settings of a stack - as the environment variables terraform reads them from.
+
+    With them, the backend block of the stack can be left empty: `backend "http" {}`.
+    Locking is always configured - it's a no-op for storage providers that don't support it.
+    """
+    stack_address = f"http://localhost:{port}/{stack_name}"
+    return {
+        "TF_HTTP_ADDRESS": f"{stack_address}/state",
+        "TF_HTTP_LOCK_ADDRESS": f"{stack_address}/lock",
+        "TF_HTTP_LOCK_METHOD": "PUT",
+        "TF_HTTP_UNLOCK_ADDRESS": f"{stack_address}/lock",
+        "TF_HTTP_UNLOCK_METHOD": "DELETE",
+    }
+
+
+@dataclass
+class Backend:
+    """A running server, as seen by the wrapped commands."""
+
+    port: int
+    socket_path: Optional[pathlib.Path] = None
+    # the daemon the commands are attached to - None when the server runs for the wrap command only
+    daemon: Optional[DaemonInfo] = None
+
+    def environment(self, stack_name: Optional[str] = None) -> dict[str, str]:
+        env = {"TERRAFLEX_ADDRESS": f"http://localhost:{self.port}"}
+        if self.socket_path is not None:
+            env["TERRAFLEX_SOCKET"] = str(self.socket_path)
+
+        if stack_name is not None:
+            env.update(backend_environment(self.port, stack_name))
+
+        return env
+
+
+@contextmanager
+def forward_to(socket_path: pathlib.Path, port: int) -> Iterator[int]:
+    forwarder = UnixSocketForwarder(socket_path, host=LOCALHOST, port=port)
+    forwarder.start()
+    try:
+        yield forwarder.port
+
+    finally:
+        forwarder.stop()
+
+
+@contextmanager
+def attach_to_daemon(daemon: DaemonInfo, port: int) -> Iterator[Backend]:
+    """Use a running daemon - nothing is initialized, its providers are already warm."""
+    socket_path = pathlib.Path(daemon.socket_path)
+    with forward_to(socket_path, port) as forwarded_port:
+        yield Backend(port=forwarded_port, socket_path=socket_path, daemon=daemon)
+
+
+@contextmanager
+def start_backend(
+    port: int,
+    verbose: bool = False,
+    unix_socket: bool = False,
+    fork: bool = False,
+    startup_timeout: float = DEFAULT_STARTUP_TIMEOUT,
+) -> Iterator[Backend]:
+    """Start a server for the duration of the context - raises `ServerStartupError` if it fails to start."""
+    from uvicorn import Config
+
+    from terraflex.server.app import app as server_app
+
+    config = Config(
+        app=server_app,
+        lifespan="on",
+        access_log=verbose,
+        log_level="info" if verbose else "warning",
+    )
+    socket_path: Optional[pathlib.Path] = None
+    if unix_socket:
+        socket_path = project_socket_path(get_settings().state_dir, pathlib.Path.cwd())
+        sock = bind_unix_socket(socket_path)
+
+    else:
+        sock = bind_socket(LOCALHOST, port)
+
+    instance = ForkedServer(config, sock) if fork else ThreadedServer(config, sock)
+    try:
+        instance.start(timeout=startup_timeout)
+        if socket_path is None:
+            yield Backend(port=sock.getsockname()[1])
+            return
+
+        with forward_to(socket_path, port) as forwarded_port:
+            yield Backend(port=forwarded_port, socket_path=socket_path)
+
+    finally:
+        instance.stop()
+        if socket_path is not None:
+            socket_path.unlink(missing_ok=True)
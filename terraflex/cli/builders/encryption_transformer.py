@@ -6,9 +6,6 @@ from terraflex.cli.builders.storage_provider import create_storage_provider_and_
 from terraflex.plugins.encryption_transformation.age.controller import AgeKeygenController
 from terraflex.plugins.encryption_transformation.age.provider import AgeKeyConfig
 from terraflex.plugins.encryption_transformation.encryption_transformation_provider import EncryptionTransformerConfig
-from terraflex.server.app import (
-    config as server_config,
-)
 from terraflex.server.app import (
     create_storage_providers,
 )
@@ -16,6 +13,7 @@ from terraflex.server.config import (
     ConfigFile,
     StorageProviderUsageConfig,
     TransformerConfig,
+    get_settings,
 )
 from terraflex.server.storage_provider_base import WriteableStorageProviderProtocol
 from terraflex.utils.dependency_manager import DependenciesManager
@@ -36,7 +34,7 @@ async def generate_encryption_key(
     storage_providers = await create_storage_providers(
         config_file,
         manager,
-        workdir=server_config.state_dir,
+        workdir=get_settings().state_dir,
     )
 
     storage_provider_instance = storage_providers[provider_name]
@@ -1,32 +1,19 @@
 import asyncio
-import multiprocessing
+import os
 import pathlib
+import re
 import subprocess
-import time
 from contextlib import contextmanager
-from typing import Annotated, Any, Iterator
+from typing import Annotated, Iterator, Optional
 
-import httpx
-import questionary
 import typer
-import yaml
-from uvicorn import Config, Server
-
-from terraflex.cli.builders.wizard import start_configfile_creation_wizard
-from terraflex.server.app import (
-    CONFIG_FILE_NAME,
-    create_storage_providers,
-    initialize_manager,
-    start_server,
-)
-from terraflex.server.app import (
-    app as server_app,
-)
-from terraflex.server.app import (
-    config as server_config,
-)
-from terraflex.server.config import ConfigFile
-from terraflex.server.storage_provider_base import LockableStorageProviderProtocol
+
+from terraflex.cli import daemon
+from terraflex.cli.options import LazyOption, ReloadConfigOption
+
+# only the standard library and typer are imported at module level - everything else is imported
+# by the command that needs it, so `--help` and quick commands don't pay for the server's imports.
+# tests/test_cli_startup.py enforces it.
 
 READY_MESSAGE = """\
 backend "http" {{
@@ -47,6 +34,7 @@ LOCK_INFO = """\
 
 
 app = typer.Typer(pretty_exceptions_enable=False, rich_markup_mode=None)
+app.add_typer(daemon.app, name="daemon")
 
 
 @contextmanager
@@ -59,6 +47,13 @@ def capture_aborts() -> Iterator[None]:
 
 
 async def _init() -> None:
+    import questionary
+    import yaml
+
+    from terraflex.cli.builders.wizard import start_configfile_creation_wizard
+    from terraflex.server.app import initialize_manager
+    from terraflex.server.config import CONFIG_FILE_NAME
+
     port = 8600
     manager = await initialize_manager()
     config_file_location = pathlib.Path(CONFIG_FILE_NAME)
@@ -97,15 +92,82 @@ def init() -> None:
         asyncio.run(_init())
 
 
+UnixSocketOption = Annotated[
+    bool,
+    typer.Option(
+        "--unix-socket",
+        help="Serve on a unix socket of the project in the state directory instead of a TCP port",
+    ),
+]
+
+
+PROJECT_NAME_PATTERN = re.compile(r"[A-Za-z0-9._-]+")
+
+
+def parse_projects(value: str) -> dict[str, pathlib.Path]:
+    """Parse `name=directory,...` - the projects to serve, each under a route prefix of its name."""
+    projects: dict[str, pathlib.Path] = {}
+    for item in value.split(","):
+        name, separator, directory = item.strip().partition("=")
+        if not separator or not PROJECT_NAME_PATTERN.fullmatch(name) or not directory:
+            raise typer.BadParameter(f"Expected name=directory (name of letters, digits, '.', '_', '-'): {item!r}")
+
+        if name in projects:
+            raise typer.BadParameter(f"Duplicate project name: {name}")
+
+        projects[name] = pathlib.Path(directory).expanduser().resolve()
+
+    return projects
+
+
 @app.command()
 def start(
     port: Annotated[int, typer.Option(help="Port to run the server on")] = 8600,
+    lazy: LazyOption = False,
+    unix_socket: UnixSocketOption = False,
+    reload_config: ReloadConfigOption = False,
+    projects: Annotated[
+        Optional[str],
+        typer.Option(
+            help="Serve several projects (name=directory, comma separated) - each under /<name>/<stack>/state",
+        ),
+    ] = None,
 ) -> None:
-    """Starts the server with the configuration file in the current directory."""
-    start_server(port)
+    """Starts the server with the configuration file in the current directory.
+
+    With --projects, serves the configuration files of several projects instead:
+
+    $ terraflex start --projects infra=~/infra,apps=~/apps
+    """
+    from terraflex.server.app import start_server
+    from terraflex.server.config import get_settings
+    from terraflex.server.transport import project_socket_path
+
+    settings = get_settings()
+    settings.lazy_initialization = settings.lazy_initialization or lazy
+    settings.reload_config = settings.reload_config or reload_config
+    if projects is not None:
+        settings.projects = parse_projects(projects)
+
+    if settings.projects and settings.reload_config:
+        raise typer.BadParameter("--reload-config can't be used with --projects")
+
+    if not unix_socket:
+        start_server(port)
+        return
+
+    socket_path = project_socket_path(settings.state_dir, pathlib.Path.cwd())
+    print(f"Serving on unix socket: {socket_path}")
+    start_server(port, socket_path=socket_path)
 
 
 async def print_binding_message(stack_name: str, port: int) -> None:
+    import yaml
+
+    from terraflex.server.app import create_storage_providers, initialize_manager
+    from terraflex.server.config import CONFIG_FILE_NAME, ConfigFile, StackMatcher, get_settings
+    from terraflex.server.storage_provider_base import LockableStorageProviderProtocol
+
     manager = await initialize_manager()
     config_file = pathlib.Path(CONFIG_FILE_NAME)
     if not config_file.exists():
@@ -115,11 +177,12 @@ async def print_binding_message(stack_name: str, port: int) -> None:
     config_dict = yaml.safe_load(content)
     config = ConfigFile.model_validate(config_dict)
 
-    if stack_name not in config.stacks:
+    stack = StackMatcher(config.stacks).match(stack_name)
+    if stack is None:
         raise ValueError(f"Stack not found: {stack_name}")
 
-    storage_provider_name = config.stacks[stack_name].state_storage.provider
-    storage_providers = await create_storage_providers(config, manager=manager, workdir=server_config.state_dir)
+    storage_provider_name = stack.state_storage.provider
+    storage_providers = await create_storage_providers(config, manager=manager, workdir=get_settings().state_dir)
     content_parts = [
         ADDRESS_INFO.format(port=port, stack_name=stack_name).rstrip(),
     ]
@@ -141,30 +204,6 @@ def print_bindings(
         asyncio.run(print_binding_message(stack_name, port))
 
 
-class UvicornServer(multiprocessing.Process):
-    def __init__(self, config: Config):
-        super().__init__()
-        self.server = Server(config=config)
-        self.config = config
-
-    def stop(self):
-        self.terminate()
-
-    def run(self, *args: list[Any], **kwargs: dict[str, Any]):
-        self.server.run()
-
-
-def wait_until_ready(port: int):
-    client = httpx.Client()
-    while True:
-        try:
-            response = client.get(f"http://localhost:{port}/ready")
-            response.raise_for_status()
-            break
-        except Exception:
-            time.sleep(0.2)
-
-
 @app.command()
 def wrap(
     args: Annotated[list[str], typer.Argument(help="Command to run")],
@@ -172,28 +211,118 @@ def wrap(
         bool,
         typer.Option("-v", "--verbose", help="Print more details about the backend"),
     ] = False,
-    port: Annotated[int, typer.Option(help="Port to run the server on")] = 8600,
+    port: Annotated[int, typer.Option(help="Port to run the server on - 0 picks a free port")] = 8600,
+    lazy: LazyOption = False,
+    stack: Annotated[
+        Optional[str],
+        typer.Option(help="Pass the backend settings of this stack to the command as TF_HTTP_* environment variables"),
+    ] = None,
+    startup_timeout: Annotated[
+        float,
+        typer.Option(help="Seconds to wait for the server to be ready before giving up"),
+    ] = 60.0,
+    fork: Annotated[
+        bool,
+        typer.Option(
+            "--fork", help="Run the server in a forked child process instead of a thread of the current process"
+        ),
+    ] = False,
+    unix_socket: UnixSocketOption = False,
+    no_daemon: Annotated[
+        bool,
+        typer.Option("--no-daemon", help="Start a server even when the daemon of the project is running"),
+    ] = False,
+    stacks: Annotated[
+        Optional[str],
+        typer.Option(help="Run the command for each of these stacks (comma separated) - each in its own directory"),
+    ] = None,
+    parallel: Annotated[int, typer.Option(help="With --stacks - the number of commands to run at the same time")] = 4,
+    directory: Annotated[
+        str,
+        typer.Option(help="With --stacks - the directory of each stack, `{stack}` is replaced by the stack name"),
+    ] = "{stack}",
 ) -> None:
     """Main command that allows wrapping any command with the context of the server running.
 
     Its main purpose is to allow running terraform commands with the server running.
 
+    The command gets the server address in the `TERRAFLEX_ADDRESS` environment variable.
+    With `--unix-socket`, the server listens on a unix socket (passed in `TERRAFLEX_SOCKET`),
+    and the address is a local forwarder to it - for clients which can't connect to unix sockets, like terraform.
+
+    When the daemon of the project is running (`terraflex daemon start`), the command uses it instead of starting a server.
+
+    With `--stacks`, the command runs for every stack in its directory - all of them with one server.
+    Each run gets the backend settings of its stack (as with `--stack`), and its output is prefixed by the stack name.
+
     Examples:
     $ terraflex wrap -- terraform init
+    $ terraflex wrap --port 0 --stack main -- terraform plan
+    $ terraflex wrap --stacks dev,staging,prod --parallel 3 -- terraform plan
     """
-    instance = UvicornServer(
-        config=Config(
-            app=server_app,
-            port=port,
-            access_log=verbose,
-            log_level="info" if verbose else "warning",
+    from terraflex.cli.backend import attach_to_daemon, start_backend
+    from terraflex.cli.daemon import config_digest, find_daemon
+    from terraflex.cli.runner import format_summary, run_stacks
+    from terraflex.cli.server_process import ServerStartupError
+    from terraflex.server.config import get_settings
+
+    if stack is not None and stacks is not None:
+        raise typer.BadParameter("--stack and --stacks can't be used together")
+
+    settings = get_settings()
+    settings.lazy_initialization = settings.lazy_initialization or lazy
+
+    project_dir = pathlib.Path.cwd()
+    daemon_info = None if no_daemon else find_daemon(project_dir)
+    if (
+        daemon_info is not None
+        and not daemon_info.reload_config
+        and daemon_info.config_digest != config_digest(project_dir)
+    ):
+        print(
+            "Warning: terraflex.yaml changed since the daemon started - not using it (restart it to apply the changes)"
+        )
+        daemon_info = None
+
+    if daemon_info is not None:
+        backend_context = attach_to_daemon(daemon_info, port)
+
+    else:
+        backend_context = start_backend(
+            port,
+            verbose=verbose,
+            unix_socket=unix_socket,
+            fork=fork,
+            startup_timeout=startup_timeout,
         )
-    )
-    instance.start()
-    wait_until_ready(port)
-    # run the command
-    subprocess.run(args)
-    instance.stop()
+
+    try:
+        with backend_context as backend:
+            if verbose and backend.daemon is not None:
+                print(f"Attached to the daemon (pid {backend.daemon.pid})")
+
+            if stacks is None:
+                # run the command
+                subprocess.run(args, env={**os.environ, **backend.environment(stack)})
+                return
+
+            stack_names = [name.strip() for name in stacks.split(",") if name.strip()]
+            runs = asyncio.run(
+                run_stacks(
+                    args,
+                    stack_names,
+                    directory,
+                    parallel,
+                    environment=lambda stack_name: {**os.environ, **backend.environment(stack_name)},
+                )
+            )
+            print(format_summary(runs))
+            if not all(run.succeeded for run in runs):
+                raise typer.Exit(1)
+
+    except (ServerStartupError, FileExistsError) as e:
+        print("Error:", e)
+        raise typer.Exit(1) from e
 
 
 def main() -> None:
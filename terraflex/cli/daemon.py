@@ -0,0 +1,296 @@
+import contextlib
+import dataclasses
+import fcntl
+import hashlib
+import json
+import os
+import pathlib
+import select
+import signal
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from types import FrameType
+from typing import Annotated, Optional
+
+import typer
+
+from terraflex.cli.options import LazyOption, ReloadConfigOption
+
+DAEMONS_DIR_NAME = "daemons"
+DEFAULT_IDLE_TIMEOUT = 30 * 60.0
+# lines of the daemon log printed when it fails to start
+LOG_TAIL_LINES = 20
+
+app = typer.Typer(
+    help="Keep a warm server of the project in the background - `terraflex wrap` attaches to it when it's running.",
+    no_args_is_help=True,
+)
+
+
+@dataclass
+class DaemonPaths:
+    state_file: pathlib.Path
+    lock_file: pathlib.Path
+    log_file: pathlib.Path
+    socket_path: pathlib.Path
+
+
+@dataclass
+class DaemonInfo:
+    pid: int
+    project_dir: str
+    socket_path: str
+    log_file: str
+    config_digest: Optional[str]
+    idle_timeout: float
+    started_at: float
+    # whether the daemon applies changes of the config file - it then serves the current config
+    reload_config: bool = False
+
+
+def get_daemon_paths(project_dir: pathlib.Path) -> DaemonPaths:
+    from terraflex.server.config import get_settings
+    from terraflex.server.transport import project_id, project_socket_path
+
+    state_dir = get_settings().state_dir
+    daemon_dir = state_dir / DAEMONS_DIR_NAME
+    name = project_id(project_dir)
+    return DaemonPaths(
+        state_file=daemon_dir / f"{name}.json",
+        lock_file=daemon_dir / f"{name}.lock",
+        log_file=daemon_dir / f"{name}.log",
+        socket_path=project_socket_path(state_dir, project_dir),
+    )
+
+
+def config_digest(project_dir: pathlib.Path) -> Optional[str]:
+    """Digest of the project's config file - tells whether a daemon serves the current config."""
+    from terraflex.server.config import CONFIG_FILE_NAME
+
+    try:
+        return hashlib.blake2b((project_dir / CONFIG_FILE_NAME).read_bytes(), digest_size=16).hexdigest()
+
+    except FileNotFoundError:
+        return None
+
+
+def find_daemon(project_dir: pathlib.Path) -> Optional[DaemonInfo]:
+    """The daemon serving the project - None if it's not running."""
+    from terraflex.server.transport import unix_socket_in_use
+
+    paths = get_daemon_paths(project_dir)
+    try:
+        info = DaemonInfo(**json.loads(paths.state_file.read_text()))
+
+    except (OSError, ValueError, TypeError):
+        return None
+
+    if not unix_socket_in_use(pathlib.Path(info.socket_path)):
+        return None
+
+    return info
+
+
+def _exit_on_signal(signum: int, frame: Optional[FrameType]) -> None:
+    sys.exit(0)
+
+
+def run_daemon(project_dir: pathlib.Path, idle_timeout: float, ready_fd: Optional[int] = None) -> None:
+    """Serve the project on its unix socket until stopped, or until it's idle for `idle_timeout` seconds."""
+    from uvicorn import Config
+
+    from terraflex.cli.server_process import IdleTimeoutServer
+    from terraflex.server.app import app as server_app
+    from terraflex.server.config import get_settings
+    from terraflex.server.transport import bind_unix_socket
+
+    paths = get_daemon_paths(project_dir)
+    paths.lock_file.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    with open(paths.lock_file, "w") as lock:
+        try:
+            # held for the lifetime of the daemon - two daemons never serve the same project
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+        except BlockingIOError:
+            raise FileExistsError(f"A daemon is already running for {project_dir}") from None
+
+        sock = bind_unix_socket(paths.socket_path)
+        info = DaemonInfo(
+            pid=os.getpid(),
+            project_dir=str(project_dir),
+            socket_path=str(paths.socket_path),
+            log_file=str(paths.log_file),
+            config_digest=config_digest(project_dir),
+            idle_timeout=idle_timeout,
+            started_at=time.time(),
+            reload_config=get_settings().reload_config,
+        )
+        paths.state_file.write_text(json.dumps(dataclasses.asdict(info)))
+
+        def notify_ready() -> None:
+            if ready_fd is not None:
+                os.write(ready_fd, b"1")
+                os.close(ready_fd)
+
+        # uvicorn shuts down gracefully on SIGTERM, then raises it again for the previous handler -
+        # exit through it instead of being killed, so the files of the daemon are removed
+        signal.signal(signal.SIGTERM, _exit_on_signal)
+        server = IdleTimeoutServer(
+            Config(app=server_app, lifespan="on"),
+            on_started=notify_ready,
+            idle_timeout=idle_timeout,
+        )
+        try:
+            server.run(sockets=[sock])
+
+        finally:
+            sock.close()
+            paths.socket_path.unlink(missing_ok=True)
+            paths.state_file.unlink(missing_ok=True)
+
+
+def _wait_until_ready(ready_fd: int, timeout: float) -> bool:
+    with os.fdopen(ready_fd, "rb") as ready:
+        readable, _, _ = select.select([ready], [], [], timeout)
+        # an empty read - the daemon exited before it was ready
+        return bool(readable) and ready.read(1) == b"1"
+
+
+def _print_log_tail(log_file: pathlib.Path) -> None:
+    try:
+        lines = log_file.read_text(errors="replace").splitlines()
+
+    except FileNotFoundError:
+        return
+
+    print("\n".join(lines[-LOG_TAIL_LINES:]))
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+
+    except ProcessLookupError:
+        return False
+
+    return True
+
+
+IdleTimeoutOption = Annotated[
+    float,
+    typer.Option(help="Seconds without requests after which the daemon exits - 0 keeps it running until stopped"),
+]
+
+
+@app.command()
+def start(
+    idle_timeout: IdleTimeoutOption = DEFAULT_IDLE_TIMEOUT,
+    lazy: LazyOption = False,
+    reload_config: ReloadConfigOption = False,
+    startup_timeout: Annotated[
+        float,
+        typer.Option(help="Seconds to wait for the daemon to be ready before giving up"),
+    ] = 60.0,
+) -> None:
+    """Start the daemon of the project in the current directory - in the background."""
+    project_dir = pathlib.Path.cwd()
+    info = find_daemon(project_dir)
+    if info is not None:
+        print(f"Daemon is already running (pid {info.pid})")
+        return
+
+    paths = get_daemon_paths(project_dir)
+    paths.log_file.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    read_fd, write_fd = os.pipe()
+    command = [sys.executable, "-m", "terraflex", "daemon", "run", "--idle-timeout", str(idle_timeout)]
+    command += ["--ready-fd", str(write_fd)]
+    if lazy:
+        command.append("--lazy")
+
+    if reload_config:
+        command.append("--reload-config")
+
+    with open(paths.log_file, "ab") as log:
+        process = subprocess.Popen(
+            command,
+            stdin=subprocess.DEVNULL,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            pass_fds=(write_fd,),
+            # detached - not stopped with the shell that started it
+            start_new_session=True,
+        )
+
+    os.close(write_fd)
+    if not _wait_until_ready(read_fd, startup_timeout):
+        if process.poll() is None:
+            process.kill()
+
+        print("Error: Daemon failed to start - last lines of its log:")
+        _print_log_tail(paths.log_file)
+        raise typer.Exit(1)
+
+    print(f"Daemon started (pid {process.pid}) - logs: {paths.log_file}")
+
+
+@app.command()
+def stop() -> None:
+    """Stop the daemon of the project in the current directory."""
+    from terraflex.cli.server_process import SHUTDOWN_TIMEOUT
+
+    info = find_daemon(pathlib.Path.cwd())
+    if info is None:
+        print("Daemon is not running")
+        return
+
+    with contextlib.suppress(ProcessLookupError):
+        os.kill(info.pid, signal.SIGTERM)
+
+    deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+    while _is_alive(info.pid) and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    if _is_alive(info.pid):
+        with contextlib.suppress(ProcessLookupError):
+            os.kill(info.pid, signal.SIGKILL)
+
+    print(f"Daemon stopped (pid {info.pid})")
+
+
+@app.command()
+def status() -> None:
+    """Print the status of the daemon of the project in the current directory - exits with 1 if it's not running."""
+    project_dir = pathlib.Path.cwd()
+    info = find_daemon(project_dir)
+    if info is None:
+        print("Daemon is not running")
+        raise typer.Exit(1)
+
+    print(f"Daemon is running (pid {info.pid})")
+    print(f"  uptime: {time.time() - info.started_at:.0f}s")
+    print(f"  idle timeout: {info.idle_timeout:.0f}s" if info.idle_timeout > 0 else "  idle timeout: none")
+    print(f"  socket: {info.socket_path}")
+    print(f"  logs: {info.log_file}")
+    if info.reload_config:
+        print("  config: changes are applied while running")
+
+    elif info.config_digest != config_digest(project_dir):
+        print("  config: changed since the daemon started - restart it to apply the changes")
+
+
+@app.command()
+def run(
+    idle_timeout: IdleTimeoutOption = DEFAULT_IDLE_TIMEOUT,
+    lazy: LazyOption = False,
+    reload_config: ReloadConfigOption = False,
+    ready_fd: Annotated[Optional[int], typer.Option(hidden=True)] = None,
+) -> None:
+    """Run the daemon of the project in the current directory - in the foreground."""
+    from terraflex.server.config import get_settings
+
+    settings = get_settings()
+    settings.lazy_initialization = settings.lazy_initialization or lazy
+    settings.reload_config = settings.reload_config or reload_config
+    run_daemon(pathlib.Path.cwd(), idle_timeout, ready_fd)
@@ -0,0 +1,99 @@
+import asyncio
+import contextlib
+import pathlib
+import threading
+from typing import Optional
+
+from terraflex.server.transport import bind_socket
+
+CHUNK_SIZE = 64 * 1024
+
+
+async def _pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        while chunk := await reader.read(CHUNK_SIZE):
+            writer.write(chunk)
+            await writer.drain()
+
+        # pass the half-close on - the other direction may still be sending
+        if writer.can_write_eof():
+            writer.write_eof()
+
+    except OSError:
+        writer.close()
+
+
+class UnixSocketForwarder:
+    """Forwards TCP connections on a local port to a server's unix socket - for clients which can only connect
+    over TCP (terraform's http backend).
+
+    Runs in a background thread with its own event loop - bytes are copied as-is, HTTP is not parsed.
+    """
+
+    def __init__(self, socket_path: pathlib.Path, host: str = "127.0.0.1", port: int = 0):
+        self.socket_path = socket_path
+        self.socket = bind_socket(host, port)
+        self._ready = threading.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self._connections: set[asyncio.StreamWriter] = set()
+        self._thread = threading.Thread(target=self._run, name="terraflex-forwarder", daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self.socket.getsockname()[1]
+
+    def _run(self) -> None:
+        try:
+            asyncio.run(self._serve())
+
+        finally:
+            self._ready.set()
+
+    async def _serve(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        server = await asyncio.start_server(self._forward, sock=self.socket)
+        self._ready.set()
+        await self._stopping.wait()
+
+        server.close()
+        # idle keep-alive connections would keep the server from closing
+        for writer in list(self._connections):
+            writer.close()
+
+        await server.wait_closed()
+
+    async def _forward(self, client_reader: asyncio.StreamReader, client_writer: asyncio.StreamWriter) -> None:
+        try:
+            server_reader, server_writer = await asyncio.open_unix_connection(self.socket_path)
+
+        except OSError:
+            client_writer.close()
+            return
+
+        self._connections.update((client_writer, server_writer))
+        try:
+            await asyncio.gather(
+                _pipe(client_reader, server_writer),
+                _pipe(server_reader, client_writer),
+            )
+
+        finally:
+            self._connections.difference_update((client_writer, server_writer))
+            server_writer.close()
+            client_writer.close()
+
+    def start(self) -> None:
+        self._thread.start()
+        self._ready.wait()
+
+    def stop(self) -> None:
+        if self._loop is not None and self._stopping is not None:
+            with contextlib.suppress(RuntimeError):  # the loop already finished
+                self._loop.call_soon_threadsafe(self._stopping.set)
+
+        if self._thread.is_alive():
+            self._thread.join()
+
+        self.socket.close()
@@ -0,0 +1,19 @@
+from typing import Annotated
+
+import typer
+
+LazyOption = Annotated[
+    bool,
+    typer.Option(
+        "--lazy",
+        help="Initialize storage providers and transformers on first use of a stack that needs them",
+    ),
+]
+
+ReloadConfigOption = Annotated[
+    bool,
+    typer.Option(
+        "--reload-config",
+        help="Watch terraflex.yaml and apply its changes without restarting - only changed components are rebuilt",
+    ),
+]
@@ -0,0 +1,118 @@
+import asyncio
+import pathlib
+import sys
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional, Sequence
+
+STACK_PLACEHOLDER = "{stack}"
+# longest output line read at once - longer lines are split
+MAX_LINE_LENGTH = 1024 * 1024
+# exit code of a command that could not be started - as shells report it
+COMMAND_NOT_STARTED = 127
+
+
+@dataclass
+class StackRun:
+    stack_name: str
+    directory: pathlib.Path
+    returncode: Optional[int] = None
+    duration: float = 0.0
+
+    @property
+    def succeeded(self) -> bool:
+        return self.returncode == 0
+
+
+def stack_directory(directory_template: str, stack_name: str) -> pathlib.Path:
+    return pathlib.Path(directory_template.replace(STACK_PLACEHOLDER, stack_name))
+
+
+class PrefixedOutput:
+    """Prints the output of concurrent runs line by line - each line prefixed with the name of its stack."""
+
+    def __init__(self, stack_names: Sequence[str]):
+        self.width = max((len(name) for name in stack_names), default=0)
+
+    def write(self, stack_name: str, line: str) -> None:
+        # one write per line - lines of different stacks never interleave
+        sys.stdout.write(f"[{stack_name.ljust(self.width)}] {line}\n")
+        sys.stdout.flush()
+
+
+async def _read_line(stream: asyncio.StreamReader) -> bytes:
+    """Read the next line - a line longer than the limit of the stream is returned in parts, nothing is dropped."""
+    try:
+        return await stream.readuntil(b"\n")
+
+    except asyncio.IncompleteReadError as exc:
+        # the last line - without a line break
+        return exc.partial
+
+    except asyncio.LimitOverrunError as exc:
+        # the buffered part of the line is kept by the stream - the rest of the line is read next
+        return await stream.readexactly(exc.consumed)
+
+
+async def _run_stack(
+    args: Sequence[str],
+    run: StackRun,
+    env: dict[str, str],
+    output: PrefixedOutput,
+) -> None:
+    start = time.perf_counter()
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *args,
+            cwd=run.directory,
+            env=env,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            limit=MAX_LINE_LENGTH,
+        )
+
+    except OSError as exc:
+        output.write(run.stack_name, f"Error: {exc}")
+        run.returncode = COMMAND_NOT_STARTED
+        run.duration = time.perf_counter() - start
+        return
+
+    assert process.stdout is not None
+    while line := await _read_line(process.stdout):
+        output.write(run.stack_name, line.decode(errors="replace").rstrip("\r\n"))
+
+    run.returncode = await process.wait()
+    run.duration = time.perf_counter() - start
+
+
+async def run_stacks(
+    args: Sequence[str],
+    stack_names: Sequence[str],
+    directory_template: str,
+    parallel: int,
+    environment: Callable[[str], dict[str, str]],
+) -> list[StackRun]:
+    """Run a command for every stack - in the stack's directory, at most `parallel` at the same time."""
+    runs = [StackRun(name, stack_directory(directory_template, name)) for name in stack_names]
+    output = PrefixedOutput(stack_names)
+    semaphore = asyncio.Semaphore(max(parallel, 1))
+
+    async def run_limited(run: StackRun) -> None:
+        async with semaphore:
+            await _run_stack(args, run, environment(run.stack_name), output)
+
+    await asyncio.gather(*(run_limited(run) for run in runs))
+    return runs
+
+
+def format_summary(runs: Sequence[StackRun]) -> str:
+    width = max((len(run.stack_name) for run in runs), default=0)
+    lines = ["Summary:"]
+    for run in runs:
+        result = "ok" if run.succeeded else f"failed ({run.returncode})"
+        lines.append(f"  {run.stack_name.ljust(width)}  {result:<12}  {run.duration:.1f}s")
+
+    failed = sum(1 for run in runs if not run.succeeded)
+    lines.append(f"{len(runs) - failed} succeeded, {failed} failed")
+    return "\n".join(lines)
@@ -0,0 +1,201 @@
+import asyncio
+import contextlib
+import logging
+import multiprocessing
+import socket
+import threading
+import time
+from multiprocessing.connection import Connection
+from typing import Callable, Optional, Protocol, override
+
+from uvicorn import Config, Server
+
+logger = logging.getLogger("uvicorn.error").getChild("terraflex")
+
+DEFAULT_STARTUP_TIMEOUT = 60.0
+# time given to the server to finish in-flight requests and close its resources when stopped
+SHUTDOWN_TIMEOUT = 10.0
+
+
+class ServerStartupError(RuntimeError):
+    pass
+
+
+class NotifyingServer(Server):
+    """Uvicorn server that calls `on_started` once the app started and the socket accepts connections."""
+
+    def __init__(self, config: Config, on_started: Callable[[], None]):
+        super().__init__(config=config)
+        self.on_started = on_started
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._serve_task: Optional[asyncio.Task[None]] = None
+
+    @override
+    async def serve(self, sockets: Optional[list[socket.socket]] = None) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._serve_task = asyncio.current_task()  # type: ignore[assignment]
+        await super().serve(sockets=sockets)
+
+    def cancel(self) -> None:
+        """Abort the server from another thread - also while it's still starting up."""
+        if self._loop is None or self._serve_task is None:
+            return
+
+        with contextlib.suppress(RuntimeError):  # the loop already finished
+            self._loop.call_soon_threadsafe(self._serve_task.cancel)
+
+    @override
+    async def startup(self, sockets: Optional[list[socket.socket]] = None) -> None:
+        await super().startup(sockets=sockets)
+        if self.started:
+            self.on_started()
+
+
+class IdleTimeoutServer(NotifyingServer):
+    """Server which exits after it served no request for `idle_timeout` seconds - 0 disables the timeout."""
+
+    def __init__(self, config: Config, on_started: Callable[[], None], idle_timeout: float):
+        super().__init__(config, on_started=on_started)
+        self.idle_timeout = idle_timeout
+        self._last_active = time.monotonic()
+        self._requests_seen = 0
+
+    @override
+    async def on_tick(self, counter: int) -> bool:
+        if await super().on_tick(counter):
+            return True
+
+        if self.idle_timeout <= 0:
+            return False
+
+        now = time.monotonic()
+        if self.server_state.connections or self.server_state.total_requests != self._requests_seen:
+            self._requests_seen = self.server_state.total_requests
+            self._last_active = now
+            return False
+
+        if now - self._last_active < self.idle_timeout:
+            return False
+
+        logger.info("No requests for %.0f seconds - shutting down", self.idle_timeout)
+        return True
+
+
+class BackgroundServerProtocol(Protocol):
+    """A server running in the background of the CLI - serving a socket bound by the caller (TCP or unix)."""
+
+    socket: socket.socket
+
+    def start(self, timeout: float = DEFAULT_STARTUP_TIMEOUT) -> None:
+        """Start the server and block until it's ready - raises `ServerStartupError` if it's not ready in time."""
+        ...
+
+    def stop(self) -> None: ...
+
+
+class ThreadedServer(BackgroundServerProtocol):
+    """Runs the server in a background thread of the CLI process - no new process, and the server is imported once."""
+
+    def __init__(self, config: Config, sock: socket.socket):
+        self.socket = sock
+        self._ready = threading.Event()
+        self.server = NotifyingServer(config, on_started=self._ready.set)
+        self._thread = threading.Thread(target=self._run, name="terraflex-server", daemon=True)
+
+    def _run(self) -> None:
+        try:
+            self.server.run(sockets=[self.socket])
+
+        except (SystemExit, asyncio.CancelledError):
+            # uvicorn exits on a failed startup, and a stuck startup is cancelled - `start` reports both
+            pass
+
+        finally:
+            # wakes up `start` when the server exited before it was ready
+            self._ready.set()
+
+    @override
+    def start(self, timeout: float = DEFAULT_STARTUP_TIMEOUT) -> None:
+        self._thread.start()
+        if not self._ready.wait(timeout):
+            self.stop()
+            raise ServerStartupError(f"Server did not start within {timeout} seconds")
+
+        if not self.server.started:
+            self.stop()
+            raise ServerStartupError("Server failed to start")
+
+    @override
+    def stop(self) -> None:
+        if self.server.started:
+            self.server.should_exit = True
+
+        else:
+            # a server stuck in startup has nothing to shut down gracefully
+            self.server.cancel()
+
+        if self._thread.is_alive():
+            self._thread.join(SHUTDOWN_TIMEOUT)
+
+        self.socket.close()
+
+
+def _serve_forked(config: Config, sock: socket.socket, ready: Connection) -> None:
+    server = NotifyingServer(config, on_started=lambda: ready.send(True))
+    server.run(sockets=[sock])
+
+
+class ForkedServer(BackgroundServerProtocol):
+    """Runs the server in a forked child process - isolated from the wrapped command's process,
+    without paying for a fresh interpreter and a second import of the server.
+
+    The child inherits the bound socket, and reports readiness over a pipe.
+    """
+
+    def __init__(self, config: Config, sock: socket.socket):
+        self.socket = sock
+        context = multiprocessing.get_context("fork")
+        self._ready_receiver, self._ready_sender = context.Pipe(duplex=False)
+        self.process = context.Process(
+            target=_serve_forked,
+            args=(config, self.socket, self._ready_sender),
+            name="terraflex-server",
+            daemon=True,
+        )
+        self._started = False
+
+    @override
+    def start(self, timeout: float = DEFAULT_STARTUP_TIMEOUT) -> None:
+        self.process.start()
+        # only the child holds the sending end now - the pipe is closed as soon as it exits
+        self._ready_sender.close()
+        try:
+            if not self._ready_receiver.poll(timeout):
+                raise ServerStartupError(f"Server did not start within {timeout} seconds")
+
+            self._ready_receiver.recv()
+            self._started = True
+
+        except EOFError:
+            self.stop()
+            raise ServerStartupError("Server failed to start") from None
+
+        except ServerStartupError:
+            self.stop()
+            raise
+
+    @override
+    def stop(self) -> None:
+        if self.process.is_alive():
+            # a server stuck in startup has nothing to shut down gracefully
+            if self._started:
+                self.process.terminate()
+                self.process.join(SHUTDOWN_TIMEOUT)
+
+            if self.process.is_alive():
+                self.process.kill()
+                self.process.join()
+
+        self._ready_sender.close()
+        self._ready_receiver.close()
+        self.socket.close()
@@ -0,0 +1,194 @@
+import asyncio
+import gzip
+import hashlib
+import importlib.util
+import pathlib
+import struct
+from typing import Any, Literal, Optional, Self, assert_never, override
+
+from pydantic import BaseModel
+from terraflex.server.config import StorageProviderUsageConfig
+from terraflex.server.storage_provider_base import StorageProviderProtocol
+from terraflex.server.transformation_base import (
+    TransformerProtocol,
+)
+from terraflex.utils.dependency_manager import DependenciesManager
+
+COMPRESSION_MAGIC = b"TFXC"
+FORMAT_VERSION = 1
+# magic | version | codec | flags | dictionary id
+HEADER_FORMAT = ">4sBBB4s"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+FLAG_DICTIONARY = 0x01
+NO_DICTIONARY_ID = b"\x00" * 4
+
+Codec = Literal["gzip", "zstd"]
+CODEC_IDS: dict[Codec, int] = {"gzip": 1, "zstd": 2}
+CODECS_BY_ID: dict[int, Codec] = {codec_id: codec for codec, codec_id in CODEC_IDS.items()}
+
+
+class CompressionTransformerConfig(BaseModel):
+    """Transformer that compresses the content of the files before they are written to the storage provider.
+
+    Compressed files start with a small header that records the codec (and dictionary) used -
+    files without the header are read as-is, so existing uncompressed states keep working.
+
+    Attributes:
+        codec: `gzip` uses the standard library, `zstd` requires the `zstandard` package (`terraflex[zstd]`) -
+            `auto` uses `zstd` when available. Default: auto.
+        level: The compression level - Default: 9 for gzip, 10 for zstd.
+        dictionary: usage reference to the storage provider where a zstd dictionary is stored - trained on your states
+            (`zstd --train states/* -o states.dict`). Supported only with the `zstd` codec. Default: None.
+
+    Example:
+        Compress states before encrypting them - transformers are applied in order when writing:
+        ```yaml
+        transformers:
+            compression:
+                type: compression
+                codec: zstd
+            encryption:
+                type: encryption
+                key_type: age
+                import_from_storage:
+                    provider: envvar
+                    params:
+                        key: AGE_PRIVATE_KEY
+
+        stacks:
+            my-stack:
+                transformers:
+                    - compression
+                    - encryption
+        ```
+    """
+
+    codec: Literal["auto", "gzip", "zstd"] = "auto"
+    level: Optional[int] = None
+    dictionary: Optional[StorageProviderUsageConfig] = None
+
+
+def zstd_available() -> bool:
+    return importlib.util.find_spec("zstandard") is not None
+
+
+def dictionary_id(dictionary: bytes) -> bytes:
+    return hashlib.sha256(dictionary).digest()[:4]
+
+
+class CompressionTransformation(TransformerProtocol):
+    def __init__(self, codec: Codec, level: Optional[int] = None, dictionary: Optional[bytes] = None):
+        if codec == "zstd" and not zstd_available():
+            raise RuntimeError("zstd compression requires the `zstandard` package - install `terraflex[zstd]`")
+
+        if dictionary is not None and codec != "zstd":
+            raise ValueError("Compression dictionaries are supported only with the zstd codec")
+
+        self.codec: Codec = codec
+        self.level = level
+        self.dictionary = dictionary
+        self.dictionary_id = dictionary_id(dictionary) if dictionary is not None else NO_DICTIONARY_ID
+
+    @override
+    @classmethod
+    async def from_config(
+        cls,
+        raw_config: Any,
+        *,
+        storage_providers: dict[str, StorageProviderProtocol],
+        manager: DependenciesManager,
+        workdir: pathlib.Path,
+    ) -> Self:
+        config = CompressionTransformerConfig.model_validate(raw_config)
+        codec: Codec
+        if config.codec == "auto":
+            codec = "zstd" if zstd_available() else "gzip"
+
+        else:
+            codec = config.codec
+
+        dictionary = None
+        if config.dictionary is not None:
+            storage_provider = storage_providers.get(config.dictionary.provider)
+            if storage_provider is None:
+                raise ValueError(f"Undeclared storage provider: {config.dictionary.provider}")
+
+            storage_params = config.dictionary.params
+            if storage_params is None:
+                raise ValueError("Missing storage params")
+
+            dictionary = await storage_provider.get_file(storage_provider.validate_key(storage_params))
+
+        return cls(codec=codec, level=config.level, dictionary=dictionary)
+
+    def compress(self, content: bytes) -> bytes:
+        flags = FLAG_DICTIONARY if self.dictionary is not None else 0
+        header = struct.pack(
+            HEADER_FORMAT, COMPRESSION_MAGIC, FORMAT_VERSION, CODEC_IDS[self.codec], flags, self.dictionary_id
+        )
+
+        match self.codec:
+            case "gzip":
+                # mtime=0 - the same state always compresses to the same bytes
+                return header + gzip.compress(content, compresslevel=9 if self.level is None else self.level, mtime=0)
+
+            case "zstd":
+                import zstandard
+
+                dict_data = zstandard.ZstdCompressionDict(self.dictionary) if self.dictionary is not None else None
+                compressor = zstandard.ZstdCompressor(
+                    level=10 if self.level is None else self.level, dict_data=dict_data
+                )
+                return header + compressor.compress(content)
+
+            case _:
+                assert_never(self.codec)
+
+    def decompress(self, file_identifier: str, content: bytes) -> bytes:
+        if not content.startswith(COMPRESSION_MAGIC):
+            # written before compression was enabled
+            return content
+
+        if len(content) < HEADER_SIZE:
+            raise ValueError(f"Compressed content of {file_identifier} is truncated")
+
+        _, version, codec_id, flags, content_dictionary_id = struct.unpack_from(HEADER_FORMAT, content)
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported compression format version {version} in {file_identifier}")
+
+        codec = CODECS_BY_ID.get(codec_id)
+        if codec is None:
+            raise ValueError(f"Unsupported compression codec {codec_id} in {file_identifier}")
+
+        payload = content[HEADER_SIZE:]
+        match codec:
+            case "gzip":
+                return gzip.decompress(payload)
+
+            case "zstd":
+                if not zstd_available():
+                    raise RuntimeError(
+                        f"{file_identifier} is compressed with zstd - install `terraflex[zstd]` to read it"
+                    )
+
+                import zstandard
+
+                dict_data = None
+                if flags & FLAG_DICTIONARY:
+                    if self.dictionary is None or content_dictionary_id != self.dictionary_id:
+                        raise ValueError(f"{file_identifier} was compressed with a different dictionary")
+
+                    dict_data = zstandard.ZstdCompressionDict(self.dictionary)
+
+                return zstandard.ZstdDecompressor(dict_data=dict_data).decompress(payload)
+
+            case _:
+                assert_never(codec)
+
+    @override
+    async def transform_write_file_content(self, file_identifier: str, content: bytes) -> bytes:
+        return await asyncio.to_thread(self.compress, content)
+
+    @override
+    async def transform_read_file_content(self, file_identifier: str, content: bytes) -> bytes:
+        return await asyncio.to_thread(self.decompress, file_identifier, content)
@@ -1,7 +1,42 @@
+import os
+import shutil
 import tempfile
+import weakref
 from pathlib import Path
+from typing import Any, AsyncIterable, AsyncIterator, Optional
 
-from terraflex.utils.binary_controller import BinaryController
+from terraflex.utils.binary_controller import BinaryController, iter_chunks
+
+
+class IdentityFile:
+    """The private key materialized once - so the `age` binary can read it as an identity file.
+
+    On Linux the key lives in an anonymous in-memory file (`memfd`) that is passed to the child process
+    as an inherited file descriptor - it never touches the disk.
+    Elsewhere it's written once to a 0600 file inside a private 0700 temporary directory.
+    """
+
+    def __init__(self, content: bytes):
+        self.pass_fds: tuple[int, ...] = ()
+        if hasattr(os, "memfd_create"):
+            fd = os.memfd_create("age-identity", os.MFD_CLOEXEC)
+            os.write(fd, content)
+            self.pass_fds = (fd,)
+            # opening /dev/fd/N re-opens the memfd - so every reader starts at offset 0
+            self.path = f"/dev/fd/{fd}"
+            self._finalizer = weakref.finalize(self, os.close, fd)
+
+        else:
+            directory = tempfile.mkdtemp(prefix="terraflex-age-")
+            self.path = os.path.join(directory, "identity.txt")
+            fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+
+            self._finalizer = weakref.finalize(self, shutil.rmtree, directory, ignore_errors=True)
+
+    def close(self) -> None:
+        self._finalizer()
 
 
 class AgeController(BinaryController):
@@ -10,34 +45,60 @@ class AgeController(BinaryController):
         binary_location: Path,
         private_key: bytes,
         public_key: bytes,
+        max_concurrency: Optional[int] = None,
     ):
-        super().__init__(binary_location)
+        super().__init__(binary_location, max_concurrency=max_concurrency)
         self.private_key = private_key
         self.public_key = public_key
+        self._identity_file: Optional[IdentityFile] = None
 
-    async def encrypt(self, _: str, content: bytes) -> bytes:
-        return await self._execute_command(
+    def __getstate__(self) -> dict[str, Any]:
+        state = super().__getstate__()
+        # the identity file belongs to this process - it's materialized again on first use
+        state["_identity_file"] = None
+        return state
+
+    @property
+    def identity_file(self) -> IdentityFile:
+        if self._identity_file is None:
+            self._identity_file = IdentityFile(self.private_key)
+
+        return self._identity_file
+
+    async def close(self) -> None:
+        if self._identity_file is not None:
+            self._identity_file.close()
+            self._identity_file = None
+
+    def encrypt_stream(self, chunks: AsyncIterable[bytes | memoryview]) -> AsyncIterator[bytes]:
+        return self._execute_command_stream(
             [
                 "--encrypt",
                 "-r",
                 self.public_key,
             ],
-            stdin=content,
+            stdin=chunks,
         )
 
+    def decrypt_stream(self, chunks: AsyncIterable[bytes | memoryview]) -> AsyncIterator[bytes]:
+        identity_file = self.identity_file
+        return self._execute_command_stream(
+            [
+                "--decrypt",
+                "-i",
+                identity_file.path,
+            ],
+            stdin=chunks,
+            pass_fds=identity_file.pass_fds,
+        )
+
+    # transformers take and return whole states - the input is fed as views of `content` without copying it,
+    # but the output is collected in full. Callers that can stream use `encrypt_stream` / `decrypt_stream`.
+    async def encrypt(self, _: str, content: bytes) -> bytes:
+        return b"".join([chunk async for chunk in self.encrypt_stream(iter_chunks(content))])
+
     async def decrypt(self, _: str, content: bytes) -> bytes:
-        with tempfile.NamedTemporaryFile() as temp:
-            temp.write(self.private_key)
-            temp.flush()
-
-            return await self._execute_command(
-                [
-                    "--decrypt",
-                    "-i",
-                    temp.name,
-                ],
-                stdin=content,
-            )
+        return b"".join([chunk async for chunk in self.decrypt_stream(iter_chunks(content))])
 
 
 class AgeKeygenController(BinaryController):
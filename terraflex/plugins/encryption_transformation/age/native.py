@@ -0,0 +1,335 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+from typing import Self
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey, X25519PublicKey
+from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+AGE_INTRO = b"age-encryption.org/v1"
+ARMOR_BEGIN = b"-----BEGIN AGE ENCRYPTED FILE-----"
+X25519_STANZA_TYPE = b"X25519"
+X25519_LABEL = b"age-encryption.org/v1/X25519"
+SECRET_KEY_HRP = "age-secret-key-"
+PUBLIC_KEY_HRP = "age"
+
+FILE_KEY_SIZE = 16
+NONCE_SIZE = 16
+CHUNK_SIZE = 64 * 1024
+TAG_SIZE = 16
+STANZA_LINE_SIZE = 64
+
+BECH32_CHARSET = "qpzry9x8gf2tvdw0s3jn54khce6mua7l"
+BECH32_GENERATOR = [0x3B6A57B2, 0x26508E6D, 0x1EA119FA, 0x3D4233DD, 0x2A1462B3]
+
+
+class AgeFormatNotSupportedError(ValueError):
+    """The file uses a part of the age format that is not implemented in-process (armor, non X25519 recipients)."""
+
+
+def _bech32_polymod(values: list[int]) -> int:
+    checksum = 1
+    for value in values:
+        top = checksum >> 25
+        checksum = (checksum & 0x1FFFFFF) << 5 ^ value
+        for i, generator in enumerate(BECH32_GENERATOR):
+            if (top >> i) & 1:
+                checksum ^= generator
+
+    return checksum
+
+
+def _bech32_hrp_expand(hrp: str) -> list[int]:
+    return [ord(char) >> 5 for char in hrp] + [0] + [ord(char) & 31 for char in hrp]
+
+
+def _convert_bits(data: list[int] | bytes, from_bits: int, to_bits: int, pad: bool) -> list[int]:
+    accumulator = 0
+    bits = 0
+    result: list[int] = []
+    max_value = (1 << to_bits) - 1
+    for value in data:
+        accumulator = (accumulator << from_bits) | value
+        bits += from_bits
+        while bits >= to_bits:
+            bits -= to_bits
+            result.append((accumulator >> bits) & max_value)
+
+    if pad and bits:
+        result.append((accumulator << (to_bits - bits)) & max_value)
+
+    elif not pad and (bits >= from_bits or (accumulator << (to_bits - bits)) & max_value):
+        raise ValueError("Invalid bech32 padding")
+
+    return result
+
+
+def bech32_encode(hrp: str, data: bytes) -> str:
+    values = _convert_bits(data, 8, 5, pad=True)
+    polymod = _bech32_polymod(_bech32_hrp_expand(hrp) + values + [0] * 6) ^ 1
+    checksum = [(polymod >> 5 * (5 - i)) & 31 for i in range(6)]
+    return hrp + "1" + "".join(BECH32_CHARSET[value] for value in values + checksum)
+
+
+def bech32_decode(encoded: str) -> tuple[str, bytes]:
+    if encoded.lower() != encoded and encoded.upper() != encoded:
+        raise ValueError("Mixed case bech32 string")
+
+    encoded = encoded.lower()
+    separator = encoded.rfind("1")
+    if separator < 1 or separator + 7 > len(encoded):
+        raise ValueError("Invalid bech32 string")
+
+    hrp = encoded[:separator]
+    values = [BECH32_CHARSET.find(char) for char in encoded[separator + 1 :]]
+    if -1 in values:
+        raise ValueError("Invalid bech32 character")
+
+    if _bech32_polymod(_bech32_hrp_expand(hrp) + values) != 1:
+        raise ValueError("Invalid bech32 checksum")
+
+    return hrp, bytes(_convert_bits(values[:-6], 5, 8, pad=False))
+
+
+def _b64encode(data: bytes) -> bytes:
+    return base64.b64encode(data).rstrip(b"=")
+
+
+def _b64decode(data: bytes) -> bytes:
+    if data.endswith(b"=") or b"\r" in data or b"\n" in data:
+        raise ValueError("Invalid age base64 encoding")
+
+    decoded = base64.b64decode(data + b"=" * (-len(data) % 4), validate=True)
+    if _b64encode(decoded) != data:
+        raise ValueError("Non canonical age base64 encoding")
+
+    return decoded
+
+
+def _hkdf(ikm: bytes, salt: bytes | None, info: bytes) -> bytes:
+    return HKDF(algorithm=hashes.SHA256(), length=32, salt=salt, info=info).derive(ikm)
+
+
+def parse_identity(content: bytes) -> X25519PrivateKey:
+    """Parse an age identity file - as generated by `age-keygen` (comments are allowed)."""
+    for raw_line in content.decode().splitlines():
+        line = raw_line.strip()
+        if not line or line.startswith("#"):
+            continue
+
+        hrp, key = bech32_decode(line)
+        if hrp != SECRET_KEY_HRP or len(key) != 32:
+            raise AgeFormatNotSupportedError(f"Unsupported age identity type: {hrp}")
+
+        return X25519PrivateKey.from_private_bytes(key)
+
+    raise ValueError("No age identity found")
+
+
+def generate_identity() -> bytes:
+    return bech32_encode(SECRET_KEY_HRP, X25519PrivateKey.generate().private_bytes_raw()).upper().encode()
+
+
+def parse_recipient(recipient: str) -> X25519PublicKey:
+    hrp, key = bech32_decode(recipient)
+    if hrp != PUBLIC_KEY_HRP or len(key) != 32:
+        raise AgeFormatNotSupportedError(f"Unsupported age recipient type: {hrp}")
+
+    return X25519PublicKey.from_public_bytes(key)
+
+
+def format_recipient(public_key: X25519PublicKey) -> str:
+    return bech32_encode(PUBLIC_KEY_HRP, public_key.public_bytes_raw())
+
+
+def _payload_nonce(counter: int, last: bool) -> bytes:
+    return counter.to_bytes(11, "big") + (b"\x01" if last else b"\x00")
+
+
+def _header_mac(file_key: bytes, header: bytes) -> bytes:
+    return hmac.new(_hkdf(file_key, None, b"header"), header, hashlib.sha256).digest()
+
+
+def _encode_stanza(stanza_type: bytes, args: list[bytes], body: bytes) -> bytes:
+    encoded_body = _b64encode(body)
+    lines = [encoded_body[i : i + STANZA_LINE_SIZE] for i in range(0, len(encoded_body), STANZA_LINE_SIZE)]
+    if not lines or len(lines[-1]) == STANZA_LINE_SIZE:
+        # the last line of a stanza body must be shorter than a full line - even if empty
+        lines.append(b"")
+
+    return b" ".join([b"->", stanza_type, *args]) + b"\n" + b"".join(line + b"\n" for line in lines)
+
+
+def _wrap_file_key(file_key: bytes, recipient: X25519PublicKey) -> bytes:
+    ephemeral = X25519PrivateKey.generate()
+    share = ephemeral.public_key().public_bytes_raw()
+    shared_secret = ephemeral.exchange(recipient)
+    wrap_key = _hkdf(shared_secret, share + recipient.public_bytes_raw(), X25519_LABEL)
+    body = ChaCha20Poly1305(wrap_key).encrypt(bytes(12), file_key, None)
+    return _encode_stanza(X25519_STANZA_TYPE, [_b64encode(share)], body)
+
+
+def _unwrap_file_key(args: list[bytes], body: bytes, identity: X25519PrivateKey) -> bytes | None:
+    if len(args) != 1:
+        raise ValueError("Invalid X25519 stanza")
+
+    share = _b64decode(args[0])
+    if len(share) != 32 or len(body) != FILE_KEY_SIZE + TAG_SIZE:
+        raise ValueError("Invalid X25519 stanza")
+
+    shared_secret = identity.exchange(X25519PublicKey.from_public_bytes(share))
+    wrap_key = _hkdf(shared_secret, share + identity.public_key().public_bytes_raw(), X25519_LABEL)
+    try:
+        return ChaCha20Poly1305(wrap_key).decrypt(bytes(12), body, None)
+
+    except InvalidTag:
+        # stanza addressed to another recipient
+        return None
+
+
+def encrypt(content: bytes, recipients: list[X25519PublicKey]) -> bytes:
+    file_key = os.urandom(FILE_KEY_SIZE)
+    header = AGE_INTRO + b"\n" + b"".join(_wrap_file_key(file_key, recipient) for recipient in recipients) + b"---"
+    header += b" " + _b64encode(_header_mac(file_key, header)) + b"\n"
+
+    nonce = os.urandom(NONCE_SIZE)
+    aead = ChaCha20Poly1305(_hkdf(file_key, nonce, b"payload"))
+    view = memoryview(content)
+    chunks = [header, nonce]
+    offsets = range(0, len(content), CHUNK_SIZE) if content else range(1)
+    for counter, offset in enumerate(offsets):
+        last = offset + CHUNK_SIZE >= len(content)
+        chunks.append(aead.encrypt(_payload_nonce(counter, last), view[offset : offset + CHUNK_SIZE], None))
+
+    return b"".join(chunks)
+
+
+def _parse_header(content: bytes) -> tuple[list[tuple[bytes, list[bytes], bytes]], bytes, bytes, int]:
+    """Parse the header of an age file.
+
+    Returns:
+        The stanzas (type, args, body), the header bytes covered by the MAC, the MAC and the payload offset.
+    """
+    if content.startswith(ARMOR_BEGIN):
+        raise AgeFormatNotSupportedError("Armored age files are not supported in-process")
+
+    position = 0
+
+    def next_line() -> bytes:
+        nonlocal position
+        end = content.find(b"\n", position)
+        if end == -1:
+            raise ValueError("Invalid age header - unexpected end of file")
+
+        line = content[position:end]
+        position = end + 1
+        return line
+
+    if next_line() != AGE_INTRO:
+        raise AgeFormatNotSupportedError("Unsupported age file version")
+
+    stanzas: list[tuple[bytes, list[bytes], bytes]] = []
+    while True:
+        line_start = position
+        line = next_line()
+        if line.startswith(b"--- "):
+            mac = _b64decode(line[4:])
+            return stanzas, content[: line_start + 3], mac, position
+
+        if not line.startswith(b"-> "):
+            raise ValueError("Invalid age header - malformed stanza")
+
+        stanza_type, *args = line[3:].split(b" ")
+        body_lines: list[bytes] = []
+        while True:
+            body_line = next_line()
+            if len(body_line) > STANZA_LINE_SIZE:
+                raise ValueError("Invalid age header - stanza line too long")
+
+            body_lines.append(body_line)
+            if len(body_line) < STANZA_LINE_SIZE:
+                break
+
+        stanzas.append((stanza_type, args, _b64decode(b"".join(body_lines))))
+
+
+def decrypt(content: bytes, identity: X25519PrivateKey) -> bytes:
+    stanzas, header, mac, payload_offset = _parse_header(content)
+
+    file_key = None
+    for stanza_type, args, body in stanzas:
+        if stanza_type != X25519_STANZA_TYPE:
+            continue
+
+        file_key = _unwrap_file_key(args, body, identity)
+        if file_key is not None:
+            break
+
+    if file_key is None:
+        if any(stanza_type != X25519_STANZA_TYPE for stanza_type, _, _ in stanzas):
+            raise AgeFormatNotSupportedError("The file is not encrypted to an X25519 recipient")
+
+        raise ValueError("No identity matched any of the recipients")
+
+    if not hmac.compare_digest(_header_mac(file_key, header), mac):
+        raise ValueError("Invalid age header MAC")
+
+    nonce = content[payload_offset : payload_offset + NONCE_SIZE]
+    if len(nonce) != NONCE_SIZE:
+        raise ValueError("Invalid age payload - missing nonce")
+
+    aead = ChaCha20Poly1305(_hkdf(file_key, nonce, b"payload"))
+    view = memoryview(content)[payload_offset + NONCE_SIZE :]
+    encrypted_chunk_size = CHUNK_SIZE + TAG_SIZE
+    chunks: list[bytes] = []
+    offsets = range(0, len(view), encrypted_chunk_size) if len(view) else range(1)
+    for counter, offset in enumerate(offsets):
+        last = offset + encrypted_chunk_size >= len(view)
+        chunk = view[offset : offset + encrypted_chunk_size]
+        try:
+            plaintext = aead.decrypt(_payload_nonce(counter, last), chunk, None)
+
+        except InvalidTag as exc:
+            raise ValueError("Invalid age payload - failed to decrypt chunk") from exc
+
+        if not plaintext and counter > 0:
+            raise ValueError("Invalid age payload - empty last chunk")
+
+        chunks.append(plaintext)
+
+    return b"".join(chunks)
+
+
+class AgeNativeController:
+    """Encrypts and decrypts age files in-process - no `age` binary is spawned.
+
+    Implements the [age v1](https://age-encryption.org/v1) file format for X25519 recipients -
+    which is what `age-keygen` generates. Files are compatible with the `age` binary in both directions.
+    """
+
+    def __init__(self, private_key: bytes):
+        self.private_key = private_key
+        self.identity = parse_identity(private_key)
+        self.recipient = self.identity.public_key()
+        self.public_key = format_recipient(self.recipient).encode()
+
+    def __reduce__(self) -> tuple[type[Self], tuple[bytes]]:
+        # key objects can't be pickled - rebuild them from the private key (sending it to a worker process)
+        return (type(self), (self.private_key,))
+
+    def encrypt_bytes(self, content: bytes) -> bytes:
+        return encrypt(content, [self.recipient])
+
+    def decrypt_bytes(self, content: bytes) -> bytes:
+        return decrypt(content, self.identity)
+
+    async def encrypt(self, _: str, content: bytes) -> bytes:
+        return await asyncio.to_thread(self.encrypt_bytes, content)
+
+    async def decrypt(self, _: str, content: bytes) -> bytes:
+        return await asyncio.to_thread(self.decrypt_bytes, content)
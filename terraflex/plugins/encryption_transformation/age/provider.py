@@ -1,11 +1,13 @@
-from typing import Any, Self, override
+import importlib.util
+import os
+from typing import Any, Literal, Optional, Protocol, Self, override
 
 from pydantic import BaseModel
 from terraflex.plugins.encryption_transformation.age.controller import AgeController, AgeKeygenController
 from terraflex.plugins.encryption_transformation.age.downloader import AgeDownloader
 from terraflex.plugins.encryption_transformation.encryption_base import EncryptionProtocol
 from terraflex.server.config import StorageProviderUsageConfig
-from terraflex.server.storage_provider_base import StorageProviderProtocol
+from terraflex.server.storage_provider_base import ClosableProtocol, StorageProviderProtocol
 from terraflex.utils.dependency_downloader import DependencyDownloader
 from terraflex.utils.dependency_manager import DependenciesManager
 
@@ -15,9 +17,14 @@ class AgeKeyConfig(BaseModel):
 
     Attributes:
         import_from_storage: usage reference to the storage provider where the private key is stored.
+        backend: `native` encrypts in-process (requires the `cryptography` package - `terraflex[crypto]`),
+            `binary` spawns the `age` binary for every operation, `auto` uses `native` when available. Default: auto.
+        max_concurrent_processes: The maximum number of `age` processes running at the same time. Default: number of CPUs.
     """
 
     import_from_storage: StorageProviderUsageConfig
+    backend: Literal["auto", "native", "binary"] = "auto"
+    max_concurrent_processes: Optional[int] = None
 
 
 AgeDependency = DependencyDownloader(
@@ -27,12 +34,25 @@ AgeDependency = DependencyDownloader(
 )
 
 
+def native_backend_available() -> bool:
+    return importlib.util.find_spec("cryptography") is not None
+
+
+class AgeControllerProtocol(Protocol):
+    public_key: bytes
+
+    async def encrypt(self, _: str, content: bytes) -> bytes: ...
+    async def decrypt(self, _: str, content: bytes) -> bytes: ...
+
+
 class AgeEncryptionProvider(EncryptionProtocol):
     def __init__(
         self,
-        controller: AgeController,
+        controller: AgeControllerProtocol,
+        fallback_controller: Optional[AgeController] = None,
     ):
         self.controller = controller
+        self.fallback_controller = fallback_controller
 
     @classmethod
     async def from_config(
@@ -53,6 +73,29 @@ class AgeEncryptionProvider(EncryptionProtocol):
 
         storage_key = storage_provider.validate_key(storage_params)
         private_key = await storage_provider.get_file(storage_key)
+
+        max_concurrency = config.max_concurrent_processes or os.cpu_count()
+        use_native = config.backend == "native" or (config.backend == "auto" and native_backend_available())
+        if use_native:
+            if not native_backend_available():
+                raise RuntimeError(
+                    "Native age backend requires the `cryptography` package - install `terraflex[crypto]`"
+                )
+
+            from terraflex.plugins.encryption_transformation.age.native import AgeNativeController
+
+            native_controller = AgeNativeController(private_key=private_key)
+            return cls(
+                controller=native_controller,
+                # files using features not implemented in-process (armor, other recipient types) are read by the binary
+                fallback_controller=AgeController(
+                    binary_location=manager.require_dependency("age"),
+                    private_key=private_key,
+                    public_key=native_controller.public_key,
+                    max_concurrency=max_concurrency,
+                ),
+            )
+
         age_keygen_controller = AgeKeygenController(
             binary_location=manager.require_dependency("age-keygen"),
         )
@@ -63,13 +106,28 @@ class AgeEncryptionProvider(EncryptionProtocol):
                 binary_location=manager.require_dependency("age"),
                 private_key=private_key,
                 public_key=public_key,
+                max_concurrency=max_concurrency,
             )
         )
 
+    async def close(self) -> None:
+        for controller in (self.controller, self.fallback_controller):
+            if isinstance(controller, ClosableProtocol):
+                await controller.close()
+
     @override
     async def encrypt(self, file_name: str, content: bytes) -> bytes:
         return await self.controller.encrypt(file_name, content)
 
     @override
     async def decrypt(self, file_name: str, content: bytes) -> bytes:
-        return await self.controller.decrypt(file_name, content)
+        if self.fallback_controller is None:
+            return await self.controller.decrypt(file_name, content)
+
+        from terraflex.plugins.encryption_transformation.age.native import AgeFormatNotSupportedError
+
+        try:
+            return await self.controller.decrypt(file_name, content)
+
+        except AgeFormatNotSupportedError:
+            return await self.fallback_controller.decrypt(file_name, content)
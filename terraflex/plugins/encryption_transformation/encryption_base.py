@@ -4,6 +4,13 @@ from terraflex.server.storage_provider_base import StorageProviderProtocol
 from terraflex.utils.dependency_manager import DependenciesManager
 
 
+class EncrypterProtocol(Protocol):
+    """Anything that encrypts and decrypts files - an encryption provider, or a wrapper around one."""
+
+    async def encrypt(self, file_name: str, content: bytes) -> bytes: ...
+    async def decrypt(self, file_name: str, content: bytes) -> bytes: ...
+
+
 @runtime_checkable
 class EncryptionProtocol(Protocol):
     """Protocol for encryption providers.
@@ -31,7 +38,7 @@ class EncryptionProtocol(Protocol):
 
         Args:
             raw_config: The raw configuration propagated from the transformer config.
-            storage_providers: All the initialized storage providers specified in the config file.
+            storage_providers: The initialized storage providers referenced in the transformer config - keyed by name.
             manager: The dependencies manager - allows to request a binary path from.
 
         Returns:
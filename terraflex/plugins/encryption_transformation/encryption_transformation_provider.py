@@ -1,9 +1,11 @@
 import pathlib
-from typing import Any, Self, override
+from typing import Any, Optional, Self, override
 
 from pydantic import BaseModel, ConfigDict
-from terraflex.plugins.encryption_transformation.encryption_base import EncryptionProtocol
-from terraflex.server.storage_provider_base import StorageProviderProtocol
+from terraflex.plugins.encryption_transformation.encryption_base import EncrypterProtocol, EncryptionProtocol
+from terraflex.plugins.encryption_transformation.envelope import EnvelopeConfig, EnvelopeEncryption
+from terraflex.plugins.encryption_transformation.worker_pool import EncryptionWorkerPool
+from terraflex.server.storage_provider_base import ClosableProtocol, StorageProviderProtocol
 from terraflex.server.transformation_base import (
     TransformerProtocol,
 )
@@ -18,6 +20,11 @@ class EncryptionTransformerConfig(BaseModel):
 
     Attributes:
         key_type: The type of the encryption key.
+        workers: Number of worker processes to run encryption and decryption in - so concurrent stacks use every core.
+            Useful for in-process encryption providers, 0 runs them in the server process. Default: 0.
+        max_in_flight: The maximum number of operations submitted to the workers at the same time. Default: 2 * workers.
+        envelope: Encrypt states with a cached symmetric data key, and use the encryption provider only to wrap it.
+            Default: None. (every state is encrypted with the encryption provider)
         **kwargs: Additional configuration for the encryption provider.
 
     Example:
@@ -30,18 +37,36 @@ class EncryptionTransformerConfig(BaseModel):
             params:
                 key: AGE_PRIVATE_KEY
         ```
+
+        Envelope encryption - `age` runs only when a new data key is created or first read:
+        ```yaml
+        type: encryption
+        key_type: age
+        import_from_storage:
+            provider: envvar
+            params:
+                key: AGE_PRIVATE_KEY
+        envelope:
+            rotate_after_writes: 1000
+            rotate_after_minutes: 60
+        ```
     """
 
     model_config = ConfigDict(extra="allow")
     key_type: str
-
-
-encryption_providers = get_providers(EncryptionProtocol, ENCRYPTION_PROVIDER_ENTRYPOINT)
+    workers: int = 0
+    max_in_flight: Optional[int] = None
+    envelope: Optional[EnvelopeConfig] = None
 
 
 class EncryptionTransformation(TransformerProtocol):
-    def __init__(self, encryption_provider: EncryptionProtocol):
+    def __init__(
+        self,
+        encryption_provider: EncrypterProtocol,
+        worker_pool: Optional[EncryptionWorkerPool] = None,
+    ):
         self.encryption_provider = encryption_provider
+        self.worker_pool = worker_pool
 
     @override
     @classmethod
@@ -54,23 +79,43 @@ class EncryptionTransformation(TransformerProtocol):
         workdir: pathlib.Path,
     ) -> Self:
         config = EncryptionTransformerConfig.model_validate(raw_config)
+        encryption_providers = get_providers(EncryptionProtocol, ENCRYPTION_PROVIDER_ENTRYPOINT, cache_dir=workdir)
         encryption_provider = encryption_providers.get(config.key_type)
         if encryption_provider is None:
             raise ValueError(f"Unsupported encryption key type: {config.key_type}")
 
         encryption_controller_class = encryption_provider.model_class
-        controller = await encryption_controller_class.from_config(
+        controller: EncrypterProtocol = await encryption_controller_class.from_config(
             raw_config,
             storage_providers=storage_providers,
             manager=manager,
         )
+        if config.envelope is not None:
+            controller = EnvelopeEncryption(controller, **config.envelope.model_dump())
+
+        worker_pool = None
+        if config.workers > 0:
+            worker_pool = EncryptionWorkerPool(controller, workers=config.workers, max_in_flight=config.max_in_flight)
 
-        return cls(encryption_provider=controller)
+        return cls(encryption_provider=controller, worker_pool=worker_pool)
+
+    async def close(self) -> None:
+        if self.worker_pool is not None:
+            await self.worker_pool.close()
+
+        if isinstance(self.encryption_provider, ClosableProtocol):
+            await self.encryption_provider.close()
 
     @override
     async def transform_read_file_content(self, file_identifier: str, content: bytes) -> bytes:
+        if self.worker_pool is not None:
+            return await self.worker_pool.run("decrypt", file_identifier, content)
+
         return await self.encryption_provider.decrypt(file_identifier, content)
 
     @override
     async def transform_write_file_content(self, file_identifier: str, content: bytes) -> bytes:
+        if self.worker_pool is not None:
+            return await self.worker_pool.run("encrypt", file_identifier, content)
+
         return await self.encryption_provider.encrypt(file_identifier, content)
@@ -0,0 +1,187 @@
+import asyncio
+import importlib.util
+import os
+import struct
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Optional, override
+
+from pydantic import BaseModel
+from terraflex.plugins.encryption_transformation.encryption_base import EncrypterProtocol
+from terraflex.server.metrics import cache_lookup
+from terraflex.server.storage_provider_base import ClosableProtocol
+
+ENVELOPE_MAGIC = b"terraflex-envelope/v1\n"
+DATA_KEY_SIZE = 32
+NONCE_SIZE = 12
+# the wrapped data key is passed to the key provider as the file name - it's only a label
+DATA_KEY_FILE_NAME = "terraflex-data-key"
+
+
+class EnvelopeConfig(BaseModel):
+    """Envelope encryption - states are encrypted with a symmetric data key (AES-256-GCM),
+    and only the data key is encrypted with the configured encryption provider.
+
+    Requires the `cryptography` package (`terraflex[crypto]`).
+
+    Attributes:
+        rotate_after_writes: Generate a new data key after it was used to encrypt this many files. Default: 1000.
+        rotate_after_minutes: Generate a new data key after it was used for this many minutes. Default: 60.
+        cache_size: The number of unwrapped data keys kept in memory for reading. Default: 128.
+    """
+
+    rotate_after_writes: int = 1000
+    rotate_after_minutes: float = 60
+    cache_size: int = 128
+
+
+@dataclass
+class DataKey:
+    key: bytes
+    wrapped: bytes
+    created_at: float
+    writes: int = 0
+
+
+def envelope_encryption_available() -> bool:
+    return importlib.util.find_spec("cryptography") is not None
+
+
+class EnvelopeEncryption(EncrypterProtocol):
+    """Wraps an encryption provider - so it runs once per data key instead of once per write.
+
+    Layout of an encrypted file:
+    `ENVELOPE_MAGIC | wrapped key length (4 bytes, big endian) | wrapped key | nonce | AES-GCM ciphertext`.
+
+    Files which don't start with `ENVELOPE_MAGIC` were written before envelope mode was enabled,
+    they are decrypted with the wrapped provider directly.
+    """
+
+    def __init__(
+        self,
+        key_provider: EncrypterProtocol,
+        rotate_after_writes: int = 1000,
+        rotate_after_minutes: float = 60,
+        cache_size: int = 128,
+    ):
+        if not envelope_encryption_available():
+            raise RuntimeError("Envelope encryption requires the `cryptography` package - install `terraflex[crypto]`")
+
+        self.key_provider = key_provider
+        self.rotate_after_writes = rotate_after_writes
+        self.rotate_after_minutes = rotate_after_minutes
+        self.cache_size = cache_size
+
+        self._data_key: Optional[DataKey] = None
+        self._data_key_lock = asyncio.Lock()
+        # wrapped key -> unwrapped key, least recently used first
+        self._unwrapped_keys: OrderedDict[bytes, bytes] = OrderedDict()
+        self._unwrapping: dict[bytes, asyncio.Future[bytes]] = {}
+
+    def __getstate__(self) -> dict[str, Any]:
+        # keys are never sent to other processes - every process generates and caches its own
+        state = self.__dict__.copy()
+        state["_data_key"] = None
+        state["_data_key_lock"] = None
+        state["_unwrapped_keys"] = OrderedDict()
+        state["_unwrapping"] = {}
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._data_key_lock = asyncio.Lock()
+
+    async def close(self) -> None:
+        self._data_key = None
+        self._unwrapped_keys.clear()
+        if isinstance(self.key_provider, ClosableProtocol):
+            await self.key_provider.close()
+
+    def _is_expired(self, data_key: DataKey) -> bool:
+        return (
+            data_key.writes >= self.rotate_after_writes
+            or time.monotonic() - data_key.created_at >= self.rotate_after_minutes * 60
+        )
+
+    async def _get_data_key(self) -> DataKey:
+        async with self._data_key_lock:
+            if self._data_key is None or self._is_expired(self._data_key):
+                key = os.urandom(DATA_KEY_SIZE)
+                wrapped = await self.key_provider.encrypt(DATA_KEY_FILE_NAME, key)
+                self._data_key = DataKey(key=key, wrapped=wrapped, created_at=time.monotonic())
+                self._remember(wrapped, key)
+
+            self._data_key.writes += 1
+            return self._data_key
+
+    def _remember(self, wrapped: bytes, key: bytes) -> None:
+        self._unwrapped_keys[wrapped] = key
+        self._unwrapped_keys.move_to_end(wrapped)
+        while len(self._unwrapped_keys) > self.cache_size:
+            self._unwrapped_keys.popitem(last=False)
+
+    async def _unwrap(self, wrapped: bytes) -> bytes:
+        key = self._unwrapped_keys.get(wrapped)
+        cache_lookup("envelope_data_keys", hit=key is not None)
+        if key is not None:
+            self._unwrapped_keys.move_to_end(wrapped)
+            return key
+
+        # concurrent reads of files sharing a data key unwrap it only once
+        pending = self._unwrapping.get(wrapped)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        pending = asyncio.get_running_loop().create_future()
+        self._unwrapping[wrapped] = pending
+        try:
+            key = await self.key_provider.decrypt(DATA_KEY_FILE_NAME, wrapped)
+
+        except BaseException as exc:
+            pending.set_exception(exc)
+            # the error is raised here - don't warn about an unretrieved exception when no one else waits
+            pending.exception()
+            raise
+
+        finally:
+            del self._unwrapping[wrapped]
+
+        pending.set_result(key)
+        self._remember(wrapped, key)
+        return key
+
+    @override
+    async def encrypt(self, file_name: str, content: bytes) -> bytes:
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+        data_key = await self._get_data_key()
+        header = ENVELOPE_MAGIC + struct.pack(">I", len(data_key.wrapped)) + data_key.wrapped
+        nonce = os.urandom(NONCE_SIZE)
+        # the header is authenticated - a ciphertext can't be moved under another wrapped key
+        ciphertext = await asyncio.to_thread(AESGCM(data_key.key).encrypt, nonce, content, header)
+        return header + nonce + ciphertext
+
+    @override
+    async def decrypt(self, file_name: str, content: bytes) -> bytes:
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+        if not content.startswith(ENVELOPE_MAGIC):
+            return await self.key_provider.decrypt(file_name, content)
+
+        offset = len(ENVELOPE_MAGIC)
+        if len(content) < offset + 4:
+            raise ValueError(f"Envelope of {file_name} is truncated")
+
+        (wrapped_length,) = struct.unpack_from(">I", content, offset)
+        offset += 4
+        wrapped = content[offset : offset + wrapped_length]
+        offset += wrapped_length
+        nonce = content[offset : offset + NONCE_SIZE]
+        offset += NONCE_SIZE
+        if len(wrapped) != wrapped_length or len(nonce) != NONCE_SIZE:
+            raise ValueError(f"Envelope of {file_name} is truncated")
+
+        key = await self._unwrap(wrapped)
+        header = content[: len(ENVELOPE_MAGIC) + 4 + wrapped_length]
+        return await asyncio.to_thread(AESGCM(key).decrypt, nonce, content[offset:], header)
@@ -0,0 +1,59 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Literal, Optional
+
+from terraflex.plugins.encryption_transformation.encryption_base import EncrypterProtocol
+
+Operation = Literal["encrypt", "decrypt"]
+
+# set in every worker process by the pool initializer
+_worker_provider: Optional[EncrypterProtocol] = None
+_worker_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _initialize_worker(encryption_provider: EncrypterProtocol) -> None:
+    global _worker_provider, _worker_loop
+    _worker_provider = encryption_provider
+    _worker_loop = asyncio.new_event_loop()
+
+
+def _run_in_worker(operation: Operation, file_name: str, content: bytes) -> bytes:
+    if _worker_provider is None or _worker_loop is None:
+        raise RuntimeError("Encryption worker was not initialized")
+
+    match operation:
+        case "encrypt":
+            return _worker_loop.run_until_complete(_worker_provider.encrypt(file_name, content))
+
+        case "decrypt":
+            return _worker_loop.run_until_complete(_worker_provider.decrypt(file_name, content))
+
+
+class EncryptionWorkerPool:
+    """Runs encryption operations of a provider in a pool of worker processes - so they can use every core.
+
+    The provider is sent once to every worker (it must be picklable).
+    At most `max_in_flight` operations are submitted at the same time - the rest wait in the event loop,
+    which keeps the memory held by queued states bounded.
+    """
+
+    def __init__(self, encryption_provider: EncrypterProtocol, workers: int, max_in_flight: Optional[int] = None):
+        self.workers = workers
+        self.max_in_flight = max_in_flight or workers * 2
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            # fork is unsafe in a process that already runs threads (the server does)
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_initialize_worker,
+            initargs=(encryption_provider,),
+        )
+        self._semaphore = asyncio.Semaphore(self.max_in_flight)
+
+    async def run(self, operation: Operation, file_name: str, content: bytes) -> bytes:
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, _run_in_worker, operation, file_name, content)
+
+    async def close(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
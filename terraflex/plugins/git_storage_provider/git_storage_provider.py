@@ -1,3 +1,4 @@
+import asyncio
 import pathlib
 import subprocess
 from contextlib import suppress
@@ -5,6 +6,7 @@ from typing import Any, Optional, Self, override
 
 from pydantic import BaseModel
 from terraflex.server.base_state_lock_provider import LockBody
+from terraflex.server.metrics import GIT_BYTES, GIT_PROCESSES
 from terraflex.server.storage_provider_base import (
     ItemKey,
     LockableStorageProviderProtocol,
@@ -62,6 +64,8 @@ class GitStorageProvider(LockableStorageProviderProtocol):
         self.clone_path = clone_path.expanduser()
         self.origin_url = origin_url
         self.ref = ref
+        # git runs in threads - the operations share the clone, so they run one at a time
+        self._clone_lock = asyncio.Lock()
 
         self._initialize()
 
@@ -106,11 +110,14 @@ class GitStorageProvider(LockableStorageProviderProtocol):
         repo_name = result.origin_url.split("/")[-1].replace(".git", "")
         result.clone_path = result.clone_path or (workdir / "git_storage" / repo_name)
 
-        return cls(
+        # cloning blocks - run it in a thread so other components are initialized meanwhile
+        return await asyncio.to_thread(
+            cls,
             **result.model_dump(),
         )
 
     def _git(self, command: str, *args: str, cwd: Optional[str | pathlib.Path] = None) -> str:
+        GIT_PROCESSES.inc(command)
         proc = subprocess.run(
             ["git", command, *args],
             cwd=cwd or self.clone_path,
@@ -136,10 +143,7 @@ class GitStorageProvider(LockableStorageProviderProtocol):
     def validate_key(cls, key: dict[str, Any]) -> GitStorageProviderItemIdentifier:
         return GitStorageProviderItemIdentifier.model_validate(key)
 
-    @override
-    async def get_file(self, item_identifier: ItemKey) -> bytes:
-        parsed_key = parse_item_key(item_identifier, GitStorageProviderItemIdentifier)
-        file_name = parsed_key.path
+    def _get_file(self, file_name: str) -> bytes:
         self._cleanup_workspace()
         # pull latest changes
         self._git("pull", "origin", self.ref)
@@ -147,20 +151,30 @@ class GitStorageProvider(LockableStorageProviderProtocol):
         # read state
         state_file = self.clone_path / file_name
         try:
-            return state_file.read_bytes()
+            data = state_file.read_bytes()
 
         except FileNotFoundError as exc:
             raise FileNotFoundError(f"File {file_name} not found in the repository") from exc
 
+        GIT_BYTES.inc("read", amount=len(data))
+        return data
+
+    @override
+    async def get_file(self, item_identifier: ItemKey) -> bytes:
+        parsed_key = parse_item_key(item_identifier, GitStorageProviderItemIdentifier)
+        async with self._clone_lock:
+            return await asyncio.to_thread(self._get_file, parsed_key.path)
+
     def commit_and_push_changes(self, message: str, ref: Optional[str] = None) -> None:
         self._git("add", ".")
+        if not self._is_dirty():
+            # nothing changed - git refuses to create an empty commit
+            return
+
         self._git("commit", "-m", message)
         self._git("push", "origin", ref or self.ref)
 
-    @override
-    async def put_file(self, item_identifier: ItemKey, data: bytes) -> None:
-        parsed_key = parse_item_key(item_identifier, GitStorageProviderItemIdentifier)
-        file_name = parsed_key.path
+    def _put_file(self, file_name: str, data: bytes) -> None:
         self._cleanup_workspace()
         # pull latest changes
         self._git("pull", "origin", self.ref)
@@ -169,13 +183,17 @@ class GitStorageProvider(LockableStorageProviderProtocol):
         state_file = self.clone_path / file_name
         state_file.parent.mkdir(parents=True, exist_ok=True)
         state_file.write_bytes(data)
+        GIT_BYTES.inc("write", amount=len(data))
 
         self.commit_and_push_changes(f"Update state - {file_name}")
 
     @override
-    async def delete_file(self, item_identifier: ItemKey) -> None:
+    async def put_file(self, item_identifier: ItemKey, data: bytes) -> None:
         parsed_key = parse_item_key(item_identifier, GitStorageProviderItemIdentifier)
-        file_name = parsed_key.path
+        async with self._clone_lock:
+            await asyncio.to_thread(self._put_file, parsed_key.path, data)
+
+    def _delete_file(self, file_name: str) -> None:
         self._cleanup_workspace()
         # pull latest changes
         self._git("pull", "origin", self.ref)
@@ -187,9 +205,12 @@ class GitStorageProvider(LockableStorageProviderProtocol):
         self.commit_and_push_changes(f"Delete state - {file_name}")
 
     @override
-    async def read_lock(self, item_identifier: ItemKey) -> LockBody:
+    async def delete_file(self, item_identifier: ItemKey) -> None:
         parsed_key = parse_item_key(item_identifier, GitStorageProviderItemIdentifier)
-        file_name = parsed_key.path
+        async with self._clone_lock:
+            await asyncio.to_thread(self._delete_file, parsed_key.path)
+
+    def _read_lock(self, file_name: str) -> LockBody:
         self._cleanup_workspace()
         # delete lock branch if it exists
         with suppress(Exception):
@@ -208,9 +229,12 @@ class GitStorageProvider(LockableStorageProviderProtocol):
         return LockBody.model_validate_json(lock_file.read_bytes())
 
     @override
-    async def acquire_lock(self, item_identifier: ItemKey, data: LockBody) -> None:
+    async def read_lock(self, item_identifier: ItemKey) -> LockBody:
         parsed_key = parse_item_key(item_identifier, GitStorageProviderItemIdentifier)
-        file_name = parsed_key.path
+        async with self._clone_lock:
+            return await asyncio.to_thread(self._read_lock, parsed_key.path)
+
+    def _acquire_lock(self, file_name: str, data: LockBody) -> None:
         self._cleanup_workspace()
         # delete lock branch if it exists
         with suppress(Exception):
@@ -233,8 +257,14 @@ class GitStorageProvider(LockableStorageProviderProtocol):
         with assume_lock_conflict_on_error(lock_id=data.ID):
             self._git("push", "origin", f"locks/{file_name}")
 
+    @override
+    async def acquire_lock(self, item_identifier: ItemKey, data: LockBody) -> None:
+        parsed_key = parse_item_key(item_identifier, GitStorageProviderItemIdentifier)
+        async with self._clone_lock:
+            await asyncio.to_thread(self._acquire_lock, parsed_key.path, data)
+
     @override
     async def release_lock(self, item_identifier: ItemKey) -> None:
         parsed_key = parse_item_key(item_identifier, GitStorageProviderItemIdentifier)
-        file_name = parsed_key.path
-        self._git("push", "origin", "--delete", f"locks/{file_name}")
+        async with self._clone_lock:
+            await asyncio.to_thread(self._git, "push", "origin", "--delete", f"locks/{parsed_key.path}")
@@ -6,6 +6,7 @@ from terraflex.server.base_state_lock_provider import LockBody
 from terraflex.server.storage_provider_base import (
     ItemKey,
     LockableStorageProviderProtocol,
+    VersionedStorageProviderProtocol,
     parse_item_key,
 )
 from terraflex.utils.dependency_manager import DependenciesManager
@@ -40,7 +41,7 @@ class LocalStorageProviderInitConfig(BaseModel):
     file_mode: int = 0o600
 
 
-class LocalStorageProvider(LockableStorageProviderProtocol):
+class LocalStorageProvider(LockableStorageProviderProtocol, VersionedStorageProviderProtocol):
     def __init__(self, folder: pathlib.Path, folder_mode: int, file_mode: int) -> None:
         self.folder = folder.expanduser()
         self.folder_mode = folder_mode
@@ -81,6 +82,18 @@ class LocalStorageProvider(LockableStorageProviderProtocol):
         except FileNotFoundError as exc:
             raise FileNotFoundError(f"File {state_file} not found") from exc
 
+    @override
+    async def get_file_version(self, item_identifier: ItemKey) -> str:
+        parsed_key = parse_item_key(item_identifier, LocalStorageProviderItemIdentifier)
+        state_file = self.folder / parsed_key.path
+        try:
+            stat = state_file.stat()
+
+        except FileNotFoundError as exc:
+            raise FileNotFoundError(f"File {state_file} not found") from exc
+
+        return f"{stat.st_ino}-{stat.st_mtime_ns}-{stat.st_size}"
+
     @override
     async def put_file(self, item_identifier: ItemKey, data: bytes) -> None:
         parsed_key = parse_item_key(item_identifier, LocalStorageProviderItemIdentifier)
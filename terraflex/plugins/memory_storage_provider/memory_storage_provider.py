@@ -0,0 +1,170 @@
+import base64
+import itertools
+import json
+import os
+import pathlib
+import threading
+import uuid
+from typing import Any, Optional, Self, override
+
+from pydantic import BaseModel
+from terraflex.server.base_state_lock_provider import LockBody, LockingError
+from terraflex.server.storage_provider_base import (
+    ItemKey,
+    LockableStorageProviderProtocol,
+    VersionedStorageProviderProtocol,
+    parse_item_key,
+)
+from terraflex.utils.dependency_manager import DependenciesManager
+
+
+class MemoryStorageProviderItemIdentifier(ItemKey):
+    """Params required to reference an item in Memory storage provider.
+
+    Attributes:
+        path: The logical path of the item.
+    """
+
+    path: str
+
+    @override
+    def as_string(self) -> str:
+        return self.path
+
+
+class MemoryStorageProviderInitConfig(BaseModel):
+    """Initialization params required to initialize Memory storage provider.
+
+    Attributes:
+        snapshot_path: Optional path to a snapshot file - the content is restored from it on start
+            and written back to it on shutdown. Default: None. (nothing is persisted)
+    """
+
+    snapshot_path: Optional[pathlib.Path] = None
+
+
+class MemoryStorageProvider(LockableStorageProviderProtocol, VersionedStorageProviderProtocol):
+    """Keeps items and locks in memory - nothing touches the disk unless a snapshot path is configured."""
+
+    def __init__(self, snapshot_path: Optional[pathlib.Path] = None) -> None:
+        self.snapshot_path = snapshot_path.expanduser() if snapshot_path is not None else None
+
+        self._files: dict[str, bytes] = {}
+        self._locks: dict[str, LockBody] = {}
+        self._versions: dict[str, str] = {}
+        # versions are unique across restarts - a restored item never reuses a version seen by a client
+        self._generation = uuid.uuid4().hex
+        self._counter = itertools.count(1)
+        # guards compare-and-set on locks - the provider may be used from worker threads as well
+        self._lock = threading.Lock()
+
+        if self.snapshot_path is not None and self.snapshot_path.exists():
+            self._restore(self.snapshot_path)
+
+    @override
+    @classmethod
+    async def from_config(
+        cls,
+        raw_config: Any,
+        *,
+        manager: DependenciesManager,
+        workdir: pathlib.Path,
+    ) -> Self:
+        result = MemoryStorageProviderInitConfig.model_validate(raw_config)
+        return cls(
+            **result.model_dump(),
+        )
+
+    @override
+    @classmethod
+    def validate_key(cls, key: dict[str, Any]) -> MemoryStorageProviderItemIdentifier:
+        return MemoryStorageProviderItemIdentifier.model_validate(key)
+
+    def _restore(self, snapshot_path: pathlib.Path) -> None:
+        snapshot = json.loads(snapshot_path.read_bytes())
+        self._files = {path: base64.b64decode(content) for path, content in snapshot.get("files", {}).items()}
+        self._versions = {path: self._next_version() for path in self._files}
+        self._locks = {path: LockBody.model_validate(lock) for path, lock in snapshot.get("locks", {}).items()}
+
+    def snapshot(self, snapshot_path: pathlib.Path) -> None:
+        with self._lock:
+            snapshot = {
+                "files": {path: base64.b64encode(content).decode() for path, content in self._files.items()},
+                "locks": {path: lock.model_dump() for path, lock in self._locks.items()},
+            }
+
+        snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = snapshot_path.with_name(f".{snapshot_path.name}.tmp")
+        # the snapshot may hold state files - keep it private to the current user
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(json.dumps(snapshot).encode())
+
+        temp_path.replace(snapshot_path)
+
+    def _next_version(self) -> str:
+        return f"{self._generation}-{next(self._counter)}"
+
+    async def close(self) -> None:
+        if self.snapshot_path is not None:
+            self.snapshot(self.snapshot_path)
+
+    @override
+    async def get_file(self, item_identifier: ItemKey) -> bytes:
+        parsed_key = parse_item_key(item_identifier, MemoryStorageProviderItemIdentifier)
+        try:
+            return self._files[parsed_key.path]
+
+        except KeyError as exc:
+            raise FileNotFoundError(f"File {parsed_key.path} not found") from exc
+
+    @override
+    async def put_file(self, item_identifier: ItemKey, data: bytes) -> None:
+        parsed_key = parse_item_key(item_identifier, MemoryStorageProviderItemIdentifier)
+        with self._lock:
+            self._files[parsed_key.path] = data
+            self._versions[parsed_key.path] = self._next_version()
+
+    @override
+    async def delete_file(self, item_identifier: ItemKey) -> None:
+        parsed_key = parse_item_key(item_identifier, MemoryStorageProviderItemIdentifier)
+        with self._lock:
+            self._versions.pop(parsed_key.path, None)
+            if self._files.pop(parsed_key.path, None) is None:
+                raise FileNotFoundError(f"File {parsed_key.path} not found")
+
+    @override
+    async def get_file_version(self, item_identifier: ItemKey) -> str:
+        parsed_key = parse_item_key(item_identifier, MemoryStorageProviderItemIdentifier)
+        try:
+            return self._versions[parsed_key.path]
+
+        except KeyError as exc:
+            raise FileNotFoundError(f"File {parsed_key.path} not found") from exc
+
+    @override
+    async def read_lock(self, item_identifier: ItemKey) -> LockBody:
+        parsed_key = parse_item_key(item_identifier, MemoryStorageProviderItemIdentifier)
+        try:
+            return self._locks[parsed_key.path]
+
+        except KeyError as exc:
+            raise FileNotFoundError(f"Lock for {parsed_key.path} not found") from exc
+
+    @override
+    async def acquire_lock(self, item_identifier: ItemKey, data: LockBody) -> None:
+        parsed_key = parse_item_key(item_identifier, MemoryStorageProviderItemIdentifier)
+        with self._lock:
+            existing_lock = self._locks.setdefault(parsed_key.path, data)
+
+        if existing_lock is not data:
+            raise LockingError(
+                "Failed to lock state - someone else has already locked it",
+                lock_id=existing_lock.ID,
+            )
+
+    @override
+    async def release_lock(self, item_identifier: ItemKey) -> None:
+        parsed_key = parse_item_key(item_identifier, MemoryStorageProviderItemIdentifier)
+        with self._lock:
+            self._locks.pop(parsed_key.path, None)
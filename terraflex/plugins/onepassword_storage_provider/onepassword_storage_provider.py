@@ -1,3 +1,4 @@
+import asyncio
 import pathlib
 import subprocess
 from typing import Any, Self, override
@@ -43,7 +44,7 @@ class OnePasswordStorageProvider(StorageProviderProtocol):
         workdir: pathlib.Path,
     ) -> Self:
         result = OnePasswordStorageProviderInitConfig.model_validate(raw_config)
-        cls._validate_binary()
+        await asyncio.to_thread(cls._validate_binary)
         return cls(
             **result.model_dump(),
         )
@@ -0,0 +1,469 @@
+import asyncio
+import datetime
+import hashlib
+import hmac
+import os
+import pathlib
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from typing import Any, Generator, Literal, Optional, Self, override
+from urllib.parse import quote
+
+import httpx
+
+from pydantic import BaseModel
+from terraflex.server.base_state_lock_provider import LockBody, LockingError
+from terraflex.server.metrics import cache_lookup
+from terraflex.server.storage_provider_base import (
+    ItemKey,
+    LockableStorageProviderProtocol,
+    VersionedStorageProviderProtocol,
+    parse_item_key,
+)
+from terraflex.utils.dependency_manager import DependenciesManager
+
+S3_XML_NAMESPACE = "{http://s3.amazonaws.com/doc/2006-03-01/}"
+
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class S3StorageProviderItemIdentifier(ItemKey):
+    """Params required to reference an item in S3 storage provider.
+
+    Attributes:
+        path: The key of the object relative to the configured prefix,
+            folders are also allowed as part of the path.
+    """
+
+    path: str
+
+    @override
+    def as_string(self) -> str:
+        return self.path
+
+
+class S3StorageProviderInitConfig(BaseModel):
+    """Initialization params required to initialize S3 storage provider.
+
+    Works with AWS S3 and any S3-compatible object storage (MinIO, Ceph, R2, etc.).
+
+    Attributes:
+        bucket: The name of the bucket.
+        endpoint_url: The URL of the S3 endpoint. Default: https://s3.<region>.amazonaws.com
+        region: The region of the bucket - used for request signing. Default: us-east-1.
+        prefix: Prefix prepended to every object key. Default: "".
+        addressing_style: `path` (`<endpoint>/<bucket>/<key>`) or `virtual` (`<bucket>.<endpoint>/<key>`). Default: path.
+        access_key_id: The access key id. Default: the `AWS_ACCESS_KEY_ID` environment variable.
+        secret_access_key: The secret access key. Default: the `AWS_SECRET_ACCESS_KEY` environment variable.
+        session_token: Optional session token. Default: the `AWS_SESSION_TOKEN` environment variable.
+        max_connections: The maximum number of connections kept in the shared connection pool. Default: 10.
+        multipart_threshold: Objects larger than this (in bytes) are uploaded using multipart upload. Default: 16MiB.
+        multipart_part_size: The size of every uploaded part (in bytes) - minimum 5MiB. Default: 8MiB.
+        timeout: Timeout in seconds for every request. Default: 30.
+        read_cache_size: The maximum total size (in bytes) of the objects kept in memory for conditional reads -
+            the least recently used are evicted first, 0 disables the cache. Default: 64MiB.
+    """
+
+    bucket: str
+    endpoint_url: Optional[str] = None
+    region: str = "us-east-1"
+    prefix: str = ""
+    addressing_style: Literal["path", "virtual"] = "path"
+    access_key_id: Optional[str] = None
+    secret_access_key: Optional[str] = None
+    session_token: Optional[str] = None
+    max_connections: int = 10
+    multipart_threshold: int = 16 * 1024 * 1024
+    multipart_part_size: int = 8 * 1024 * 1024
+    timeout: float = 30.0
+    read_cache_size: int = 64 * 1024 * 1024
+
+
+class _ReadCache:
+    """The last version seen of every object - `(etag, content)` by object key, bounded by the total content size."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.size = 0
+        # least recently used first
+        self._entries: OrderedDict[str, tuple[str, bytes]] = OrderedDict()
+
+    def get(self, object_key: str) -> Optional[tuple[str, bytes]]:
+        entry = self._entries.get(object_key)
+        if entry is not None:
+            self._entries.move_to_end(object_key)
+
+        return entry
+
+    def set(self, object_key: str, etag: str, content: bytes) -> None:
+        self.pop(object_key)
+        if len(content) > self.max_size:
+            return
+
+        self._entries[object_key] = (etag, content)
+        self.size += len(content)
+        while self.size > self.max_size:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def pop(self, object_key: str) -> None:
+        entry = self._entries.pop(object_key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+
+def _sha256_hex(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def _hmac_sha256(key: bytes, message: str) -> bytes:
+    return hmac.new(key, message.encode(), hashlib.sha256).digest()
+
+
+class SigV4Auth(httpx.Auth):
+    """Signs requests using AWS Signature Version 4."""
+
+    requires_request_body = True
+
+    def __init__(
+        self,
+        access_key_id: str,
+        secret_access_key: str,
+        region: str,
+        session_token: Optional[str] = None,
+        service: str = "s3",
+    ) -> None:
+        self.access_key_id = access_key_id
+        self.secret_access_key = secret_access_key
+        self.region = region
+        self.session_token = session_token
+        self.service = service
+
+    def _signing_key(self, date: str) -> bytes:
+        key = _hmac_sha256(f"AWS4{self.secret_access_key}".encode(), date)
+        key = _hmac_sha256(key, self.region)
+        key = _hmac_sha256(key, self.service)
+        return _hmac_sha256(key, "aws4_request")
+
+    def sign(self, request: httpx.Request, now: Optional[datetime.datetime] = None) -> None:
+        now = now or datetime.datetime.now(datetime.UTC)
+        amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+        date = now.strftime("%Y%m%d")
+        payload_hash = _sha256_hex(request.content)
+
+        request.headers["x-amz-date"] = amz_date
+        request.headers["x-amz-content-sha256"] = payload_hash
+        if self.session_token:
+            request.headers["x-amz-security-token"] = self.session_token
+
+        signed_headers = sorted(
+            name for name in request.headers if name in ("host", "content-type") or name.startswith("x-amz-")
+        )
+        canonical_headers = "".join(f"{name}:{request.headers[name].strip()}\n" for name in signed_headers)
+        canonical_query = "&".join(
+            f"{quote(key, safe='-_.~')}={quote(value, safe='-_.~')}"
+            for key, value in sorted(request.url.params.multi_items())
+        )
+        canonical_request = "\n".join(
+            [
+                request.method,
+                quote(request.url.path, safe="/-_.~"),
+                canonical_query,
+                canonical_headers,
+                ";".join(signed_headers),
+                payload_hash,
+            ]
+        )
+
+        scope = f"{date}/{self.region}/{self.service}/aws4_request"
+        string_to_sign = "\n".join(["AWS4-HMAC-SHA256", amz_date, scope, _sha256_hex(canonical_request.encode())])
+        signature = hmac.new(self._signing_key(date), string_to_sign.encode(), hashlib.sha256).hexdigest()
+        request.headers["authorization"] = (
+            f"AWS4-HMAC-SHA256 Credential={self.access_key_id}/{scope}, "
+            f"SignedHeaders={';'.join(signed_headers)}, Signature={signature}"
+        )
+
+    @override
+    def auth_flow(self, request: httpx.Request) -> Generator[httpx.Request, httpx.Response, None]:
+        self.sign(request)
+        yield request
+
+
+class S3StorageProvider(LockableStorageProviderProtocol, VersionedStorageProviderProtocol):
+    """Stores items as objects in an S3-compatible bucket.
+
+    All requests share a single keep-alive connection pool.
+    Locks are taken using conditional writes (`If-None-Match: *`) - so only one writer can create the lock object.
+    Reads are conditional as well - an object that didn't change since the last read is never downloaded again.
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        endpoint_url: str,
+        region: str = "us-east-1",
+        prefix: str = "",
+        addressing_style: Literal["path", "virtual"] = "path",
+        access_key_id: Optional[str] = None,
+        secret_access_key: Optional[str] = None,
+        session_token: Optional[str] = None,
+        max_connections: int = 10,
+        multipart_threshold: int = 16 * 1024 * 1024,
+        multipart_part_size: int = 8 * 1024 * 1024,
+        timeout: float = 30.0,
+        read_cache_size: int = 64 * 1024 * 1024,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        if multipart_part_size < MIN_PART_SIZE:
+            raise ValueError(f"multipart_part_size must be at least {MIN_PART_SIZE} bytes")
+
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.multipart_threshold = multipart_threshold
+        self.multipart_part_size = multipart_part_size
+        self.max_connections = max_connections
+
+        endpoint = httpx.URL(endpoint_url)
+        if addressing_style == "virtual":
+            self.base_url = endpoint.copy_with(host=f"{bucket}.{endpoint.host}")
+            self.bucket_path = ""
+        else:
+            self.base_url = endpoint
+            self.bucket_path = f"/{bucket}"
+
+        auth: Optional[httpx.Auth] = None
+        if access_key_id and secret_access_key:
+            auth = SigV4Auth(
+                access_key_id=access_key_id,
+                secret_access_key=secret_access_key,
+                region=region,
+                session_token=session_token,
+            )
+
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            auth=auth,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            transport=transport,
+        )
+        self._read_cache = _ReadCache(read_cache_size)
+
+    @override
+    @classmethod
+    async def from_config(
+        cls,
+        raw_config: Any,
+        *,
+        manager: DependenciesManager,
+        workdir: pathlib.Path,
+    ) -> Self:
+        result = S3StorageProviderInitConfig.model_validate(raw_config)
+        result.endpoint_url = result.endpoint_url or f"https://s3.{result.region}.amazonaws.com"
+        result.access_key_id = result.access_key_id or os.environ.get("AWS_ACCESS_KEY_ID")
+        result.secret_access_key = result.secret_access_key or os.environ.get("AWS_SECRET_ACCESS_KEY")
+        result.session_token = result.session_token or os.environ.get("AWS_SESSION_TOKEN")
+
+        return cls(
+            **result.model_dump(),
+        )
+
+    @override
+    @classmethod
+    def validate_key(cls, key: dict[str, Any]) -> S3StorageProviderItemIdentifier:
+        return S3StorageProviderItemIdentifier.model_validate(key)
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+    def _object_key(self, path: str) -> str:
+        path = path.lstrip("/")
+        return f"{self.prefix}/{path}" if self.prefix else path
+
+    def _lock_key(self, path: str) -> str:
+        return self._object_key(f"locks/{path.lstrip('/')}.lock")
+
+    def _object_url(self, object_key: str) -> str:
+        return f"{self.bucket_path}/{quote(object_key, safe='/-_.~')}"
+
+    async def _request(
+        self,
+        method: str,
+        object_key: str,
+        *,
+        params: Optional[dict[str, str]] = None,
+        headers: Optional[dict[str, str]] = None,
+        content: Optional[bytes] = None,
+    ) -> httpx.Response:
+        return await self.client.request(
+            method,
+            self._object_url(object_key),
+            params=params,
+            headers=headers,
+            content=content,
+        )
+
+    @staticmethod
+    def _raise_for_status(response: httpx.Response, object_key: str) -> None:
+        if response.status_code == 404:
+            raise FileNotFoundError(f"Object {object_key} not found")
+
+        if response.is_error:
+            raise RuntimeError(f"S3 request failed for {object_key}: {response.status_code} - {response.text}")
+
+    async def _get_object(self, object_key: str) -> bytes:
+        headers: dict[str, str] = {}
+        cached = self._read_cache.get(object_key)
+        if cached is not None:
+            headers["If-None-Match"] = cached[0]
+
+        response = await self._request("GET", object_key, headers=headers)
+        cache_lookup("s3_objects", hit=response.status_code == 304 and cached is not None)
+        if response.status_code == 304 and cached is not None:
+            return cached[1]
+
+        if response.status_code == 404:
+            self._read_cache.pop(object_key)
+
+        self._raise_for_status(response, object_key)
+        etag = response.headers.get("ETag")
+        if etag:
+            self._read_cache.set(object_key, etag, response.content)
+
+        return response.content
+
+    async def _put_object(self, object_key: str, data: bytes) -> None:
+        if len(data) > self.multipart_threshold:
+            etag = await self._multipart_upload(object_key, data)
+
+        else:
+            response = await self._request("PUT", object_key, content=data)
+            self._raise_for_status(response, object_key)
+            etag = response.headers.get("ETag")
+
+        if etag:
+            self._read_cache.set(object_key, etag, data)
+
+        else:
+            self._read_cache.pop(object_key)
+
+    async def _multipart_upload(self, object_key: str, data: bytes) -> Optional[str]:
+        response = await self._request("POST", object_key, params={"uploads": ""})
+        self._raise_for_status(response, object_key)
+        upload_id = ET.fromstring(response.content).findtext(f"{S3_XML_NAMESPACE}UploadId")
+        if upload_id is None:
+            raise RuntimeError(f"S3 did not return an upload id for {object_key}")
+
+        semaphore = asyncio.Semaphore(self.max_connections)
+
+        async def upload_part(part_number: int, offset: int) -> str:
+            async with semaphore:
+                part_response = await self._request(
+                    "PUT",
+                    object_key,
+                    params={"partNumber": str(part_number), "uploadId": upload_id},
+                    content=data[offset : offset + self.multipart_part_size],
+                )
+
+            self._raise_for_status(part_response, object_key)
+            return part_response.headers["ETag"]
+
+        try:
+            part_etags = await asyncio.gather(
+                *(
+                    upload_part(part_number, offset)
+                    for part_number, offset in enumerate(range(0, len(data), self.multipart_part_size), start=1)
+                )
+            )
+
+            parts = "".join(
+                f"<Part><PartNumber>{part_number}</PartNumber><ETag>{etag}</ETag></Part>"
+                for part_number, etag in enumerate(part_etags, start=1)
+            )
+            response = await self._request(
+                "POST",
+                object_key,
+                params={"uploadId": upload_id},
+                content=f"<CompleteMultipartUpload>{parts}</CompleteMultipartUpload>".encode(),
+            )
+            self._raise_for_status(response, object_key)
+            # S3 may report a failure with a 200 status code - the body holds the actual result
+            result = ET.fromstring(response.content)
+            if result.tag == "Error":
+                raise RuntimeError(f"S3 multipart upload failed for {object_key}: {response.text}")
+
+        except Exception:
+            await self._request("DELETE", object_key, params={"uploadId": upload_id})
+            raise
+
+        return result.findtext(f"{S3_XML_NAMESPACE}ETag")
+
+    @override
+    async def get_file(self, item_identifier: ItemKey) -> bytes:
+        parsed_key = parse_item_key(item_identifier, S3StorageProviderItemIdentifier)
+        return await self._get_object(self._object_key(parsed_key.path))
+
+    @override
+    async def get_file_version(self, item_identifier: ItemKey) -> str:
+        parsed_key = parse_item_key(item_identifier, S3StorageProviderItemIdentifier)
+        object_key = self._object_key(parsed_key.path)
+        response = await self._request("HEAD", object_key)
+        self._raise_for_status(response, object_key)
+        etag = response.headers.get("ETag")
+        if etag is None:
+            raise RuntimeError(f"S3 did not return an ETag for {object_key}")
+
+        return etag.strip('"')
+
+    @override
+    async def put_file(self, item_identifier: ItemKey, data: bytes) -> None:
+        parsed_key = parse_item_key(item_identifier, S3StorageProviderItemIdentifier)
+        await self._put_object(self._object_key(parsed_key.path), data)
+
+    @override
+    async def delete_file(self, item_identifier: ItemKey) -> None:
+        parsed_key = parse_item_key(item_identifier, S3StorageProviderItemIdentifier)
+        object_key = self._object_key(parsed_key.path)
+        response = await self._request("DELETE", object_key)
+        self._read_cache.pop(object_key)
+        self._raise_for_status(response, object_key)
+
+    @override
+    async def read_lock(self, item_identifier: ItemKey) -> LockBody:
+        parsed_key = parse_item_key(item_identifier, S3StorageProviderItemIdentifier)
+        lock_key = self._lock_key(parsed_key.path)
+        response = await self._request("GET", lock_key)
+        self._raise_for_status(response, lock_key)
+        return LockBody.model_validate_json(response.content)
+
+    @override
+    async def acquire_lock(self, item_identifier: ItemKey, data: LockBody) -> None:
+        parsed_key = parse_item_key(item_identifier, S3StorageProviderItemIdentifier)
+        lock_key = self._lock_key(parsed_key.path)
+        response = await self._request(
+            "PUT",
+            lock_key,
+            headers={"If-None-Match": "*"},
+            content=data.model_dump_json().encode(),
+        )
+        # 412 - the lock object already exists, 409 - a concurrent conditional write won the race
+        if response.status_code in (409, 412):
+            try:
+                existing_lock_id = (await self.read_lock(item_identifier)).ID
+
+            except FileNotFoundError:
+                existing_lock_id = data.ID
+
+            raise LockingError(
+                "Failed to lock state - someone else has already locked it",
+                lock_id=existing_lock_id,
+            )
+
+        self._raise_for_status(response, lock_key)
+
+    @override
+    async def release_lock(self, item_identifier: ItemKey) -> None:
+        parsed_key = parse_item_key(item_identifier, S3StorageProviderItemIdentifier)
+        lock_key = self._lock_key(parsed_key.path)
+        response = await self._request("DELETE", lock_key)
+        self._raise_for_status(response, lock_key)
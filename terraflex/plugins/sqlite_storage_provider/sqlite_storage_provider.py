@@ -0,0 +1,340 @@
+import asyncio
+import pathlib
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional, Self, override
+
+from pydantic import BaseModel
+from terraflex.server.base_state_lock_provider import LockBody, LockingError
+from terraflex.server.storage_provider_base import (
+    ItemKey,
+    LockableStorageProviderProtocol,
+    VersionedStorageProviderProtocol,
+    parse_item_key,
+)
+from terraflex.utils.dependency_manager import DependenciesManager
+
+SCHEMA = """\
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    data BLOB NOT NULL,
+    version INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS file_versions (
+    path TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (path, version)
+);
+CREATE TABLE IF NOT EXISTS locks (
+    path TEXT PRIMARY KEY,
+    lock TEXT NOT NULL
+);
+"""
+
+
+class SQLiteStorageProviderItemIdentifier(ItemKey):
+    """Params required to reference an item in SQLite storage provider.
+
+    Attributes:
+        path: The logical path of the item inside the database - used as the primary key.
+    """
+
+    path: str
+
+    @override
+    def as_string(self) -> str:
+        return self.path
+
+
+class SQLiteStorageProviderInitConfig(BaseModel):
+    """Initialization params required to initialize SQLite storage provider.
+
+    Attributes:
+        database: The path to the database file. Default: None. (will be set to ~/.local/share/terraflex/sqlite_storage/terraflex.db)
+        pool_size: The maximum number of connections kept open to the database. Default: 4.
+        keep_versions: The number of previous versions to keep for every item - 0 disables history. Default: 0.
+        busy_timeout: Seconds to wait for a database lock held by another process before failing. Default: 5.
+    """
+
+    database: Optional[pathlib.Path] = None
+    pool_size: int = 4
+    keep_versions: int = 0
+    busy_timeout: float = 5.0
+
+
+class ConnectionPool:
+    """A small thread-safe pool of sqlite connections.
+
+    Connections are created lazily up to `size` - callers block until a connection is free.
+    """
+
+    def __init__(self, database: pathlib.Path, size: int, busy_timeout: float) -> None:
+        self.database = database
+        self.size = size
+        self.busy_timeout = busy_timeout
+
+        self._idle: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        # autocommit mode - transactions are managed explicitly with BEGIN IMMEDIATE
+        connection = sqlite3.connect(
+            self.database,
+            timeout=self.busy_timeout,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(f"PRAGMA busy_timeout={int(self.busy_timeout * 1000)}")
+        return connection
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        try:
+            connection = self._idle.get_nowait()
+
+        except queue.Empty:
+            with self._lock:
+                should_create = self._created < self.size
+                if should_create:
+                    self._created += 1
+
+            if should_create:
+                try:
+                    connection = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+
+            else:
+                connection = self._idle.get()
+
+        try:
+            yield connection
+
+        finally:
+            self._idle.put(connection)
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run the block inside a write transaction - the database write lock is taken upfront."""
+        with self.connection() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+            connection.execute("COMMIT")
+
+    def close(self) -> None:
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+
+            except queue.Empty:
+                break
+
+            connection.close()
+
+
+class SQLiteStorageProvider(LockableStorageProviderProtocol, VersionedStorageProviderProtocol):
+    """Stores items and locks in a single SQLite database.
+
+    Every blocking database call runs in a worker thread - so the event loop is never blocked.
+    The database uses WAL mode, which allows multiple server processes to share the same database file safely.
+    """
+
+    def __init__(
+        self,
+        database: pathlib.Path,
+        pool_size: int = 4,
+        keep_versions: int = 0,
+        busy_timeout: float = 5.0,
+    ) -> None:
+        self.database = database.expanduser()
+        self.keep_versions = keep_versions
+
+        self.database.parent.mkdir(parents=True, exist_ok=True)
+        self.pool = ConnectionPool(self.database, size=pool_size, busy_timeout=busy_timeout)
+        with self.pool.connection() as connection:
+            connection.executescript(SCHEMA)
+
+    @override
+    @classmethod
+    async def from_config(
+        cls,
+        raw_config: Any,
+        *,
+        manager: DependenciesManager,
+        workdir: pathlib.Path,
+    ) -> Self:
+        result = SQLiteStorageProviderInitConfig.model_validate(raw_config)
+        result.database = result.database or (workdir / "sqlite_storage" / "terraflex.db")
+
+        return await asyncio.to_thread(
+            cls,
+            **result.model_dump(),
+        )
+
+    @override
+    @classmethod
+    def validate_key(cls, key: dict[str, Any]) -> SQLiteStorageProviderItemIdentifier:
+        return SQLiteStorageProviderItemIdentifier.model_validate(key)
+
+    async def close(self) -> None:
+        self.pool.close()
+
+    def _get_file(self, path: str) -> bytes:
+        with self.pool.connection() as connection:
+            row = connection.execute("SELECT data FROM files WHERE path = ?", (path,)).fetchone()
+
+        if row is None:
+            raise FileNotFoundError(f"File {path} not found in {self.database}")
+
+        return row[0]
+
+    def _get_file_version(self, path: str) -> str:
+        with self.pool.connection() as connection:
+            row = connection.execute("SELECT version, updated_at FROM files WHERE path = ?", (path,)).fetchone()
+
+        if row is None:
+            raise FileNotFoundError(f"File {path} not found in {self.database}")
+
+        # the version restarts from 1 when an item is deleted and written again - the timestamp tells them apart
+        return f"{row[0]}-{row[1]!r}"
+
+    def _put_file(self, path: str, data: bytes) -> None:
+        now = time.time()
+        with self.pool.transaction() as connection:
+            if self.keep_versions > 0:
+                connection.execute(
+                    "INSERT OR REPLACE INTO file_versions (path, version, data, updated_at) "
+                    "SELECT path, version, data, updated_at FROM files WHERE path = ?",
+                    (path,),
+                )
+                connection.execute(
+                    "DELETE FROM file_versions WHERE path = ? AND version NOT IN "
+                    "(SELECT version FROM file_versions WHERE path = ? ORDER BY version DESC LIMIT ?)",
+                    (path, path, self.keep_versions),
+                )
+
+            connection.execute(
+                "INSERT INTO files (path, data, version, updated_at) VALUES (?, ?, 1, ?) "
+                "ON CONFLICT (path) DO UPDATE SET data = excluded.data, version = files.version + 1, "
+                "updated_at = excluded.updated_at",
+                (path, data, now),
+            )
+
+    def _delete_file(self, path: str) -> None:
+        with self.pool.transaction() as connection:
+            cursor = connection.execute("DELETE FROM files WHERE path = ?", (path,))
+            if cursor.rowcount == 0:
+                raise FileNotFoundError(f"File {path} not found in {self.database}")
+
+    def _read_lock(self, path: str) -> LockBody:
+        with self.pool.connection() as connection:
+            row = connection.execute("SELECT lock FROM locks WHERE path = ?", (path,)).fetchone()
+
+        if row is None:
+            raise FileNotFoundError(f"Lock for {path} not found in {self.database}")
+
+        return LockBody.model_validate_json(row[0])
+
+    def _acquire_lock(self, path: str, data: LockBody) -> None:
+        # checking and writing the lock happen in the same write transaction -
+        # no other connection (or process) can take the lock in between.
+        with self.pool.transaction() as connection:
+            row = connection.execute("SELECT lock FROM locks WHERE path = ?", (path,)).fetchone()
+            if row is not None:
+                existing_lock = LockBody.model_validate_json(row[0])
+                raise LockingError(
+                    "Failed to lock state - someone else has already locked it",
+                    lock_id=existing_lock.ID,
+                )
+
+            connection.execute(
+                "INSERT INTO locks (path, lock) VALUES (?, ?)",
+                (path, data.model_dump_json()),
+            )
+
+    def _release_lock(self, path: str) -> None:
+        with self.pool.transaction() as connection:
+            connection.execute("DELETE FROM locks WHERE path = ?", (path,))
+
+    def _get_versions(self, path: str) -> list[int]:
+        with self.pool.connection() as connection:
+            rows = connection.execute(
+                "SELECT version FROM file_versions WHERE path = ? ORDER BY version DESC",
+                (path,),
+            ).fetchall()
+
+        return [row[0] for row in rows]
+
+    def _get_file_at_version(self, path: str, version: int) -> bytes:
+        with self.pool.connection() as connection:
+            row = connection.execute(
+                "SELECT data FROM file_versions WHERE path = ? AND version = ?",
+                (path, version),
+            ).fetchone()
+
+        if row is None:
+            raise FileNotFoundError(f"Version {version} of {path} not found in {self.database}")
+
+        return row[0]
+
+    @override
+    async def get_file(self, item_identifier: ItemKey) -> bytes:
+        parsed_key = parse_item_key(item_identifier, SQLiteStorageProviderItemIdentifier)
+        return await asyncio.to_thread(self._get_file, parsed_key.path)
+
+    @override
+    async def get_file_version(self, item_identifier: ItemKey) -> str:
+        parsed_key = parse_item_key(item_identifier, SQLiteStorageProviderItemIdentifier)
+        return await asyncio.to_thread(self._get_file_version, parsed_key.path)
+
+    @override
+    async def put_file(self, item_identifier: ItemKey, data: bytes) -> None:
+        parsed_key = parse_item_key(item_identifier, SQLiteStorageProviderItemIdentifier)
+        await asyncio.to_thread(self._put_file, parsed_key.path, data)
+
+    @override
+    async def delete_file(self, item_identifier: ItemKey) -> None:
+        parsed_key = parse_item_key(item_identifier, SQLiteStorageProviderItemIdentifier)
+        await asyncio.to_thread(self._delete_file, parsed_key.path)
+
+    @override
+    async def read_lock(self, item_identifier: ItemKey) -> LockBody:
+        parsed_key = parse_item_key(item_identifier, SQLiteStorageProviderItemIdentifier)
+        return await asyncio.to_thread(self._read_lock, parsed_key.path)
+
+    @override
+    async def acquire_lock(self, item_identifier: ItemKey, data: LockBody) -> None:
+        parsed_key = parse_item_key(item_identifier, SQLiteStorageProviderItemIdentifier)
+        await asyncio.to_thread(self._acquire_lock, parsed_key.path, data)
+
+    @override
+    async def release_lock(self, item_identifier: ItemKey) -> None:
+        parsed_key = parse_item_key(item_identifier, SQLiteStorageProviderItemIdentifier)
+        await asyncio.to_thread(self._release_lock, parsed_key.path)
+
+    async def get_previous_versions(self, item_identifier: ItemKey) -> list[int]:
+        """List the versions kept in history for the item - newest first."""
+        parsed_key = parse_item_key(item_identifier, SQLiteStorageProviderItemIdentifier)
+        return await asyncio.to_thread(self._get_versions, parsed_key.path)
+
+    async def get_file_at_version(self, item_identifier: ItemKey, version: int) -> bytes:
+        """Get the content of a previous version of the item."""
+        parsed_key = parse_item_key(item_identifier, SQLiteStorageProviderItemIdentifier)
+        return await asyncio.to_thread(self._get_file_at_version, parsed_key.path, version)
@@ -1,190 +1,241 @@
-from contextlib import asynccontextmanager
+import asyncio
+import json
+from contextlib import asynccontextmanager, suppress
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Annotated, Any, AsyncIterator, Literal, Optional, TypedDict
+from typing import Annotated, AsyncIterator, Literal, Optional, TypedDict
 
 import uvicorn
 import yaml
-from fastapi import Body, Depends, FastAPI, HTTPException, Query, Request, status
+from fastapi import APIRouter, Depends, FastAPI, Header, HTTPException, Query, Request, Response, status
 from fastapi import Path as PathDep
 from fastapi.encoders import jsonable_encoder
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 
 from terraflex.server.base_state_lock_provider import (
     Data,
     LockBody,
     LockingError,
+    StaleStateError,
     StateLockProviderProtocol,
 )
-from terraflex.server.config import ConfigFile, Settings
-from terraflex.server.storage_provider_base import (
-    STORATE_PROVIDERS_ENTRYPOINT,
-    StorageProviderProtocol,
-    WriteableStorageProviderProtocol,
-)
-from terraflex.server.tf_state_lock_controller import (
-    TFStack,
-    TFStateLockController,
-)
-from terraflex.server.transformation_base import (
-    TRANSFORMERS_ENTRYPOINT,
-    TransformerProtocol,
+from terraflex.server.components import ComponentsBuilder, SharedComponents
+from terraflex.server.compression import (
+    CompressedResponseCache,
+    content_digest,
+    decode_body,
+    negotiate_encoding,
+    stream_encode,
 )
+from terraflex.server.config import CONFIG_FILE_NAME, ConfigFile, get_settings
+from terraflex.server.etag import content_etag, encoded_etag, etag_matches, version_etag
+from terraflex.server.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from terraflex.server.metrics import REGISTRY, stage, timed_operation
+from terraflex.server.reload import ConfigReloader, InFlightRequests, unchanged_components
+from terraflex.server.storage_provider_base import StorageProviderProtocol
+from terraflex.server.tf_state_lock_controller import TFStateLockController
+from terraflex.server.transport import bind_unix_socket
 from terraflex.utils.dependency_downloader import DependencyDownloader
 from terraflex.utils.dependency_manager import DependenciesManager
-from terraflex.utils.plugins import get_providers, get_providers_instances
-
-config = Settings()  # type: ignore
-
+from terraflex.utils.plugins import get_providers_instances
 
 DEPENDENCIES_ENTRYPOINT = "terraflex.plugins.dependencies"
 
-CONFIG_FILE_NAME = "terraflex.yaml"
-
 
 async def initialize_manager() -> DependenciesManager:
     dependencies_providers = get_providers_instances(
         DependencyDownloader,
         DEPENDENCIES_ENTRYPOINT,
+        cache_dir=get_settings().state_dir,
     )
 
     manager = DependenciesManager(
         dependencies=[downloader.instance for downloader in dependencies_providers.values()],
-        dest_folder=config.state_dir,
+        dest_folder=get_settings().state_dir,
     )
     await manager.initialize()
     return manager
 
 
-async def generate_transformers(
-    config: ConfigFile,
-    manager: DependenciesManager,
-    storage_providers: dict[str, StorageProviderProtocol],
-    workdir: Path,
-) -> dict[str, TransformerProtocol]:
-    transformer_providers = get_providers(
-        TransformerProtocol,
-        TRANSFORMERS_ENTRYPOINT,
-    )
-
-    transformers: dict[str, TransformerProtocol] = {}
-    for name, transformer in config.transformers.items():
-        if transformer.type not in transformer_providers:
-            raise ValueError(f"Unsupported transformer type: {transformer.type}")
-
-        transformer_class = transformer_providers[transformer.type].model_class
-        transformers[name] = await transformer_class.from_config(
-            transformer.model_extra or {},
-            storage_providers=storage_providers,
-            manager=manager,
-            workdir=workdir,
-        )
-
-    return transformers
-
-
 async def create_storage_providers(
     config: ConfigFile,
     manager: DependenciesManager,
     workdir: Path,
 ) -> dict[str, StorageProviderProtocol]:
-    storage_providers = get_providers(
-        StorageProviderProtocol,
-        STORATE_PROVIDERS_ENTRYPOINT,
-    )
+    return await ComponentsBuilder(config, manager, workdir).build_storage_providers()
 
-    result_storage_providers: dict[str, StorageProviderProtocol] = {}
-    for name, storage_config in config.storage_providers.items():
-        if storage_config.type not in storage_providers:
-            raise ValueError(f"Unsupported storage provider type: {storage_config.type}")
 
-        storage_class = storage_providers[storage_config.type].model_class
-        result_storage_providers[name] = await storage_class.from_config(
-            storage_config.model_extra or {},
-            manager=manager,
-            workdir=workdir,
-        )
+def read_config_file(path: Path) -> tuple[ConfigFile, bytes]:
+    if not path.exists():
+        raise FileNotFoundError(f"Config file not found: {path}")
 
-    return result_storage_providers
+    content = path.read_bytes()
+    return ConfigFile.model_validate(yaml.safe_load(content)), content
 
 
-async def generate_stacks(
-    config: ConfigFile,
-    storage_providers: dict[str, StorageProviderProtocol],
-    transformers: dict[str, TransformerProtocol],
-) -> dict[str, TFStack]:
-    result: dict[str, TFStack] = {}
-
-    for stack_name, stack in config.stacks.items():
-        state_storage_provider = storage_providers.get(stack.state_storage.provider)
-        if state_storage_provider is None:
-            raise ValueError(f"Undeclared storage provider: {stack.state_storage.provider}")
-
-        stack_transformers: list[TransformerProtocol] = []
-        for transformer_name in stack.transformers:
-            transformer = transformers.get(transformer_name)
-            if transformer is None:
-                raise ValueError(f"Undeclared transformer: {transformer_name}")
-
-            stack_transformers.append(transformer)
-
-        state_key = state_storage_provider.validate_key(stack.state_storage.params or {})
-        if not isinstance(state_storage_provider, WriteableStorageProviderProtocol):
-            raise ValueError(
-                f"Storage provider {stack.state_storage.provider} does not support writing - and it's required for state management"
-            )
-
-        result[stack_name] = TFStack(
-            name=stack_name,
-            storage_driver=state_storage_provider,
-            data_transformers=stack_transformers,
-            state_file_storage_identifier=state_key,
-        )
+async def build_controller(builder: ComponentsBuilder) -> StateLockProviderProtocol:
+    if get_settings().lazy_initialization:
+        builder.validate()
+        return TFStateLockController(stacks={}, stack_resolver=builder.stack)
 
-    return result
+    stacks = await builder.build_all()
+    # stacks of templates are resolved on first use
+    return TFStateLockController(stacks=stacks, stack_resolver=builder.stack)
 
 
-async def initialize_controller() -> StateLockProviderProtocol:
-    config_file_location = Path.cwd() / CONFIG_FILE_NAME
-    if not config_file_location.exists():
-        raise FileNotFoundError(f"Config file not found: {config_file_location}")
+@dataclass
+class Project:
+    """A project served under its own route prefix - `/{name}/{stack}/state`."""
 
-    content = config_file_location.read_bytes()
-    obj = yaml.safe_load(content)
-    file_config = ConfigFile.model_validate(obj)
+    name: str
+    directory: Path
+    controller: StateLockProviderProtocol
+    builder: ComponentsBuilder
 
-    manager = await initialize_manager()
 
-    storage_providers = await create_storage_providers(file_config, manager, workdir=config.state_dir)
-    transformers = await generate_transformers(file_config, manager, storage_providers, workdir=config.state_dir)
-    stacks = await generate_stacks(file_config, storage_providers, transformers)
+async def build_projects(directories: dict[str, Path], manager: DependenciesManager) -> dict[str, Project]:
+    """Build the projects concurrently - identical storage providers and transformers are shared between them."""
+    shared = SharedComponents()
 
-    return TFStateLockController(stacks=stacks)
+    async def build_project(name: str, directory: Path) -> Project:
+        file_config, _ = read_config_file(directory / CONFIG_FILE_NAME)
+        builder = ComponentsBuilder(file_config, manager, workdir=get_settings().state_dir, shared=shared)
+        return Project(name=name, directory=directory, controller=await build_controller(builder), builder=builder)
+
+    projects = await asyncio.gather(*(build_project(name, directory) for name, directory in directories.items()))
+    return {project.name: project for project in projects}
 
 
 class AppState(TypedDict):
     controller: Optional[StateLockProviderProtocol]
+    # builds the components of the controller - kept to reuse them when the config is reloaded
+    builder: Optional[ComponentsBuilder]
+    # the projects served under a route prefix - instead of the project in the current directory
+    projects: dict[str, Project]
+    in_flight: InFlightRequests
+    compressed_responses: CompressedResponseCache
 
 
 state: AppState = {
     "controller": None,
+    "builder": None,
+    "projects": {},
+    "in_flight": InFlightRequests(),
+    "compressed_responses": CompressedResponseCache(),
 }
 
 
+async def apply_config(file_config: ConfigFile) -> None:
+    """Replace the running controller with one built from `file_config`.
+
+    Components whose config is unchanged are reused as they are - with their clones, caches and held locks.
+    The replaced components are closed once the requests still using the previous controller finished.
+    """
+    previous_controller, previous_builder = state["controller"], state["builder"]
+    if previous_controller is None or previous_builder is None:
+        raise ValueError("Controller not initialized")
+
+    builder = ComponentsBuilder(file_config, previous_builder.manager, workdir=get_settings().state_dir)
+    unchanged = unchanged_components(previous_builder.config, file_config, previous_builder.built_stacks())
+    builder.adopt(previous_builder, unchanged)
+    try:
+        controller = await build_controller(builder)
+
+    except BaseException:
+        await builder.close(keep=[previous_builder])
+        raise
+
+    if isinstance(previous_controller, TFStateLockController) and isinstance(controller, TFStateLockController):
+        controller.fingerprints.update(
+            (stack_name, fingerprint)
+            for stack_name, fingerprint in previous_controller.fingerprints.items()
+            if ("stack", stack_name) in unchanged
+        )
+
+    state["controller"], state["builder"] = controller, builder
+    await state["in_flight"].wait_drained(previous_controller)
+    await previous_builder.close(keep=[builder])
+
+
+async def close_controller() -> None:
+    """Close the running controller - the one built last, a reload may have replaced the first one."""
+    builder = state["builder"]
+    state["controller"], state["builder"] = None, None
+    state["compressed_responses"].clear()
+    if builder is not None:
+        await builder.close()
+
+
+async def close_projects(projects: list[Project]) -> None:
+    for index, project in enumerate(projects):
+        # components shared with the projects before it are already closed
+        await project.builder.close(keep=[previous.builder for previous in projects[:index]])
+
+
 @asynccontextmanager
 async def lifespan(_: FastAPI) -> AsyncIterator[None]:
-    state["controller"] = await initialize_controller()
+    settings = get_settings()
+    if settings.projects:
+        state["projects"] = await build_projects(settings.projects, await initialize_manager())
+        yield
+        projects = list(state["projects"].values())
+        state["projects"] = {}
+        state["compressed_responses"].clear()
+        await close_projects(projects)
+        return
+
+    config_file_location = Path.cwd() / CONFIG_FILE_NAME
+    file_config, content = read_config_file(config_file_location)
+    manager = await initialize_manager()
+
+    builder = ComponentsBuilder(file_config, manager, workdir=get_settings().state_dir)
+    state["controller"] = await build_controller(builder)
+    state["builder"] = builder
+
+    reloader: Optional[asyncio.Task[None]] = None
+    if settings.reload_config:
+        reloader = asyncio.create_task(ConfigReloader(config_file_location, content, apply_config).run())
+
     yield
+    if reloader is not None:
+        reloader.cancel()
+        with suppress(asyncio.CancelledError):
+            await reloader
 
+    await close_controller()
 
-def get_controller() -> StateLockProviderProtocol:
-    if state["controller"] is None:
-        raise ValueError("Controller not initialized")
 
-    return state["controller"]
+async def get_controller(request: Request) -> AsyncIterator[StateLockProviderProtocol]:
+    project_name = request.path_params.get("project")
+    if project_name is not None or state["projects"]:
+        if project_name is None:
+            raise HTTPException(status_code=404, detail="Several projects are served - use /<project>/<stack>/...")
+
+        project = state["projects"].get(project_name)
+        if project is None:
+            raise HTTPException(status_code=404, detail=f"Unknown project: {project_name}")
+
+        controller = project.controller
+
+    else:
+        controller = state["controller"]
+        if controller is None:
+            raise ValueError("Controller not initialized")
+
+    # a reload replaces the controller - the previous one is closed only after the requests using it finished
+    state["in_flight"].enter(controller)
+    try:
+        yield controller
+
+    finally:
+        state["in_flight"].exit(controller)
 
 
 ControllerDependency = Annotated[StateLockProviderProtocol, Depends(get_controller)]
 
+# the state routes - served at the root for the project in the current directory, or under `/{project}`
+router = APIRouter()
+
 app = FastAPI(lifespan=lifespan)
 
 
@@ -196,27 +247,97 @@ async def validation_exception_handler(_: Request, exc: LockingError) -> JSONRes
     )
 
 
-@app.get("/{stack_name}/state")
-async def get_state(stack_name: str, controller: ControllerDependency) -> Data:
-    # read the state file
-    existing_state = await controller.get(stack_name)
-    if existing_state is None:
+@app.exception_handler(StaleStateError)
+async def stale_state_exception_handler(_: Request, exc: StaleStateError) -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_409_CONFLICT,
+        content=jsonable_encoder({"detail": str(exc), "serial": exc.serial, "stored_serial": exc.stored_serial}),
+    )
+
+
+@router.get("/{stack_name}/state", response_model=Data)
+@timed_operation("get")
+async def get_state(
+    stack_name: str,
+    controller: ControllerDependency,
+    accept_encoding: Annotated[Optional[str], Header()] = None,
+    if_none_match: Annotated[Optional[str], Header()] = None,
+) -> Response:
+    try:
+        version = await controller.get_version(stack_name)
+
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="State not found")
 
-    return existing_state
+    # the storage provider reports versions - a matching poll is answered without reading the state
+    if version is not None and etag_matches(if_none_match, version_etag(stack_name, version)):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": version_etag(stack_name, version)})
 
+    # read the state file - it's sent as stored, without parsing and serializing it again
+    result = await controller.get_raw(stack_name, known_version=version)
+    if result is None:
+        raise HTTPException(status_code=404, detail="State not found")
+
+    # the version was taken before the content - a write in between only makes the ETag older than the content,
+    # so the next poll gets the state again
+    existing_state, version = result
+    digest = content_digest(existing_state)
+    etag = version_etag(stack_name, version) if version is not None else content_etag(digest)
+
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    encoding = negotiate_encoding(accept_encoding)
+    if encoding is None or len(existing_state) < get_settings().response_compression_min_size:
+        return Response(
+            content=existing_state,
+            media_type="application/json",
+            headers={"Vary": "Accept-Encoding", "ETag": etag},
+        )
 
-@app.post("/{stack_name}/state")
+    headers = {"Content-Encoding": encoding, "Vary": "Accept-Encoding", "ETag": encoded_etag(etag, encoding)}
+    cache = state["compressed_responses"]
+    cached = cache.get(stack_name, encoding, digest)
+    if cached is not None:
+        return Response(content=cached, media_type="application/json", headers=headers)
+
+    return StreamingResponse(
+        stream_encode(
+            existing_state,
+            encoding,
+            on_complete=lambda encoded: cache.set(stack_name, encoding, digest, encoded),
+        ),
+        media_type="application/json",
+        headers=headers,
+    )
+
+
+@router.post("/{stack_name}/state", openapi_extra={"requestBody": {"content": {"application/json": {}}}})
+@timed_operation("put")
 async def update_state(
     stack_name: str,
     lock_id: Annotated[str, Query(..., alias="ID", description="ID of the state to update")],
-    new_state: Annotated[Any, Body(..., description="New state")],
+    request: Request,
     controller: ControllerDependency,
+    content_encoding: Annotated[Optional[str], Header()] = None,
 ) -> None:
+    body = await request.body()
+    try:
+        if content_encoding:
+            with stage("body_decode"):
+                body = await asyncio.to_thread(decode_body, content_encoding, body)
+
+        with stage("json_decode"):
+            new_state = json.loads(body)
+
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid state body: {exc}") from exc
+
     return await controller.put(stack_name, lock_id, new_state)
 
 
-@app.delete("/{stack_name}/state")
+@router.delete("/{stack_name}/state")
+@timed_operation("delete")
 async def delete_state(stack_name: str, controller: ControllerDependency) -> None:
     # TODO: should check if current user is holding the lock?
     lock = await controller.read_lock(stack_name)
@@ -226,23 +347,45 @@ async def delete_state(stack_name: str, controller: ControllerDependency) -> Non
     return await controller.delete(stack_name, lock.ID)
 
 
-@app.put("/{stack_name}/lock")
+@router.put("/{stack_name}/lock")
+@timed_operation("lock")
 async def lock_state(stack_name: Annotated[str, PathDep()], body: LockBody, controller: ControllerDependency) -> None:
     return await controller.lock(stack_name, body)
 
 
-@app.delete("/{stack_name}/lock")
+@router.delete("/{stack_name}/lock")
+@timed_operation("unlock")
 async def unlock_state(stack_name: str, controller: ControllerDependency) -> None:
     return await controller.unlock(stack_name)
 
 
+app.include_router(router)
+app.include_router(router, prefix="/{project}")
+
+
 @app.get("/ready")
 def ready() -> Literal["Ready"]:
     return "Ready"
 
 
-def start_server(port: int) -> None:
-    uvicorn.run(app, port=port)
+@app.get("/metrics")
+def metrics() -> Response:
+    return Response(content=REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+def start_server(port: int, socket_path: Optional[Path] = None) -> None:
+    """Run the server on a localhost port - or on a unix socket when `socket_path` is given."""
+    if socket_path is None:
+        uvicorn.run(app, port=port)
+        return
+
+    sock = bind_unix_socket(socket_path)
+    try:
+        uvicorn.Server(uvicorn.Config(app)).run(sockets=[sock])
+
+    finally:
+        sock.close()
+        socket_path.unlink(missing_ok=True)
 
 
 if __name__ == "__main__":
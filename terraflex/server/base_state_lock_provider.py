@@ -37,8 +37,19 @@ class LockingError(Exception):
         self.lock_id = lock_id
 
 
+class StaleStateError(Exception):
+    """Raised when a state older than the stored state is written."""
+
+    def __init__(self, msg: str, serial: int, stored_serial: int) -> None:
+        super().__init__(msg)
+        self.serial = serial
+        self.stored_serial = stored_serial
+
+
 class StateLockProviderProtocol(Protocol):
     async def get(self, stack_name: str) -> Data | None: ...
+    async def get_raw(self, stack_name: str, known_version: str | None = None) -> tuple[bytes, str | None] | None: ...
+    async def get_version(self, stack_name: str) -> str | None: ...
     async def put(self, stack_name: str, lock_id: str, value: Data) -> None: ...
     async def delete(self, stack_name: str, lock_id: str) -> None: ...
     async def read_lock(self, stack_name: str) -> LockBody | None: ...
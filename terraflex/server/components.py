@@ -0,0 +1,308 @@
+import asyncio
+import json
+import logging
+import pathlib
+import time
+from typing import Any, Awaitable, Callable, Collection, Literal, Optional, Sequence, TypeVar
+
+from terraflex.server.config import ConfigFile, StackMatcher
+from terraflex.server.storage_provider_base import (
+    STORATE_PROVIDERS_ENTRYPOINT,
+    ClosableProtocol,
+    StorageProviderProtocol,
+    WriteableStorageProviderProtocol,
+)
+from terraflex.server.tf_state_lock_controller import TFStack
+from terraflex.server.transformation_base import (
+    TRANSFORMERS_ENTRYPOINT,
+    TransformerProtocol,
+)
+from terraflex.utils.dependency_manager import DependenciesManager
+from terraflex.utils.plugins import get_providers
+
+# a child of uvicorn's logger - printed together with the server logs, and follows its log level
+logger = logging.getLogger("uvicorn.error").getChild("terraflex")
+
+ComponentKind = Literal["storage provider", "transformer", "stack"]
+ComponentKey = tuple[ComponentKind, str]
+T = TypeVar("T")
+
+
+def find_storage_dependencies(raw_config: Any, storage_providers: Collection[str]) -> list[str]:
+    """Find the storage providers referenced in a component config - any `provider: <name>` value in it."""
+    found: list[str] = []
+    pending = [raw_config]
+    while pending:
+        item = pending.pop()
+        if isinstance(item, dict):
+            provider = item.get("provider")  # type: ignore[reportUnknownMemberType]
+            if isinstance(provider, str) and provider in storage_providers and provider not in found:
+                found.append(provider)
+
+            pending.extend(item.values())  # type: ignore[reportUnknownMemberType]
+
+        elif isinstance(item, list):
+            pending.extend(item)  # type: ignore[reportUnknownArgumentType]
+
+    return found
+
+
+class SharedComponents:
+    """Components shared by the builders of several projects - identical definitions are built once.
+
+    Definitions are identical when their type and config are - and for transformers,
+    when the storage providers they reference are identical too.
+    """
+
+    def __init__(self) -> None:
+        self._builds: dict[str, asyncio.Task[Any]] = {}
+
+    def get(self, key: str, build: Callable[[], Awaitable[T]]) -> Awaitable[T]:
+        task = self._builds.get(key)
+        if task is None or (task.done() and (task.cancelled() or task.exception() is not None)):
+            task = asyncio.ensure_future(build())
+            self._builds[key] = task
+
+        return asyncio.shield(task)
+
+
+class ComponentsBuilder:
+    """Builds the components declared in the config file - each one at most once.
+
+    A component is built as soon as the components it depends on are ready -
+    transformers wait only for the storage providers referenced in their config,
+    and stacks wait only for their own storage provider and transformers.
+    Independent components are built concurrently, and concurrent requests for the same component share one build.
+    """
+
+    def __init__(
+        self,
+        config: ConfigFile,
+        manager: DependenciesManager,
+        workdir: pathlib.Path,
+        shared: Optional[SharedComponents] = None,
+    ):
+        self.config = config
+        self.manager = manager
+        self.workdir = workdir
+        # plugins are imported only when the config references them
+        self.storage_provider_types = get_providers(
+            StorageProviderProtocol, STORATE_PROVIDERS_ENTRYPOINT, cache_dir=workdir
+        )
+        self.transformer_types = get_providers(TransformerProtocol, TRANSFORMERS_ENTRYPOINT, cache_dir=workdir)
+        self.shared = shared
+        self.stack_matcher = StackMatcher(config.stacks)
+        # time until each component was ready - in seconds
+        self.timings: dict[ComponentKey, float] = {}
+
+        self._builds: dict[ComponentKey, asyncio.Task[Any]] = {}
+        self._start = time.perf_counter()
+
+    def _build_once(self, kind: ComponentKind, name: str, build: Callable[[], Awaitable[T]]) -> Awaitable[T]:
+        task = self._builds.get((kind, name))
+        if task is None:
+            task = asyncio.create_task(self._timed(kind, name, build))
+            task.add_done_callback(lambda done: self._forget_failed(kind, name, done))
+            self._builds[(kind, name)] = task
+
+        # a cancelled caller must not cancel a build other callers wait for
+        return asyncio.shield(task)
+
+    def _forget_failed(self, kind: ComponentKind, name: str, task: asyncio.Task[Any]) -> None:
+        # a failed build (e.g. a network error) is retried by the next caller
+        if (task.cancelled() or task.exception() is not None) and self._builds.get((kind, name)) is task:
+            del self._builds[(kind, name)]
+
+    async def _timed(self, kind: ComponentKind, name: str, build: Callable[[], Awaitable[T]]) -> T:
+        start = time.perf_counter()
+        result = await build()
+        elapsed = time.perf_counter() - start
+        self.timings[(kind, name)] = elapsed
+        logger.info("Initialized %s %r in %.3fs", kind, name, elapsed)
+        return result
+
+    def _shared_key(self, kind: ComponentKind, name: str) -> str:
+        """Identifies the definition of a component - across the configs of all projects."""
+        if kind == "storage provider":
+            return json.dumps([kind, self.config.storage_providers[name].model_dump(mode="json")], sort_keys=True)
+
+        transformer_config = self.config.transformers[name]
+        dependencies = find_storage_dependencies(transformer_config.model_extra or {}, self.config.storage_providers)
+        return json.dumps(
+            [
+                kind,
+                transformer_config.model_dump(mode="json"),
+                {dependency: self._shared_key("storage provider", dependency) for dependency in dependencies},
+            ],
+            sort_keys=True,
+        )
+
+    def _build_shared(self, kind: ComponentKind, name: str, build: Callable[[], Awaitable[T]]) -> Awaitable[T]:
+        declared = self.config.storage_providers if kind == "storage provider" else self.config.transformers
+        if self.shared is None or name not in declared:
+            return build()
+
+        return self.shared.get(self._shared_key(kind, name), build)
+
+    def storage_provider(self, name: str) -> Awaitable[StorageProviderProtocol]:
+        return self._build_once(
+            "storage provider",
+            name,
+            lambda: self._build_shared("storage provider", name, lambda: self._build_storage_provider(name)),
+        )
+
+    def transformer(self, name: str) -> Awaitable[TransformerProtocol]:
+        return self._build_once(
+            "transformer",
+            name,
+            lambda: self._build_shared("transformer", name, lambda: self._build_transformer(name)),
+        )
+
+    def stack(self, name: str) -> Awaitable[TFStack]:
+        return self._build_once("stack", name, lambda: self._build_stack(name))
+
+    async def _build_storage_provider(self, name: str) -> StorageProviderProtocol:
+        storage_config = self.config.storage_providers.get(name)
+        if storage_config is None:
+            raise ValueError(f"Undeclared storage provider: {name}")
+
+        if storage_config.type not in self.storage_provider_types:
+            raise ValueError(f"Unsupported storage provider type: {storage_config.type}")
+
+        storage_class = self.storage_provider_types[storage_config.type].model_class
+        return await storage_class.from_config(
+            storage_config.model_extra or {},
+            manager=self.manager,
+            workdir=self.workdir,
+        )
+
+    async def _build_transformer(self, name: str) -> TransformerProtocol:
+        transformer_config = self.config.transformers.get(name)
+        if transformer_config is None:
+            raise ValueError(f"Undeclared transformer: {name}")
+
+        if transformer_config.type not in self.transformer_types:
+            raise ValueError(f"Unsupported transformer type: {transformer_config.type}")
+
+        raw_config = transformer_config.model_extra or {}
+        dependencies = find_storage_dependencies(raw_config, self.config.storage_providers)
+        storage_providers = await asyncio.gather(*(self.storage_provider(dependency) for dependency in dependencies))
+
+        transformer_class = self.transformer_types[transformer_config.type].model_class
+        return await transformer_class.from_config(
+            raw_config,
+            storage_providers=dict(zip(dependencies, storage_providers, strict=True)),
+            manager=self.manager,
+            workdir=self.workdir,
+        )
+
+    async def _build_stack(self, name: str) -> TFStack:
+        stack = self.stack_matcher.match(name)
+        if stack is None:
+            raise ValueError(f"Undeclared stack: {name}")
+
+        state_storage_provider, stack_transformers = await asyncio.gather(
+            self.storage_provider(stack.state_storage.provider),
+            asyncio.gather(*(self.transformer(transformer_name) for transformer_name in stack.transformers)),
+        )
+
+        state_key = state_storage_provider.validate_key(stack.state_storage.params or {})
+        if not isinstance(state_storage_provider, WriteableStorageProviderProtocol):
+            raise ValueError(
+                f"Storage provider {stack.state_storage.provider} does not support writing - and it's required for state management"
+            )
+
+        return TFStack(
+            name=name,
+            storage_driver=state_storage_provider,
+            data_transformers=stack_transformers,
+            state_file_storage_identifier=state_key,
+        )
+
+    def validate(self) -> None:
+        """Validate the config without building anything - every referenced component is declared and supported."""
+        for storage_config in self.config.storage_providers.values():
+            if storage_config.type not in self.storage_provider_types:
+                raise ValueError(f"Unsupported storage provider type: {storage_config.type}")
+
+        for transformer_config in self.config.transformers.values():
+            if transformer_config.type not in self.transformer_types:
+                raise ValueError(f"Unsupported transformer type: {transformer_config.type}")
+
+        for stack in self.config.stacks.values():
+            storage_config = self.config.storage_providers.get(stack.state_storage.provider)
+            if storage_config is None:
+                raise ValueError(f"Undeclared storage provider: {stack.state_storage.provider}")
+
+            for transformer_name in stack.transformers:
+                if transformer_name not in self.config.transformers:
+                    raise ValueError(f"Undeclared transformer: {transformer_name}")
+
+            storage_class = self.storage_provider_types[storage_config.type].model_class
+            storage_class.validate_key(stack.state_storage.params or {})
+
+    async def _gather_all(self, builds: dict[str, Awaitable[T]]) -> dict[str, T]:
+        results = await asyncio.gather(*builds.values())
+        return dict(zip(builds.keys(), results, strict=True))
+
+    async def build_storage_providers(self) -> dict[str, StorageProviderProtocol]:
+        return await self._gather_all({name: self.storage_provider(name) for name in self.config.storage_providers})
+
+    async def build_transformers(self) -> dict[str, TransformerProtocol]:
+        return await self._gather_all({name: self.transformer(name) for name in self.config.transformers})
+
+    async def build_stacks(self) -> dict[str, TFStack]:
+        # stacks of templates are built on first use - there may be any number of them
+        return await self._gather_all({name: self.stack(name) for name in self.stack_matcher.stacks})
+
+    async def build_all(self) -> dict[str, TFStack]:
+        """Build every declared component concurrently - and return the stacks."""
+        try:
+            _, _, stacks = await asyncio.gather(
+                self.build_storage_providers(),
+                self.build_transformers(),
+                self.build_stacks(),
+            )
+
+        except BaseException:
+            self.cancel()
+            raise
+
+        logger.info("Initialized %d components in %.3fs", len(self._builds), time.perf_counter() - self._start)
+        return stacks
+
+    def cancel(self) -> None:
+        for task in self._builds.values():
+            if not task.done():
+                task.cancel()
+
+            elif not task.cancelled():
+                # the first failure was already raised - the rest are not reported again
+                task.exception()
+
+    def adopt(self, previous: "ComponentsBuilder", keys: Collection[ComponentKey]) -> None:
+        """Reuse the components `previous` already built - for the given keys, whose config is unchanged."""
+        for key in keys:
+            task = previous._builds.get(key)
+            if task is not None and task.done() and not task.cancelled() and task.exception() is None:
+                self._builds[key] = task
+
+    def built_stacks(self) -> list[str]:
+        """The names of the stacks built so far - including stacks resolved from templates."""
+        return [name for kind, name in self._builds if kind == "stack"]
+
+    def built(self) -> list[Any]:
+        """The components built successfully so far."""
+        return [
+            task.result()
+            for task in self._builds.values()
+            if task.done() and not task.cancelled() and task.exception() is None
+        ]
+
+    async def close(self, keep: Sequence["ComponentsBuilder"] = ()) -> None:
+        """Close the built components - except the ones the builders in `keep` use too."""
+        self.cancel()
+        kept = {id(component) for builder in keep for component in builder.built()}
+        for component in self.built():
+            if id(component) not in kept and isinstance(component, ClosableProtocol):
+                await component.close()
@@ -0,0 +1,180 @@
+import asyncio
+import hashlib
+import importlib
+import importlib.util
+import zlib
+from typing import Any, AsyncIterator, Callable, Literal, Optional, Protocol
+
+from terraflex.server.metrics import cache_lookup
+
+Encoding = Literal["zstd", "br", "gzip"]
+
+# preferred first - zstd and brotli are both faster and smaller than gzip on state JSON
+PREFERRED_ENCODINGS: tuple[Encoding, ...] = ("zstd", "br", "gzip")
+STREAM_CHUNK_SIZE = 256 * 1024
+# decompressed request bodies bigger than this are rejected - protects against compression bombs
+MAX_DECOMPRESSED_SIZE = 1024 * 1024 * 1024
+
+
+class IncrementalEncoder(Protocol):
+    def compress(self, data: bytes | memoryview, /) -> bytes: ...
+    def flush(self) -> bytes: ...
+
+
+def encoding_available(encoding: Encoding) -> bool:
+    match encoding:
+        case "gzip":
+            return True
+
+        case "br":
+            return importlib.util.find_spec("brotli") is not None
+
+        case "zstd":
+            return importlib.util.find_spec("zstandard") is not None
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[Encoding]:
+    """Pick the best supported encoding the client accepts - None when the response should not be encoded."""
+    if not accept_encoding:
+        return None
+
+    accepted: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+
+            except ValueError:
+                quality = 0.0
+
+        accepted[name.strip().lower()] = quality
+
+    wildcard = accepted.get("*", 0.0)
+    for encoding in PREFERRED_ENCODINGS:
+        if accepted.get(encoding, wildcard) > 0 and encoding_available(encoding):
+            return encoding
+
+    return None
+
+
+def create_encoder(encoding: Encoding) -> IncrementalEncoder:
+    match encoding:
+        case "gzip":
+            # level 6 - most of the ratio of level 9 at a fraction of the cost
+            return zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+        case "br":
+            return _BrotliEncoder(quality=5)
+
+        case "zstd":
+            import zstandard
+
+            return zstandard.ZstdCompressor(level=3).compressobj()
+
+
+class _BrotliEncoder:
+    """Typed wrapper of `brotli.Compressor` - brotli ships without type hints."""
+
+    def __init__(self, quality: int):
+        brotli: Any = importlib.import_module("brotli")
+        self._compressor: Any = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes | memoryview, /) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.finish()
+
+
+def decode_body(encoding: str, content: bytes) -> bytes:
+    """Decode a request body sent with `Content-Encoding` - raises ValueError for invalid or unsupported bodies."""
+    try:
+        return _decode_body(encoding, content)
+
+    except zlib.error as exc:
+        raise ValueError(f"Invalid {encoding} body: {exc}") from exc
+
+
+def _decode_body(encoding: str, content: bytes) -> bytes:
+    match encoding.strip().lower():
+        case "" | "identity":
+            return content
+
+        case "gzip" | "x-gzip":
+            decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+            result = decompressor.decompress(content, MAX_DECOMPRESSED_SIZE)
+            if decompressor.unconsumed_tail:
+                raise ValueError("Decompressed request body is too large")
+
+            return result
+
+        case "zstd" if encoding_available("zstd"):
+            import zstandard
+
+            try:
+                return zstandard.ZstdDecompressor().decompress(content, max_output_size=MAX_DECOMPRESSED_SIZE)
+
+            except zstandard.ZstdError as exc:
+                raise ValueError(f"Invalid zstd body: {exc}") from exc
+
+        case _:
+            raise ValueError(f"Unsupported content encoding: {encoding}")
+
+
+class CompressedResponseCache:
+    """Keeps the last encoded body of every stack per encoding - keyed by a digest of the raw content.
+
+    Repeated reads of an unchanged state are served without compressing it again.
+    """
+
+    def __init__(self) -> None:
+        self._entries: dict[tuple[str, Encoding], tuple[bytes, bytes]] = {}
+
+    def get(self, stack_name: str, encoding: Encoding, digest: bytes) -> Optional[bytes]:
+        entry = self._entries.get((stack_name, encoding))
+        if entry is None or entry[0] != digest:
+            cache_lookup("compressed_responses", hit=False)
+            return None
+
+        cache_lookup("compressed_responses", hit=True)
+        return entry[1]
+
+    def set(self, stack_name: str, encoding: Encoding, digest: bytes, content: bytes) -> None:
+        self._entries[(stack_name, encoding)] = (digest, content)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+def content_digest(content: bytes) -> bytes:
+    return hashlib.blake2b(content, digest_size=16).digest()
+
+
+async def stream_encode(
+    content: bytes,
+    encoding: Encoding,
+    on_complete: Optional[Callable[[bytes], None]] = None,
+) -> AsyncIterator[bytes]:
+    """Encode content chunk by chunk - the first bytes are sent before the whole state was compressed.
+
+    Compression runs in a worker thread, `on_complete` gets the full encoded body once the stream finished.
+    """
+    encoder = create_encoder(encoding)
+    view = memoryview(content)
+    encoded_chunks: list[bytes] = []
+    for offset in range(0, len(view), STREAM_CHUNK_SIZE):
+        chunk = await asyncio.to_thread(encoder.compress, view[offset : offset + STREAM_CHUNK_SIZE])
+        if chunk:
+            encoded_chunks.append(chunk)
+            yield chunk
+
+    chunk = encoder.flush()
+    if chunk:
+        encoded_chunks.append(chunk)
+        yield chunk
+
+    if on_complete is not None:
+        on_complete(b"".join(encoded_chunks))
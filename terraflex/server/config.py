@@ -1,4 +1,6 @@
+import functools
 import pathlib
+import re
 from typing import (
     Annotated,
     Any,
@@ -17,6 +19,15 @@ PACKAGE_NAME = "terraflex"
 
 CONFIG_VERSION = "2"
 
+CONFIG_FILE_NAME = "terraflex.yaml"
+
+# names a stack can be requested with - a single segment of the state address
+STACK_NAME_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9._-]*")
+# wildcards of stack templates - `*` matches any number of characters, `?` a single one
+STACK_TEMPLATE_WILDCARDS = ("*", "?")
+# replaced by the requested stack name in the params of a stack template
+STACK_NAME_PLACEHOLDER = "{name}"
+
 
 class StorageProviderUsageConfig(BaseModel):
     """Data struct that contains the parameters that link to a specific file in a given storage provider.
@@ -85,15 +96,88 @@ class TransformerConfig(BaseModel):
 class StackConfig(BaseModel):
     """Configuration for a terraform stack.
 
+    A stack whose name contains wildcards (`*`, `?`) is a template - it declares every stack matching it.
+    `{name}` in its state storage params is replaced by the name of the matched stack.
+
     Attributes:
         state_storage: The storage provider configuration for the state file.
         transformers: The list of transformers to apply to the data.
+
+    Example:
+        This template declares `env-dev`, `env-prod` and any other `env-` stack -
+        each stored in its own file:
+
+        ```yaml
+        stacks:
+          env-*:
+            state_storage:
+              provider: git
+              params:
+                path: envs/{name}.tfstate
+            transformers: []
+        ```
     """
 
     state_storage: StorageProviderUsageConfig
     transformers: list[str]
 
 
+def is_stack_template(name: str) -> bool:
+    return any(wildcard in name for wildcard in STACK_TEMPLATE_WILDCARDS)
+
+
+def _template_regex(pattern: str) -> str:
+    return re.escape(pattern).replace(r"\*", ".*").replace(r"\?", ".")
+
+
+def _render_params(value: Any, name: str) -> Any:
+    if isinstance(value, str):
+        return value.replace(STACK_NAME_PLACEHOLDER, name)
+
+    if isinstance(value, dict):
+        return {key: _render_params(item, name) for key, item in value.items()}  # type: ignore[reportUnknownVariableType]
+
+    if isinstance(value, list):
+        return [_render_params(item, name) for item in value]  # type: ignore[reportUnknownVariableType]
+
+    return value
+
+
+class StackMatcher:
+    """Finds the config of a stack by its name - declared explicitly, or matching a stack template.
+
+    Explicit stacks take precedence. The templates are compiled into a single pattern -
+    matching a name costs the same however many templates there are. When several templates match, the first declared wins.
+    """
+
+    def __init__(self, stacks: dict[str, StackConfig]):
+        self.stacks = {name: stack for name, stack in stacks.items() if not is_stack_template(name)}
+        self.templates = [(pattern, stack) for pattern, stack in stacks.items() if is_stack_template(pattern)]
+        alternatives = [
+            f"(?P<template{index}>{_template_regex(pattern)})" for index, (pattern, _) in enumerate(self.templates)
+        ]
+        self._matcher = re.compile("|".join(alternatives)) if alternatives else None
+
+    def match(self, name: str) -> Optional[StackConfig]:
+        """The config of the stack - None if it's not declared."""
+        stack = self.stacks.get(name)
+        if stack is not None:
+            return stack
+
+        if self._matcher is None or not STACK_NAME_PATTERN.fullmatch(name):
+            return None
+
+        match = self._matcher.fullmatch(name)
+        if match is None or match.lastgroup is None:
+            return None
+
+        _, template = self.templates[int(match.lastgroup.removeprefix("template"))]
+        state_storage = template.state_storage.model_copy(
+            update={"params": _render_params(template.state_storage.params, name)}
+        )
+        return template.model_copy(update={"state_storage": state_storage})
+
+
 class ConfigFile(BaseModel):
     """The configuration file for terraflex.
 
@@ -134,3 +218,17 @@ class Settings(BaseSettings):
             default=xdg_base_dirs.xdg_data_home() / PACKAGE_NAME,
         ),
     ]
+    # states smaller than this are sent uncompressed - compressing them costs more than it saves
+    response_compression_min_size: int = 1024
+    # build storage providers and transformers on first use of a stack that needs them - instead of on startup
+    lazy_initialization: bool = False
+    # watch the config file - and apply its changes without restarting the server
+    reload_config: bool = False
+    # serve these projects - each under a route prefix of its name - instead of the one in the current directory
+    projects: dict[str, pathlib.Path] = {}
+
+
+@functools.cache
+def get_settings() -> Settings:
+    """The server settings - read from the environment on first use."""
+    return Settings()  # type: ignore
@@ -0,0 +1,38 @@
+import hashlib
+from typing import Optional
+
+
+def version_etag(stack_name: str, version: str) -> str:
+    """Strong ETag derived from the version reported by the storage provider."""
+    digest = hashlib.blake2b(f"{stack_name}\0{version}".encode(), digest_size=16).hexdigest()
+    return f'"v-{digest}"'
+
+
+def content_etag(digest: bytes) -> str:
+    """Strong ETag derived from a digest of the state content."""
+    return f'"c-{digest.hex()}"'
+
+
+def encoded_etag(etag: str, encoding: Optional[str]) -> str:
+    """An encoded response has different bytes - so it gets its own strong ETag."""
+    if encoding is None:
+        return etag
+
+    return f'{etag[:-1]}+{encoding}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check `If-None-Match` against the ETag of the identity representation - any encoding of it matches."""
+    if not if_none_match:
+        return False
+
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+
+        candidate = candidate.removeprefix("W/")
+        if candidate == etag or candidate.partition("+")[0] == etag[:-1]:
+            return True
+
+    return False
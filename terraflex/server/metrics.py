@@ -0,0 +1,278 @@
+import bisect
+import functools
+import math
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Iterator, Optional, Sequence, TypeVar
+
+from terraflex.server.base_state_lock_provider import LockingError
+
+# the Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# upper bounds of the latency buckets - in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+T = TypeVar("T")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values, strict=True)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # updates may come from threads - e.g. storage providers running blocking calls in a thread
+        self._lock = threading.Lock()
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {_escape(self.documentation)}"
+        yield f"# TYPE {self.name} {self.type_name}"
+        yield from self.samples()
+
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def value(self, *labelvalues: str) -> float:
+        return self._values.get(labelvalues, 0.0)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = list(self._values.items())
+
+        for labelvalues, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}"
+
+
+class _Timer:
+    __slots__ = ("_histogram", "_labelvalues", "_start")
+
+    def __init__(self, histogram: "Histogram", labelvalues: tuple[str, ...]):
+        self._histogram = histogram
+        self._labelvalues = labelvalues
+        self._start = 0.0
+
+    def __enter__(self) -> None:
+        self._start = time.perf_counter()
+
+    def __exit__(self, *_: object) -> None:
+        self._histogram.observe(time.perf_counter() - self._start, *self._labelvalues)
+
+
+class Histogram(Metric):
+    """Observations counted in buckets - each observation increments a single bucket, they are summed up on render."""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # per label values - the count of every bucket (the last one is +Inf), and the sum
+        self._values: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labelvalues)
+            if entry is None:
+                entry = self._values[labelvalues] = ([0] * (len(self.buckets) + 1), [0.0])
+
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    def time(self, *labelvalues: str) -> _Timer:
+        return _Timer(self, labelvalues)
+
+    def count(self, *labelvalues: str) -> int:
+        entry = self._values.get(labelvalues)
+        return sum(entry[0]) if entry is not None else 0
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = [(labelvalues, list(counts), total[0]) for labelvalues, (counts, total) in self._values.items()]
+
+        labelnames = (*self.labelnames, "le")
+        for labelvalues, counts, total in values:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts, strict=True):
+                cumulative += count
+                labels = _format_labels(labelnames, (*labelvalues, _format_value(bound)))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+
+            labels = _format_labels(self.labelnames, labelvalues)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: list[Metric] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Histogram:
+        metric = Histogram(name, documentation, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "".join(f"{line}\n" for metric in self.metrics for line in metric.render())
+
+
+REGISTRY = Registry()
+
+OPERATION_DURATION = REGISTRY.histogram(
+    "terraflex_operation_duration_seconds",
+    "Duration of the state operations served",
+    ["stack", "operation"],
+)
+STAGE_DURATION = REGISTRY.histogram(
+    "terraflex_stage_duration_seconds",
+    "Duration of each stage of the state operations - storage, transformers, locks and JSON handling",
+    ["stack", "operation", "stage"],
+)
+LOCK_CONFLICTS = REGISTRY.counter(
+    "terraflex_lock_conflicts_total",
+    "Operations rejected because the state is locked by someone else - or not locked",
+    ["stack", "operation"],
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    "terraflex_cache_requests_total",
+    "Lookups in the caches of the server - by result (hit / miss)",
+    ["cache", "result"],
+)
+STORAGE_BYTES = REGISTRY.counter(
+    "terraflex_storage_bytes_total",
+    "Bytes of states read from and written to the storage providers - as stored, after the transformers",
+    ["stack", "direction"],
+)
+GIT_PROCESSES = REGISTRY.counter(
+    "terraflex_git_processes_total",
+    "Git subprocesses spawned by the git storage provider",
+    ["command"],
+)
+GIT_BYTES = REGISTRY.counter(
+    "terraflex_git_bytes_total",
+    "Bytes of files read from and written to the clones of the git storage provider",
+    ["direction"],
+)
+
+# the label of operations on undeclared stacks - names from the URL are labels only once validated,
+# so mistyped names don't create new series
+UNKNOWN_STACK = "unknown"
+
+# the operation being served - the label of the stages measured while serving it
+_operation: ContextVar[str] = ContextVar("terraflex_operation", default="other")
+# the stack of the operation being served - set once it was validated
+_stack: ContextVar[Optional[str]] = ContextVar("terraflex_stack", default=None)
+# stages measured before the stack was validated - labeled once the operation ended
+_pending_stages: ContextVar[Optional[list[tuple[str, float]]]] = ContextVar("terraflex_pending_stages", default=None)
+
+
+class _Stage:
+    __slots__ = ("_name", "_start")
+
+    def __init__(self, name: str):
+        self._name = name
+        self._start = 0.0
+
+    def __enter__(self) -> None:
+        self._start = time.perf_counter()
+
+    def __exit__(self, *_: object) -> None:
+        duration = time.perf_counter() - self._start
+        stack_name = _stack.get()
+        pending = _pending_stages.get()
+        if stack_name is None and pending is not None:
+            pending.append((self._name, duration))
+            return
+
+        STAGE_DURATION.observe(duration, stack_name or UNKNOWN_STACK, _operation.get(), self._name)
+
+
+def stage(name: str) -> _Stage:
+    """Measure a stage of the operation being served - labeled with its stack, once validated."""
+    return _Stage(name)
+
+
+def stack_validated(stack_name: str) -> None:
+    """Mark the stack of the operation being served as declared - its name is used as the label of the operation."""
+    _stack.set(stack_name)
+
+
+def cache_lookup(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.inc(cache, "hit" if hit else "miss")
+
+
+def timed_operation(
+    operation: str,
+) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
+    """Measure an endpoint serving a stack - labeled with the stack once the endpoint validated it."""
+
+    def decorator(endpoint: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        @functools.wraps(endpoint)
+        async def wrapper(*args: Any, **kwargs: Any) -> T:
+            operation_token = _operation.set(operation)
+            stack_token = _stack.set(None)
+            pending_token = _pending_stages.set([])
+            start = time.perf_counter()
+            try:
+                return await endpoint(*args, **kwargs)
+
+            except LockingError:
+                LOCK_CONFLICTS.inc(_stack.get() or UNKNOWN_STACK, operation)
+                raise
+
+            finally:
+                stack_label = _stack.get() or UNKNOWN_STACK
+                OPERATION_DURATION.observe(time.perf_counter() - start, stack_label, operation)
+                for name, duration in _pending_stages.get() or []:
+                    STAGE_DURATION.observe(duration, stack_label, operation, name)
+
+                _pending_stages.reset(pending_token)
+                _stack.reset(stack_token)
+                _operation.reset(operation_token)
+
+        return wrapper
+
+    return decorator
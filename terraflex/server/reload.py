@@ -0,0 +1,149 @@
+import asyncio
+import hashlib
+import logging
+import os
+from pathlib import Path
+from typing import Awaitable, Callable, Collection, Optional
+
+import yaml
+
+from terraflex.server.components import ComponentKey, find_storage_dependencies
+from terraflex.server.config import ConfigFile, StackMatcher
+
+logger = logging.getLogger("uvicorn.error").getChild("terraflex")
+
+DEFAULT_RELOAD_INTERVAL = 1.0
+
+
+def unchanged_components(old: ConfigFile, new: ConfigFile, stack_names: Collection[str] = ()) -> set[ComponentKey]:
+    """Components of `new` which are built exactly as in `old` - their config and their dependencies are unchanged.
+
+    Args:
+        old: The running config.
+        new: The config replacing it.
+        stack_names: Stacks built with `old` - besides the declared ones, e.g. stacks resolved from templates.
+            A stack is unchanged when its name resolves to the same config in both.
+    """
+    unchanged: set[ComponentKey] = set()
+    for name, storage_config in new.storage_providers.items():
+        if old.storage_providers.get(name) == storage_config:
+            unchanged.add(("storage provider", name))
+
+    for name, transformer_config in new.transformers.items():
+        if old.transformers.get(name) != transformer_config:
+            continue
+
+        raw_config = transformer_config.model_extra or {}
+        dependencies = find_storage_dependencies(raw_config, new.storage_providers)
+        if dependencies == find_storage_dependencies(raw_config, old.storage_providers) and all(
+            ("storage provider", dependency) in unchanged for dependency in dependencies
+        ):
+            unchanged.add(("transformer", name))
+
+    old_stacks, new_stacks = StackMatcher(old.stacks), StackMatcher(new.stacks)
+    for name in new_stacks.stacks.keys() | set(stack_names):
+        stack = new_stacks.match(name)
+        if (
+            stack is not None
+            and old_stacks.match(name) == stack
+            and ("storage provider", stack.state_storage.provider) in unchanged
+            and all(("transformer", transformer) in unchanged for transformer in stack.transformers)
+        ):
+            unchanged.add(("stack", name))
+
+    return unchanged
+
+
+class InFlightRequests:
+    """Counts the requests served by each controller - a replaced controller is closed only after they finished."""
+
+    def __init__(self) -> None:
+        self._counts: dict[int, int] = {}
+        self._drained: dict[int, asyncio.Event] = {}
+
+    def enter(self, controller: object) -> None:
+        self._counts[id(controller)] = self._counts.get(id(controller), 0) + 1
+
+    def exit(self, controller: object) -> None:
+        key = id(controller)
+        self._counts[key] -= 1
+        if self._counts[key] == 0:
+            del self._counts[key]
+            drained = self._drained.pop(key, None)
+            if drained is not None:
+                drained.set()
+
+    def count(self, controller: object) -> int:
+        return self._counts.get(id(controller), 0)
+
+    async def wait_drained(self, controller: object) -> None:
+        if id(controller) not in self._counts:
+            return
+
+        await self._drained.setdefault(id(controller), asyncio.Event()).wait()
+
+
+class ConfigReloader:
+    """Watches the config file, and applies its new content whenever it changed.
+
+    The file is checked every `interval` seconds - a `stat` call, it's read only when its metadata changed.
+    Invalid configs and failed rebuilds are logged, and the running config is kept.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        current: bytes,
+        apply: Callable[[ConfigFile], Awaitable[None]],
+        interval: float = DEFAULT_RELOAD_INTERVAL,
+    ):
+        self.path = path
+        self.apply = apply
+        self.interval = interval
+        self._digest = hashlib.blake2b(current).digest()
+        self._stat = self._read_stat()
+
+    def _read_stat(self) -> Optional[tuple[int, int, int]]:
+        try:
+            stat = os.stat(self.path)
+
+        except FileNotFoundError:
+            return None
+
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    async def check(self) -> bool:
+        """Apply the config file if it changed - returns whether it was applied."""
+        stat = self._read_stat()
+        if stat is None or stat == self._stat:
+            # a missing file is usually an editor in the middle of saving it
+            return False
+
+        self._stat = stat
+        content = self.path.read_bytes()
+        digest = hashlib.blake2b(content).digest()
+        if digest == self._digest:
+            return False
+
+        self._digest = digest
+        try:
+            new_config = ConfigFile.model_validate(yaml.safe_load(content))
+
+        except (yaml.YAMLError, ValueError) as exc:
+            logger.error("Invalid config in %s - keeping the running config:\n%s", self.path, exc)
+            return False
+
+        try:
+            await self.apply(new_config)
+
+        except Exception:
+            logger.exception("Failed to reload %s - keeping the running config", self.path)
+            return False
+
+        logger.info("Reloaded %s", self.path)
+        return True
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.check()
@@ -146,6 +146,37 @@ class LockableStorageProviderProtocol(WriteableStorageProviderProtocol, Protocol
     async def release_lock(self, item_identifier: ItemKey) -> None: ...
 
 
+@runtime_checkable
+class VersionedStorageProviderProtocol(Protocol):
+    """Protocol for storage providers that can tell the version of an item without reading it.
+
+    Allows the server to answer conditional state reads (`If-None-Match`) without touching the content.
+    """
+
+    async def get_file_version(self, item_identifier: ItemKey) -> str:
+        """Get an opaque version of the file - it must change whenever the content of the file changes.
+
+        Args:
+            item_identifier: The identifier of the file.
+
+        Raises:
+            FileNotFoundError: The file doesn't exist.
+        """
+        ...
+
+
+@runtime_checkable
+class ClosableProtocol(Protocol):
+    """Protocol for providers that hold resources (connections, processes, etc.) which must be released.
+
+    Providers implementing `close()` are closed when the server shuts down.
+    """
+
+    async def close(self) -> None:
+        """Release the resources held by the provider."""
+        ...
+
+
 @contextmanager
 def assume_lock_conflict_on_error(lock_id: str) -> Iterator[None]:
     try:
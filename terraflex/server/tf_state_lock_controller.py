@@ -1,15 +1,23 @@
+import asyncio
+import hashlib
 import json
+import re
+from contextlib import suppress
 from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
 
 from terraflex.server.base_state_lock_provider import (
     Data,
     LockBody,
     LockingError,
+    StaleStateError,
     StateLockProviderProtocol,
 )
+from terraflex.server.metrics import STORAGE_BYTES, cache_lookup, stack_validated, stage
 from terraflex.server.storage_provider_base import (
     ItemKey,
     LockableStorageProviderProtocol,
+    VersionedStorageProviderProtocol,
     WriteableStorageProviderProtocol,
 )
 from terraflex.server.transformation_base import (
@@ -25,67 +33,262 @@ class TFStack:
     state_file_storage_identifier: ItemKey
 
 
+# terraform writes `serial` and `lineage` at the top of the state - found without parsing the whole state
+STATE_HEADER_SIZE = 4096
+SERIAL_PATTERN = re.compile(rb'"serial":\s*(\d+)')
+LINEAGE_PATTERN = re.compile(rb'"lineage":\s*"([^"]*)"')
+
+
+@dataclass
+class StateFingerprint:
+    """What is known about the last state stored for a stack.
+
+    Attributes:
+        digest: digest of the plaintext state.
+        serial: terraform `serial` of the state.
+        lineage: terraform `lineage` of the state.
+        version: the storage version of the state - the fingerprint is trusted only while it's unchanged.
+    """
+
+    digest: bytes
+    serial: Optional[int]
+    lineage: Optional[str]
+    version: str
+
+
+def state_digest(content: bytes) -> bytes:
+    return hashlib.blake2b(content, digest_size=16).digest()
+
+
+def parse_state_header(content: bytes) -> tuple[Optional[int], Optional[str]]:
+    header = content[:STATE_HEADER_SIZE]
+    serial = SERIAL_PATTERN.search(header)
+    lineage = LINEAGE_PATTERN.search(header)
+    return (
+        int(serial.group(1)) if serial is not None else None,
+        lineage.group(1).decode() if lineage is not None else None,
+    )
+
+
+def get_serial_and_lineage(value: Data) -> tuple[Optional[int], Optional[str]]:
+    serial = value.get("serial")
+    lineage = value.get("lineage")
+    return (
+        serial if isinstance(serial, int) else None,
+        lineage if isinstance(lineage, str) else None,
+    )
+
+
 class TFStateLockController(StateLockProviderProtocol):
     def __init__(
         self,
         stacks: dict[str, TFStack],
+        stack_resolver: Optional[Callable[[str], Awaitable[TFStack]]] = None,
     ):
+        """Initialize the controller.
+
+        Args:
+            stacks: The initialized stacks.
+            stack_resolver: Builds stacks missing from `stacks` on first use - raises ValueError for undeclared stacks.
+        """
         self.stacks = stacks
+        self.stack_resolver = stack_resolver
+        self.fingerprints: dict[str, StateFingerprint] = {}
 
-    def _validate_stack(self, stack_name: str) -> TFStack:
+    async def _validate_stack(self, stack_name: str) -> TFStack:
         stack = self.stacks.get(stack_name)
         if stack is None:
-            raise ValueError(f"Undeclared stack: {stack_name}")
+            if self.stack_resolver is None:
+                raise ValueError(f"Undeclared stack: {stack_name}")
 
+            stack = await self.stack_resolver(stack_name)
+            self.stacks[stack_name] = stack
+
+        stack_validated(stack_name)
         return stack
 
-    async def get(self, stack_name: str) -> Data | None:
-        stack = self._validate_stack(stack_name)
+    async def get_version(self, stack_name: str) -> str | None:
+        """Get the version of the stored state - None when the storage provider doesn't report versions.
+
+        Raises:
+            FileNotFoundError: The state doesn't exist.
+        """
+        stack = await self._validate_stack(stack_name)
+        if not isinstance(stack.storage_driver, VersionedStorageProviderProtocol):
+            return None
+
+        with stage("storage_version"):
+            return await stack.storage_driver.get_file_version(stack.state_file_storage_identifier)
+
+    async def _get_fingerprint(self, stack_name: str) -> Optional[StateFingerprint]:
+        """Get the fingerprint of the stored state - if nothing else has written the state since it was taken."""
+        fingerprint = self.fingerprints.get(stack_name)
+        if fingerprint is None:
+            cache_lookup("state_fingerprint", hit=False)
+            return None
+
         try:
-            data = await stack.storage_driver.get_file(stack.state_file_storage_identifier)
+            version = await self.get_version(stack_name)
 
         except FileNotFoundError:
+            version = None
+
+        if version != fingerprint.version:
+            self.fingerprints.pop(stack_name, None)
+            cache_lookup("state_fingerprint", hit=False)
             return None
 
+        cache_lookup("state_fingerprint", hit=True)
+        return fingerprint
+
+    async def _remember(self, stack_name: str, content: bytes, version: Optional[str]) -> None:
+        if version is None:
+            self.fingerprints.pop(stack_name, None)
+            return
+
+        serial, lineage = parse_state_header(content)
+        self.fingerprints[stack_name] = StateFingerprint(
+            digest=state_digest(content),
+            serial=serial,
+            lineage=lineage,
+            version=version,
+        )
+
+    async def get_raw(self, stack_name: str, known_version: Optional[str] = None) -> tuple[bytes, Optional[str]] | None:
+        """Read the state - with the storage version taken before reading it.
+
+        Args:
+            stack_name: The stack to read.
+            known_version: The version the caller has just taken - saves taking it again.
+        """
+        stack = await self._validate_stack(stack_name)
+        try:
+            # taken before reading - if the state changes in between, the version is older than the content,
+            # so the fingerprint is discarded on next use and the content is never trusted to be newer
+            version = known_version if known_version is not None else await self.get_version(stack_name)
+            with stage("storage_get"):
+                data = await stack.storage_driver.get_file(stack.state_file_storage_identifier)
+
+        except FileNotFoundError:
+            self.fingerprints.pop(stack_name, None)
+            return None
+
+        STORAGE_BYTES.inc(stack_name, "read", amount=len(data))
         content = data
         for transformer in reversed(stack.data_transformers):
-            content = await transformer.transform_read_file_content(
-                stack.state_file_storage_identifier.as_string(), content
-            )
+            with stage(f"transform_read:{type(transformer).__name__}"):
+                content = await transformer.transform_read_file_content(
+                    stack.state_file_storage_identifier.as_string(), content
+                )
 
-        return json.loads(content)
+        await self._remember(stack_name, content, version)
+        return content, version
+
+    async def get(self, stack_name: str) -> Data | None:
+        result = await self.get_raw(stack_name)
+        if result is None:
+            return None
+
+        content, _ = result
+
+        with stage("json_decode"):
+            return json.loads(content)
 
     async def put(self, stack_name: str, lock_id: str, value: Data) -> None:
-        stack = self._validate_stack(stack_name)
-        await self._check_lock(stack_name, lock_id)
+        stack = await self._validate_stack(stack_name)
+        with stage("json_encode"):
+            content = json.dumps(value).encode()
+        # the lock is verified while the stored state is inspected and the new one is transformed -
+        # but it's always awaited first, so a client not holding the lock gets the locking error
+        lock_check = asyncio.create_task(self._check_lock(stack_name, lock_id))
+        try:
+            fingerprint = await self._get_fingerprint(stack_name)
+            if fingerprint is not None:
+                serial, lineage = get_serial_and_lineage(value)
+                if (
+                    serial is not None
+                    and fingerprint.serial is not None
+                    and lineage == fingerprint.lineage
+                    and serial < fingerprint.serial
+                ):
+                    await lock_check
+                    raise StaleStateError(
+                        f"State serial {serial} is older than the stored serial {fingerprint.serial}",
+                        serial=serial,
+                        stored_serial=fingerprint.serial,
+                    )
+
+                if fingerprint.digest == state_digest(content):
+                    await lock_check
+                    # the stored state is identical - nothing to transform or write
+                    return
+
+            data = await self._transform_while_checking_lock(stack, lock_check, content)
+
+        finally:
+            # a check still running is no longer needed - a failed one was already raised, or superseded
+            lock_check.cancel()
+            with suppress(asyncio.CancelledError, Exception):
+                await lock_check
+
         # lock is locked by me
 
-        data = json.dumps(value).encode()
+        with stage("storage_put"):
+            await stack.storage_driver.put_file(stack.state_file_storage_identifier, data)
+
+        STORAGE_BYTES.inc(stack_name, "write", amount=len(data))
+        await self._remember(stack_name, content, await self.get_version(stack_name))
+
+    async def _transform_for_write(self, stack: TFStack, content: bytes) -> bytes:
+        data = content
         for transformer in stack.data_transformers:
-            data = await transformer.transform_write_file_content(stack.state_file_storage_identifier.as_string(), data)
+            with stage(f"transform_write:{type(transformer).__name__}"):
+                data = await transformer.transform_write_file_content(
+                    stack.state_file_storage_identifier.as_string(), data
+                )
+
+        return data
+
+    async def _transform_while_checking_lock(
+        self, stack: TFStack, lock_check: Awaitable[LockBody], content: bytes
+    ) -> bytes:
+        """Transform the state while the lock is verified - the transformed state is discarded if the check fails."""
+        transformation = asyncio.create_task(self._transform_for_write(stack, content))
+        try:
+            await lock_check
+
+        except BaseException:
+            transformation.cancel()
+            with suppress(asyncio.CancelledError, Exception):
+                await transformation
+
+            raise
 
-        await stack.storage_driver.put_file(stack.state_file_storage_identifier, data)
+        return await transformation
 
     async def delete(self, stack_name: str, lock_id: str) -> None:
-        stack = self._validate_stack(stack_name)
+        stack = await self._validate_stack(stack_name)
         await self._check_lock(stack_name, lock_id)
         # lock is locked by me
 
-        await stack.storage_driver.delete_file(stack.state_file_storage_identifier)
+        self.fingerprints.pop(stack_name, None)
+        with stage("storage_delete"):
+            await stack.storage_driver.delete_file(stack.state_file_storage_identifier)
 
     async def read_lock(self, stack_name: str) -> LockBody | None:
-        stack = self._validate_stack(stack_name)
+        stack = await self._validate_stack(stack_name)
         if not isinstance(stack.storage_driver, LockableStorageProviderProtocol):
             raise NotImplementedError("This storage provider does not support writing")
 
         try:
-            return await stack.storage_driver.read_lock(stack.state_file_storage_identifier)
+            with stage("lock_read"):
+                return await stack.storage_driver.read_lock(stack.state_file_storage_identifier)
 
         except FileNotFoundError:
             return None
 
     async def _check_lock(self, stack_name: str, lock_id: str) -> LockBody:
-        stack = self._validate_stack(stack_name)
+        stack = await self._validate_stack(stack_name)
         if not isinstance(stack.storage_driver, LockableStorageProviderProtocol):
             # This storage provider does not support locking
             return LockBody(
@@ -108,15 +311,17 @@ class TFStateLockController(StateLockProviderProtocol):
         return data
 
     async def lock(self, stack_name: str, data: LockBody) -> None:
-        stack = self._validate_stack(stack_name)
+        stack = await self._validate_stack(stack_name)
         if not isinstance(stack.storage_driver, LockableStorageProviderProtocol):
             return
 
-        await stack.storage_driver.acquire_lock(stack.state_file_storage_identifier, data)
+        with stage("lock_acquire"):
+            await stack.storage_driver.acquire_lock(stack.state_file_storage_identifier, data)
 
     async def unlock(self, stack_name: str) -> None:
-        stack = self._validate_stack(stack_name)
+        stack = await self._validate_stack(stack_name)
         if not isinstance(stack.storage_driver, LockableStorageProviderProtocol):
             return
 
-        await stack.storage_driver.release_lock(stack.state_file_storage_identifier)
+        with stage("lock_release"):
+            await stack.storage_driver.release_lock(stack.state_file_storage_identifier)
@@ -34,7 +34,8 @@ class TransformerProtocol(Protocol):
 
         Args:
             raw_config: The raw configuration propagated from the transformer config.
-            storage_providers: All the initialized storage providers specified in the config file.
+            storage_providers: The initialized storage providers referenced in the transformer config
+                (every `provider: <name>` value in it) - keyed by name.
             manager: The dependencies manager - allows to request a binary path from.
             workdir: The data directory of terraflex - located at `~/.local/share/terraflex` -
                 can be used to manage state of the provider.
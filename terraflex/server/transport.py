@@ -0,0 +1,69 @@
+import hashlib
+import pathlib
+import socket
+
+SOCKETS_DIR_NAME = "sockets"
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    """Bind a TCP socket before the server starts - port 0 picks a free ephemeral port."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    try:
+        sock.bind((host, port))
+
+    except OSError:
+        sock.close()
+        raise
+
+    sock.set_inheritable(True)
+    return sock
+
+
+def project_id(project_dir: pathlib.Path) -> str:
+    """Short identifier of a project directory - for the files kept per project in the state directory."""
+    return hashlib.blake2b(str(project_dir.resolve()).encode(), digest_size=8).hexdigest()
+
+
+def project_socket_path(state_dir: pathlib.Path, project_dir: pathlib.Path) -> pathlib.Path:
+    """The unix socket of a project's server - one per project directory.
+
+    Named by the project id, socket paths are limited to ~100 characters.
+    """
+    return state_dir / SOCKETS_DIR_NAME / f"{project_id(project_dir)}.sock"
+
+
+def unix_socket_in_use(path: pathlib.Path) -> bool:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(str(path))
+
+        except (ConnectionRefusedError, FileNotFoundError):
+            return False
+
+    return True
+
+
+def bind_unix_socket(path: pathlib.Path) -> socket.socket:
+    """Bind a unix socket only the current user can connect to.
+
+    A socket file left behind by a server that is gone is replaced - raises `FileExistsError` if a server still uses it.
+    """
+    path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    if path.is_socket():
+        if unix_socket_in_use(path):
+            raise FileExistsError(f"Socket is in use by another server: {path}")
+
+        path.unlink()
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.bind(str(path))
+        path.chmod(0o600)
+
+    except OSError:
+        sock.close()
+        raise
+
+    sock.set_inheritable(True)
+    return sock
@@ -1,6 +1,16 @@
 import asyncio
 import pathlib
-from typing import Collection, Mapping, Optional
+from contextlib import AbstractAsyncContextManager, nullcontext, suppress
+from typing import Any, AsyncIterable, AsyncIterator, Collection, Mapping, Optional
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+async def iter_chunks(content: bytes, chunk_size: int = STREAM_CHUNK_SIZE) -> AsyncIterator[memoryview]:
+    """Split content into chunks without copying it - the chunks are views of `content`."""
+    view = memoryview(content)
+    for offset in range(0, len(view), chunk_size):
+        yield view[offset : offset + chunk_size]
 
 
 class BinaryController:
@@ -9,28 +19,121 @@ class BinaryController:
         binary_location: pathlib.Path,
         cwd: Optional[pathlib.Path] = None,
         env: Optional[Mapping[str, str]] = None,
+        max_concurrency: Optional[int] = None,
     ):
         self.binary_location = binary_location
         self.cwd = cwd
         self.env = env or {}
+        self.max_concurrency = max_concurrency
+        # caps the number of processes of this binary running at the same time
+        self._semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+
+    def __getstate__(self) -> dict[str, Any]:
+        state = self.__dict__.copy()
+        del state["_semaphore"]
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency) if self.max_concurrency else None
+
+    def _concurrency_slot(self) -> AbstractAsyncContextManager[Any]:
+        return self._semaphore if self._semaphore is not None else nullcontext()
 
     async def _execute_command(
         self,
         args: Collection[str | bytes],
         stdin: Optional[bytes] = None,
+        pass_fds: Collection[int] = (),
     ) -> bytes:
-        proc = await asyncio.create_subprocess_exec(
-            self.binary_location,
-            *args,
-            cwd=self.cwd,
-            stdin=asyncio.subprocess.PIPE,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-            env=self.env,
-        )
-
-        stdout, stderr = await proc.communicate(stdin)
+        async with self._concurrency_slot():
+            proc = await asyncio.create_subprocess_exec(
+                self.binary_location,
+                *args,
+                cwd=self.cwd,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                env=self.env,
+                pass_fds=pass_fds,
+            )
+
+            stdout, stderr = await proc.communicate(stdin)
+
         if proc.returncode != 0:
             raise RuntimeError(f"Failed to execute binary: {stderr}")
 
         return stdout
+
+    async def _execute_command_stream(
+        self,
+        args: Collection[str | bytes],
+        stdin: AsyncIterable[bytes | memoryview],
+        pass_fds: Collection[int] = (),
+    ) -> AsyncIterator[bytes]:
+        """Execute the binary - feeding stdin from `stdin` chunks and yielding stdout chunks as they arrive.
+
+        Writing waits for the process to consume the pipe (`drain`), and stdout is read only as fast as the
+        caller consumes it - so the pipes buffer at most a few chunks, whatever the size of the content.
+        Memory is bounded end to end only if `stdin` produces its chunks lazily and the caller doesn't collect
+        the output.
+        """
+        async with self._concurrency_slot():
+            proc = await asyncio.create_subprocess_exec(
+                self.binary_location,
+                *args,
+                cwd=self.cwd,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                env=self.env,
+                pass_fds=pass_fds,
+                limit=STREAM_CHUNK_SIZE,
+            )
+            assert proc.stdin is not None and proc.stdout is not None and proc.stderr is not None
+
+            async def write_stdin() -> None:
+                assert proc.stdin is not None
+                try:
+                    async for chunk in stdin:
+                        proc.stdin.write(chunk)
+                        await proc.stdin.drain()
+
+                except (BrokenPipeError, ConnectionResetError):
+                    # the process exited before reading all of its input - the exit code tells why
+                    return
+
+                except BaseException:
+                    # the input failed - the process is stopped, so the output ends instead of waiting for more input
+                    if proc.returncode is None:
+                        proc.kill()
+
+                    raise
+
+                finally:
+                    proc.stdin.close()
+
+                with suppress(BrokenPipeError, ConnectionResetError):
+                    await proc.stdin.wait_closed()
+
+            writer = asyncio.create_task(write_stdin())
+            stderr_reader = asyncio.create_task(proc.stderr.read())
+            try:
+                while chunk := await proc.stdout.read(STREAM_CHUNK_SIZE):
+                    yield chunk
+
+                # raises the error of the input - if it failed
+                await writer
+                stderr = await stderr_reader
+                await proc.wait()
+
+            finally:
+                if proc.returncode is None:
+                    proc.kill()
+                    await proc.wait()
+
+                writer.cancel()
+                stderr_reader.cancel()
+
+        if proc.returncode != 0:
+            raise RuntimeError(f"Failed to execute binary: {stderr}")
@@ -1,3 +1,4 @@
+import asyncio
 import pathlib
 from typing import Collection
 
@@ -18,9 +19,12 @@ class DependenciesManager:
         self._is_initialized = False
 
     async def initialize(self) -> None:
-        for downloader in self.dependencies:
-            results = await downloader.ensure_installed(self.dest_folder)
+        # dependencies are independent of each other - install them concurrently
+        all_results = await asyncio.gather(
+            *(downloader.ensure_installed(self.dest_folder) for downloader in self.dependencies)
+        )
 
+        for results in all_results:
             for name, location in results.items():
                 self._resolved_dependencies[name] = location
 
@@ -1,9 +1,51 @@
+import functools
+import hashlib
+import logging
+import os
+import pathlib
+import sys
 from dataclasses import dataclass
-from importlib.metadata import entry_points
-from typing import Generic, Type, TypeVar
-from venv import logger
+from importlib.metadata import EntryPoint, entry_points
+from typing import Any, Callable, Generic, Iterator, Mapping, Optional, Type, TypeVar
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
 
 T = TypeVar("T")
+V = TypeVar("V")
+
+PLUGINS_CACHE_FILE_NAME = "plugins-cache.json"
+PLUGINS_CACHE_VERSION = 1
+
+
+class PluginsCache(BaseModel):
+    """Entry points cached on disk - valid while the installed distributions are unchanged.
+
+    Attributes:
+        version: The version of the cache format.
+        fingerprint: The fingerprint of the installed distributions the entry points were scanned with.
+        groups: Entry points by group - name to object reference (`module:attr`).
+    """
+
+    version: int
+    fingerprint: str
+    groups: dict[str, dict[str, str]] = {}
+
+
+def _read_plugins_cache(cache_file: pathlib.Path, fingerprint: str) -> PluginsCache:
+    """Read the cache - a missing, malformed or outdated cache is a miss, and an empty cache is returned."""
+    try:
+        cache = PluginsCache.model_validate_json(cache_file.read_bytes())
+
+    except (OSError, ValueError):
+        # pydantic's ValidationError is a ValueError
+        cache = None
+
+    if cache is None or cache.version != PLUGINS_CACHE_VERSION or cache.fingerprint != fingerprint:
+        return PluginsCache(version=PLUGINS_CACHE_VERSION, fingerprint=fingerprint)
+
+    return cache
 
 
 @dataclass
@@ -18,35 +60,136 @@ class Provider(Generic[T]):
     model_class: Type[T]
 
 
-def get_providers_instances(provider_type: Type[T], entrypoint_group: str) -> dict[str, ProviderInstance[T]]:
-    raw_providers = entry_points(group=entrypoint_group)
+@functools.cache
+def installed_distributions_fingerprint() -> str:
+    """Fingerprint of the installed distributions - changes when a distribution is installed, upgraded or removed.
 
-    providers_instances = {provider.name: provider.load() for provider in raw_providers}
-    all_providers: dict[str, ProviderInstance[T]] = {}
+    Only the metadata directory names and modification times are used - nothing is read or imported.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for path in sys.path:
+        try:
+            with os.scandir(path or ".") as entries:
+                names = sorted(entry.name for entry in entries if entry.name.endswith((".dist-info", ".egg-info")))
 
-    for provider_name, provider_instance in providers_instances.items():
-        # check that provider_class is subclass of provider
-        if not isinstance(provider_instance, provider_type):
-            logger.warning(f"Provider {provider_name} is not an instance of {provider_type}")
+        except OSError:
             continue
 
-        all_providers[provider_name] = ProviderInstance(provider_name, provider_instance)
+        for name in names:
+            try:
+                mtime = os.stat(os.path.join(path or ".", name)).st_mtime_ns
+
+            except OSError:
+                continue
+
+            digest.update(f"{path}\0{name}\0{mtime}\n".encode())
+
+    return digest.hexdigest()
+
+
+def _scan_entry_points(entrypoint_group: str) -> dict[str, str]:
+    return {entry_point.name: entry_point.value for entry_point in entry_points(group=entrypoint_group)}
+
+
+def load_entry_points(entrypoint_group: str, cache_dir: Optional[pathlib.Path] = None) -> dict[str, str]:
+    """Get the entry points of a group - name to object reference (`module:attr`).
 
-    return all_providers
+    When `cache_dir` is given, the entry points are cached in it until the installed distributions change.
+    """
+    if cache_dir is None:
+        return _scan_entry_points(entrypoint_group)
 
+    cache_file = cache_dir / PLUGINS_CACHE_FILE_NAME
+    cache = _read_plugins_cache(cache_file, installed_distributions_fingerprint())
+    groups = cache.groups
+    if entrypoint_group in groups:
+        return groups[entrypoint_group]
 
-def get_providers(provider_type: Type[T], entrypoint_group: str) -> dict[str, Provider[T]]:
-    raw_providers = entry_points(group=entrypoint_group)
+    groups[entrypoint_group] = _scan_entry_points(entrypoint_group)
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        temp_file = cache_file.with_name(f".{cache_file.name}.{os.getpid()}.tmp")
+        temp_file.write_text(cache.model_dump_json())
+        temp_file.replace(cache_file)
 
-    providers_classes = {provider.name: provider.load() for provider in raw_providers}
-    all_providers: dict[str, Provider[T]] = {}
+    except OSError as exc:
+        logger.warning(f"Failed to write plugins cache {cache_file}: {exc}")
 
-    for provider_name, provider_class in providers_classes.items():
+    return groups[entrypoint_group]
+
+
+class LazyPluginRegistry(Mapping[str, V]):
+    """Plugins of an entrypoint group - a plugin is imported only when it's looked up by name.
+
+    Plugins that don't pass `validate` are skipped with a warning - as if they were not registered.
+    Iterating the registry imports every plugin.
+    """
+
+    def __init__(
+        self,
+        entrypoint_group: str,
+        entries: dict[str, str],
+        validate: Callable[[str, Any], Optional[V]],
+    ) -> None:
+        self.entrypoint_group = entrypoint_group
+        self.entries = entries
+        self.validate = validate
+        self._loaded: dict[str, Optional[V]] = {}
+
+    def _load(self, name: str) -> Optional[V]:
+        if name not in self._loaded:
+            entry_point = EntryPoint(name=name, value=self.entries[name], group=self.entrypoint_group)
+            self._loaded[name] = self.validate(name, entry_point.load())
+
+        return self._loaded[name]
+
+    def __getitem__(self, name: str) -> V:
+        if name not in self.entries:
+            raise KeyError(name)
+
+        plugin = self._load(name)
+        if plugin is None:
+            raise KeyError(name)
+
+        return plugin
+
+    def __contains__(self, name: object) -> bool:
+        return isinstance(name, str) and name in self.entries and self._load(name) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        return (name for name in list(self.entries) if self._load(name) is not None)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+def get_providers_instances(
+    provider_type: Type[T],
+    entrypoint_group: str,
+    cache_dir: Optional[pathlib.Path] = None,
+) -> Mapping[str, ProviderInstance[T]]:
+    def validate(provider_name: str, provider_instance: Any) -> Optional[ProviderInstance[T]]:
+        # check that provider_instance is instance of provider
+        if not isinstance(provider_instance, provider_type):
+            logger.warning(f"Provider {provider_name} is not an instance of {provider_type}")
+            return None
+
+        return ProviderInstance(provider_name, provider_instance)
+
+    return LazyPluginRegistry(entrypoint_group, load_entry_points(entrypoint_group, cache_dir), validate)
+
+
+def get_providers(
+    provider_type: Type[T],
+    entrypoint_group: str,
+    cache_dir: Optional[pathlib.Path] = None,
+) -> Mapping[str, Provider[T]]:
+    def validate(provider_name: str, provider_class: Any) -> Optional[Provider[T]]:
         # check that provider_class is subclass of provider
         if not issubclass(provider_class, provider_type):
             logger.warning(f"Provider {provider_name} is not a subclass of {provider_type}")
-            continue
+            return None
 
-        all_providers[provider_name] = Provider(provider_name, provider_class)
+        return Provider(provider_name, provider_class)
 
-    return all_providers
+    return LazyPluginRegistry(entrypoint_group, load_entry_points(entrypoint_group, cache_dir), validate)
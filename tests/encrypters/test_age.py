@@ -1,5 +1,12 @@
+import asyncio
+import os
+import pickle
+
 import pytest
 
+from terraflex.plugins.encryption_transformation.age.controller import AgeController
+from terraflex.utils.binary_controller import STREAM_CHUNK_SIZE, iter_chunks
+
 
 @pytest.mark.anyio
 async def test_encrypt_decrypt(age_controller):
@@ -8,3 +15,84 @@ async def test_encrypt_decrypt(age_controller):
     decrypted = await age_controller.decrypt("test", encrypted)
 
     assert decrypted == to_encyrpt
+
+
+@pytest.mark.anyio
+async def test_identity_materialized_once(tmp_path):
+    # stand-in for the age binary - prints the identity file it was given with `-i`
+    fake_age = tmp_path / "age"
+    fake_age.write_text('#!/bin/sh\ncat "$3"\n')
+    fake_age.chmod(0o755)
+
+    controller = AgeController(binary_location=fake_age, private_key=b"AGE-SECRET-KEY-1TEST", public_key=b"age1test")
+    assert await controller.decrypt("test", b"") == b"AGE-SECRET-KEY-1TEST"
+    identity_file = controller.identity_file
+    assert await controller.decrypt("test", b"") == b"AGE-SECRET-KEY-1TEST"
+    assert controller.identity_file is identity_file
+
+    await controller.close()
+
+
+@pytest.mark.anyio
+async def test_controller_is_picklable(tmp_path):
+    fake_age = tmp_path / "age"
+    fake_age.write_text('#!/bin/sh\ncat "$3"\n')
+    fake_age.chmod(0o755)
+
+    controller = AgeController(
+        binary_location=fake_age,
+        private_key=b"AGE-SECRET-KEY-1TEST",
+        public_key=b"age1test",
+        max_concurrency=2,
+    )
+    assert await controller.decrypt("test", b"") == b"AGE-SECRET-KEY-1TEST"
+
+    # sent to encryption worker processes - the identity file and semaphore are recreated there
+    restored = pickle.loads(pickle.dumps(controller))
+    assert await restored.decrypt("test", b"") == b"AGE-SECRET-KEY-1TEST"
+
+    await controller.close()
+    await restored.close()
+
+
+@pytest.mark.anyio
+async def test_stream_large_content(tmp_path):
+    # stand-in for the age binary - copies stdin to stdout
+    fake_age = tmp_path / "age"
+    fake_age.write_text("#!/bin/sh\ncat\n")
+    fake_age.chmod(0o755)
+
+    controller = AgeController(binary_location=fake_age, private_key=b"AGE-SECRET-KEY-1TEST", public_key=b"age1test")
+    content = os.urandom(1024 * 1024)
+    chunks = [chunk async for chunk in controller.encrypt_stream(iter_chunks(content))]
+    assert b"".join(chunks) == content
+    assert max(len(chunk) for chunk in chunks) <= STREAM_CHUNK_SIZE
+
+    failing_age = tmp_path / "failing-age"
+    failing_age.write_text("#!/bin/sh\necho failed >&2\nexit 1\n")
+    failing_age.chmod(0o755)
+    controller = AgeController(binary_location=failing_age, private_key=b"", public_key=b"age1test")
+    with pytest.raises(RuntimeError, match="failed"):
+        await controller.encrypt("test", content)
+
+
+@pytest.mark.anyio
+async def test_stream_failing_input(tmp_path):
+    fake_age = tmp_path / "age"
+    fake_age.write_text("#!/bin/sh\ncat\n")
+    fake_age.chmod(0o755)
+    controller = AgeController(
+        binary_location=fake_age, private_key=b"AGE-SECRET-KEY-1TEST", public_key=b"age1test", max_concurrency=1
+    )
+
+    async def failing_input():
+        yield b"partial input"
+        raise OSError("input failed")
+
+    async def encrypt() -> list[bytes]:
+        return [chunk async for chunk in controller.encrypt_stream(failing_input())]
+
+    # the error of the input is raised instead of waiting for the rest of it - and the process slot is released
+    for _ in range(2):
+        with pytest.raises(OSError, match="input failed"):
+            await asyncio.wait_for(encrypt(), timeout=5)
@@ -0,0 +1,56 @@
+import pytest
+
+from terraflex.plugins.encryption_transformation.age.controller import AgeController
+from terraflex.plugins.encryption_transformation.age.native import (
+    CHUNK_SIZE,
+    AgeNativeController,
+    bech32_decode,
+    bech32_encode,
+    generate_identity,
+)
+
+
+def test_bech32_vector():
+    # valid test vector from BIP-173
+    encoded = "abcdef1qpzry9x8gf2tvdw0s3jn54khce6mua7lmqqqxw"
+    hrp, data = bech32_decode(encoded)
+
+    assert hrp == "abcdef"
+    assert bech32_encode(hrp, data) == encoded
+
+
+@pytest.mark.parametrize("size", [0, 1, CHUNK_SIZE, CHUNK_SIZE + 1, 3 * CHUNK_SIZE])
+def test_encrypt_decrypt(size):
+    controller = AgeNativeController(private_key=generate_identity())
+    to_encrypt = bytes(i % 251 for i in range(size))
+
+    encrypted = controller.encrypt_bytes(to_encrypt)
+    assert encrypted.startswith(b"age-encryption.org/v1\n-> X25519 ")
+    assert controller.decrypt_bytes(encrypted) == to_encrypt
+
+
+def test_tampered_payload():
+    controller = AgeNativeController(private_key=generate_identity())
+    encrypted = bytearray(controller.encrypt_bytes(b"hello world"))
+    encrypted[-1] ^= 1
+
+    with pytest.raises(ValueError):
+        controller.decrypt_bytes(bytes(encrypted))
+
+
+def test_wrong_identity():
+    controller = AgeNativeController(private_key=generate_identity())
+    other = AgeNativeController(private_key=generate_identity())
+
+    with pytest.raises(ValueError):
+        other.decrypt_bytes(controller.encrypt_bytes(b"hello world"))
+
+
+@pytest.mark.anyio
+async def test_binary_interoperability(age_controller: AgeController):
+    native = AgeNativeController(private_key=age_controller.private_key)
+    assert native.public_key == age_controller.public_key
+
+    to_encrypt = b"hello world" * CHUNK_SIZE
+    assert await age_controller.decrypt("test", await native.encrypt("test", to_encrypt)) == to_encrypt
+    assert await native.decrypt("test", await age_controller.encrypt("test", to_encrypt)) == to_encrypt
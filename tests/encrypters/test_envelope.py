@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+from cryptography.exceptions import InvalidTag
+
+from terraflex.plugins.encryption_transformation.envelope import EnvelopeEncryption
+
+
+class CountingProvider:
+    """Reversible stand-in for an asymmetric provider - counts how many times it runs."""
+
+    def __init__(self):
+        self.encrypted = 0
+        self.decrypted = 0
+
+    async def encrypt(self, file_name: str, content: bytes) -> bytes:
+        self.encrypted += 1
+        return b"wrapped:" + content[::-1]
+
+    async def decrypt(self, file_name: str, content: bytes) -> bytes:
+        self.decrypted += 1
+        return content.removeprefix(b"wrapped:")[::-1]
+
+
+@pytest.mark.anyio
+async def test_data_key_is_wrapped_once():
+    key_provider = CountingProvider()
+    envelope = EnvelopeEncryption(key_provider, rotate_after_writes=3)
+
+    states = [f"state {i}".encode() for i in range(5)]
+    encrypted = [await envelope.encrypt("test", state) for state in states]
+    # rotated after 3 writes
+    assert key_provider.encrypted == 2
+
+    # a fresh instance has nothing cached - every distinct data key is unwrapped once
+    reader = EnvelopeEncryption(key_provider)
+    decrypted = await asyncio.gather(*(reader.decrypt("test", content) for content in encrypted))
+    assert decrypted == states
+    assert key_provider.decrypted == 2
+
+
+@pytest.mark.anyio
+async def test_legacy_content_and_tampering():
+    key_provider = CountingProvider()
+    envelope = EnvelopeEncryption(key_provider)
+
+    legacy = await key_provider.encrypt("test", b"legacy state")
+    assert await envelope.decrypt("test", legacy) == b"legacy state"
+
+    encrypted = bytearray(await envelope.encrypt("test", b"state"))
+    encrypted[-1] ^= 1
+    with pytest.raises(InvalidTag):
+        await envelope.decrypt("test", bytes(encrypted))
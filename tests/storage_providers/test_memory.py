@@ -0,0 +1,34 @@
+import pytest
+
+from terraflex.plugins.memory_storage_provider.memory_storage_provider import MemoryStorageProvider
+from terraflex.server.base_state_lock_provider import LockBody, LockingError
+
+
+@pytest.mark.anyio
+async def test_lock_compare_and_set():
+    provider = MemoryStorageProvider()
+    key = provider.validate_key({"path": "main.tfstate"})
+    lock = LockBody(ID="first", Operation="apply", Who="me", Version="1", Created="2000-01-01T00:00:00Z")
+
+    await provider.acquire_lock(key, lock)
+    with pytest.raises(LockingError) as exc:
+        await provider.acquire_lock(key, lock.model_copy(update={"ID": "second"}))
+
+    assert exc.value.lock_id == "first"
+    await provider.release_lock(key)
+    with pytest.raises(FileNotFoundError):
+        await provider.read_lock(key)
+
+
+@pytest.mark.anyio
+async def test_snapshot_restore(tmp_path):
+    snapshot_path = tmp_path / "snapshot.json"
+    provider = MemoryStorageProvider(snapshot_path=snapshot_path)
+    key = provider.validate_key({"path": "main.tfstate"})
+    await provider.put_file(key, b"\x00binary state")
+    await provider.close()
+
+    assert snapshot_path.stat().st_mode & 0o777 == 0o600
+
+    restored = MemoryStorageProvider(snapshot_path=snapshot_path)
+    assert await restored.get_file(key) == b"\x00binary state"
@@ -0,0 +1,60 @@
+import pytest
+
+from terraflex.plugins.sqlite_storage_provider.sqlite_storage_provider import SQLiteStorageProvider
+from terraflex.server.base_state_lock_provider import LockBody, LockingError
+
+
+def build_lock(lock_id: str) -> LockBody:
+    return LockBody(ID=lock_id, Operation="apply", Who="me", Version="1", Created="2000-01-01T00:00:00Z")
+
+
+@pytest.mark.anyio
+async def test_put_get_delete(tmp_path):
+    provider = SQLiteStorageProvider(database=tmp_path / "terraflex.db")
+    key = provider.validate_key({"path": "main.tfstate"})
+
+    with pytest.raises(FileNotFoundError):
+        await provider.get_file(key)
+
+    await provider.put_file(key, b"hello world")
+    assert await provider.get_file(key) == b"hello world"
+    version = await provider.get_file_version(key)
+    await provider.put_file(key, b"hello again")
+    assert await provider.get_file_version(key) != version
+
+    await provider.delete_file(key)
+    with pytest.raises(FileNotFoundError):
+        await provider.get_file(key)
+
+    await provider.close()
+
+
+@pytest.mark.anyio
+async def test_lock_conflict(tmp_path):
+    provider = SQLiteStorageProvider(database=tmp_path / "terraflex.db")
+    other_process = SQLiteStorageProvider(database=tmp_path / "terraflex.db")
+    key = provider.validate_key({"path": "main.tfstate"})
+
+    await provider.acquire_lock(key, build_lock("first"))
+    with pytest.raises(LockingError) as exc:
+        await other_process.acquire_lock(key, build_lock("second"))
+
+    assert exc.value.lock_id == "first"
+    assert (await other_process.read_lock(key)).ID == "first"
+
+    await provider.release_lock(key)
+    await other_process.acquire_lock(key, build_lock("second"))
+    assert (await provider.read_lock(key)).ID == "second"
+
+
+@pytest.mark.anyio
+async def test_keep_versions(tmp_path):
+    provider = SQLiteStorageProvider(database=tmp_path / "terraflex.db", keep_versions=2)
+    key = provider.validate_key({"path": "main.tfstate"})
+
+    for i in range(5):
+        await provider.put_file(key, f"state {i}".encode())
+
+    assert await provider.get_file(key) == b"state 4"
+    assert await provider.get_previous_versions(key) == [4, 3]
+    assert await provider.get_file_at_version(key, 3) == b"state 2"
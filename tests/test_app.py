@@ -1,6 +1,11 @@
+import asyncio
+
 import pytest
 
+from terraflex.plugins.encryption_transformation.age.native import AgeNativeController, generate_identity
+from terraflex.plugins.encryption_transformation.age.provider import AgeEncryptionProvider
 from terraflex.plugins.encryption_transformation.encryption_transformation_provider import EncryptionTransformation
+from terraflex.plugins.encryption_transformation.worker_pool import EncryptionWorkerPool
 
 
 @pytest.mark.anyio
@@ -13,3 +18,23 @@ async def test_app(age_controller):
     result = await transformation.transform_write_file_content("test", to_encrypt)
     decrypted = await transformation.transform_read_file_content("test", result)
     assert decrypted == to_encrypt
+
+
+@pytest.mark.anyio
+async def test_worker_pool():
+    encryption_provider = AgeEncryptionProvider(controller=AgeNativeController(private_key=generate_identity()))
+    transformation = EncryptionTransformation(
+        encryption_provider=encryption_provider,
+        worker_pool=EncryptionWorkerPool(encryption_provider, workers=2, max_in_flight=2),
+    )
+
+    to_encrypt = [f"state {i}".encode() for i in range(8)]
+    results = await asyncio.gather(
+        *(transformation.transform_write_file_content("test", content) for content in to_encrypt)
+    )
+    decrypted = await asyncio.gather(
+        *(transformation.transform_read_file_content("test", content) for content in results)
+    )
+    assert decrypted == to_encrypt
+
+    await transformation.close()
@@ -0,0 +1,74 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+# modules of the server and the wizard - none of them is needed to parse the command line
+HEAVY_MODULES = [
+    "fastapi",
+    "starlette",
+    "uvicorn",
+    "httpx",
+    "questionary",
+    "yaml",
+    "pydantic",
+    "pydantic_settings",
+]
+# import time of the cli on top of typer's own - in seconds, generous to stay stable on slow machines
+IMPORT_TIME_BUDGET = 0.5
+
+LOADED_MODULES_SCRIPT = """
+import json
+import sys
+
+import typer.main
+
+from terraflex.cli.cli import app
+
+command = typer.main.get_command(app)
+if sys.argv[1:]:
+    command.get_command(None, sys.argv[1])
+
+print(json.dumps(sorted(sys.modules)))
+"""
+
+
+def _cumulative_import_time(import_time_output: str, module: str) -> float:
+    for line in import_time_output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+
+        # import time: self [us] | cumulative [us] | indented module name
+        _, cumulative, name = line.split("|")
+        if name.strip() == module:
+            return int(cumulative) / 1_000_000
+
+    raise AssertionError(f"{module} was not imported")
+
+
+@pytest.mark.parametrize("command", [None, "init", "start", "print-bindings", "wrap", "daemon"])
+def test_cli_does_not_import_heavy_modules(command):
+    args = [command] if command else []
+    result = subprocess.run(
+        [sys.executable, "-c", LOADED_MODULES_SCRIPT, *args],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    loaded = set(json.loads(result.stdout))
+
+    assert [module for module in HEAVY_MODULES if module in loaded] == []
+
+
+def test_cli_import_time():
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import terraflex.cli.cli"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    cli_import_time = _cumulative_import_time(result.stderr, "terraflex.cli.cli")
+    typer_import_time = _cumulative_import_time(result.stderr, "typer")
+    assert cli_import_time - typer_import_time < IMPORT_TIME_BUDGET
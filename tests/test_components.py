@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+from terraflex.plugins.memory_storage_provider.memory_storage_provider import MemoryStorageProvider
+from terraflex.server.components import ComponentsBuilder, find_storage_dependencies
+from terraflex.server.config import ConfigFile, StackConfig, StackMatcher
+from terraflex.server.tf_state_lock_controller import TFStateLockController
+from terraflex.utils.dependency_manager import DependenciesManager
+from terraflex.utils.plugins import Provider
+
+CONFIG = ConfigFile.model_validate(
+    {
+        "storage_providers": {
+            "first": {"type": "slow"},
+            "second": {"type": "slow"},
+            "unused": {"type": "slow"},
+        },
+        "transformers": {},
+        "stacks": {
+            "first-stack": {"state_storage": {"provider": "first", "params": {"path": "first"}}, "transformers": []},
+            "second-stack": {"state_storage": {"provider": "second", "params": {"path": "second"}}, "transformers": []},
+        },
+    }
+)
+
+
+class SlowStorageProvider(MemoryStorageProvider):
+    started: asyncio.Event
+    builds = 0
+
+    @classmethod
+    async def from_config(cls, raw_config, *, manager, workdir):
+        cls.builds += 1
+        # every provider waits for all of them to start - building them one by one would never finish
+        if cls.builds == len(CONFIG.storage_providers):
+            cls.started.set()
+
+        await asyncio.wait_for(cls.started.wait(), timeout=1)
+        return cls()
+
+
+def test_find_storage_dependencies():
+    raw_config = {"key_type": "age", "import_from_storage": {"provider": "envvar", "params": {"provider": "other"}}}
+    assert find_storage_dependencies(raw_config, ["envvar", "local"]) == ["envvar"]
+
+
+@pytest.mark.anyio
+async def test_components_built_concurrently_and_once(tmp_path):
+    SlowStorageProvider.started = asyncio.Event()
+    SlowStorageProvider.builds = 0
+    builder = ComponentsBuilder(CONFIG, DependenciesManager([], dest_folder=tmp_path), workdir=tmp_path)
+    builder.storage_provider_types = {"slow": Provider("slow", SlowStorageProvider)}
+
+    stacks = await builder.build_all()
+    assert stacks.keys() == {"first-stack", "second-stack"}
+    assert SlowStorageProvider.builds == 3
+    assert stacks["first-stack"].storage_driver is await builder.storage_provider("first")
+    assert ("stack", "first-stack") in builder.timings
+
+
+@pytest.mark.anyio
+async def test_lazy_stack_resolution(tmp_path):
+    SlowStorageProvider.started = asyncio.Event()
+    SlowStorageProvider.started.set()
+    SlowStorageProvider.builds = 0
+    builder = ComponentsBuilder(CONFIG, DependenciesManager([], dest_folder=tmp_path), workdir=tmp_path)
+    builder.storage_provider_types = {"slow": Provider("slow", SlowStorageProvider)}
+    builder.validate()
+    controller = TFStateLockController(stacks={}, stack_resolver=builder.stack)
+
+    # concurrent first uses share a single build - and only the stack's own provider is built
+    await asyncio.gather(*(controller.get("first-stack") for _ in range(5)))
+    assert SlowStorageProvider.builds == 1
+    assert controller.stacks.keys() == {"first-stack"}
+
+    with pytest.raises(ValueError, match="Undeclared stack"):
+        await controller.get("missing-stack")
+
+
+def test_stack_matcher():
+    stack = {"state_storage": {"provider": "first", "params": {"path": "envs/{name}.tfstate"}}, "transformers": []}
+    matcher = StackMatcher(
+        {
+            "env-main": StackConfig.model_validate({**stack, "state_storage": {"provider": "second"}}),
+            "env-*": StackConfig.model_validate(stack),
+            "e?v-*": StackConfig.model_validate({**stack, "state_storage": {"provider": "second"}}),
+        }
+    )
+
+    assert matcher.match("env-main").state_storage.provider == "second"
+    assert matcher.match("env-dev").state_storage.params == {"path": "envs/env-dev.tfstate"}
+    assert matcher.match("erv-dev").state_storage.provider == "second"
+    for name in ["env-*", "env-../other", "prod"]:
+        assert matcher.match(name) is None
+
+
+@pytest.mark.anyio
+async def test_stack_templates_resolved_on_demand(tmp_path):
+    config = ConfigFile.model_validate(
+        {
+            "storage_providers": {"states": {"type": "memory"}},
+            "transformers": {},
+            "stacks": {
+                "env-*": {"state_storage": {"provider": "states", "params": {"path": "{name}"}}, "transformers": []}
+            },
+        }
+    )
+    builder = ComponentsBuilder(config, DependenciesManager([], dest_folder=tmp_path), workdir=tmp_path)
+    assert await builder.build_all() == {}
+
+    controller = TFStateLockController(stacks={}, stack_resolver=builder.stack)
+    stack = await controller._validate_stack("env-dev")
+    assert stack.state_file_storage_identifier.as_string() == "env-dev"
+    assert await controller._validate_stack("env-dev") is stack
+
+    with pytest.raises(ValueError, match="Undeclared stack"):
+        await controller._validate_stack("prod")
@@ -0,0 +1,80 @@
+import dataclasses
+import json
+import socket
+import threading
+import time
+import urllib.request
+
+import pytest
+from fastapi import FastAPI
+from uvicorn import Config
+
+from terraflex.cli.daemon import DaemonInfo, config_digest, find_daemon, get_daemon_paths
+from terraflex.cli.server_process import IdleTimeoutServer
+from terraflex.server.config import get_settings
+from terraflex.server.transport import bind_socket
+
+
+@pytest.fixture
+def state_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("STATE_DIR", str(tmp_path / "state"))
+    get_settings.cache_clear()
+    yield tmp_path / "state"
+    get_settings.cache_clear()
+
+
+def test_idle_timeout_server_exits_when_idle():
+    app = FastAPI()
+
+    @app.get("/ready")
+    def ready() -> str:
+        return "Ready"
+
+    sock = bind_socket("127.0.0.1", 0)
+    started = threading.Event()
+    server = IdleTimeoutServer(Config(app=app, log_level="critical"), on_started=started.set, idle_timeout=0.5)
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    assert started.wait(10)
+
+    # requests keep the server alive
+    for _ in range(4):
+        with urllib.request.urlopen(f"http://127.0.0.1:{sock.getsockname()[1]}/ready") as response:
+            assert response.read() == b'"Ready"'
+
+        time.sleep(0.2)
+
+    assert thread.is_alive()
+    thread.join(5)
+    assert not thread.is_alive()
+    sock.close()
+
+
+def test_find_daemon(state_dir, tmp_path):
+    project_dir = tmp_path / "project"
+    project_dir.mkdir()
+    (project_dir / "terraflex.yaml").write_text("version: '2'\n")
+    assert find_daemon(project_dir) is None
+
+    paths = get_daemon_paths(project_dir)
+    paths.state_file.parent.mkdir(parents=True)
+    info = DaemonInfo(
+        pid=1,
+        project_dir=str(project_dir),
+        socket_path=str(tmp_path / "daemon.sock"),
+        log_file=str(paths.log_file),
+        config_digest=config_digest(project_dir),
+        idle_timeout=0,
+        started_at=time.time(),
+    )
+    paths.state_file.write_text(json.dumps(dataclasses.asdict(info)))
+    # the state of a daemon which is gone is ignored
+    assert find_daemon(project_dir) is None
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as listener:
+        listener.bind(info.socket_path)
+        listener.listen()
+        assert find_daemon(project_dir) == info
+
+    (project_dir / "terraflex.yaml").write_text("version: '2'\nstacks: {}\n")
+    assert config_digest(project_dir) != info.config_digest
@@ -0,0 +1,75 @@
+import httpx
+import pytest
+
+from terraflex.plugins.memory_storage_provider.memory_storage_provider import (
+    MemoryStorageProvider,
+    MemoryStorageProviderItemIdentifier,
+)
+from terraflex.server.app import app, state
+from terraflex.server.metrics import LOCK_CONFLICTS, OPERATION_DURATION, STAGE_DURATION, UNKNOWN_STACK, Registry
+from terraflex.server.tf_state_lock_controller import TFStack, TFStateLockController
+
+LOCK = {"ID": "lock-id", "Operation": "apply", "Who": "me", "Version": "1", "Created": "2000-01-01T00:00:00Z"}
+
+
+def test_render():
+    registry = Registry()
+    counter = registry.counter("requests_total", "Requests", ["path"])
+    histogram = registry.histogram("latency_seconds", "Latency", ["path"])
+    histogram.buckets = (0.1, 1.0)
+
+    counter.inc('/a"b')
+    counter.inc('/a"b', amount=2)
+    histogram.observe(0.05, "/a")
+    histogram.observe(0.5, "/a")
+    histogram.observe(5, "/a")
+
+    assert registry.render().splitlines() == [
+        "# HELP requests_total Requests",
+        "# TYPE requests_total counter",
+        'requests_total{path="/a\\"b"} 3',
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{path="/a",le="0.1"} 1',
+        'latency_seconds_bucket{path="/a",le="1"} 2',
+        'latency_seconds_bucket{path="/a",le="+Inf"} 3',
+        'latency_seconds_sum{path="/a"} 5.55',
+        'latency_seconds_count{path="/a"} 3',
+    ]
+
+
+@pytest.mark.anyio
+async def test_metrics_endpoint():
+    state["controller"] = TFStateLockController(
+        stacks={
+            "metered": TFStack(
+                name="metered",
+                data_transformers=[],
+                storage_driver=MemoryStorageProvider(),
+                state_file_storage_identifier=MemoryStorageProviderItemIdentifier(path="metered.tfstate"),
+            )
+        }
+    )
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        await client.put("/metered/lock", json=LOCK)
+        await client.post("/metered/state", params={"ID": "lock-id"}, json={"version": 4, "serial": 1})
+        await client.get("/metered/state")
+        assert (await client.post("/metered/state", params={"ID": "other"}, json={"serial": 2})).status_code == 409
+        with pytest.raises(ValueError):
+            await client.get("/mistyped/state")
+
+        response = await client.get("/metrics")
+
+    state["controller"] = None
+    state["compressed_responses"].clear()
+
+    assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+    assert 'terraflex_operation_duration_seconds_count{stack="metered",operation="put"} 2' in response.text
+    assert STAGE_DURATION.count("metered", "lock", "lock_acquire") == 1
+    assert STAGE_DURATION.count("metered", "put", "storage_put") == 1
+    assert STAGE_DURATION.count("metered", "get", "storage_get") == 1
+    assert STAGE_DURATION.count("metered", "put", "json_decode") == 2
+    assert LOCK_CONFLICTS.value("metered", "put") == 1
+    # undeclared stacks share a single series
+    assert "mistyped" not in response.text
+    assert OPERATION_DURATION.count(UNKNOWN_STACK, "get") >= 1
@@ -0,0 +1,51 @@
+import json
+
+from terraflex.server.storage_provider_base import STORATE_PROVIDERS_ENTRYPOINT, StorageProviderProtocol
+from terraflex.utils.plugins import (
+    PLUGINS_CACHE_FILE_NAME,
+    LazyPluginRegistry,
+    get_providers,
+    installed_distributions_fingerprint,
+)
+
+
+def test_entry_points_are_cached(tmp_path):
+    providers = get_providers(StorageProviderProtocol, STORATE_PROVIDERS_ENTRYPOINT, cache_dir=tmp_path)
+    assert "local" in providers
+
+    cache = json.loads((tmp_path / PLUGINS_CACHE_FILE_NAME).read_text())
+    assert cache["fingerprint"] == installed_distributions_fingerprint()
+    assert "local" in cache["groups"][STORATE_PROVIDERS_ENTRYPOINT]
+
+    # the cached group is used as-is while the installed distributions are unchanged
+    cache["groups"][STORATE_PROVIDERS_ENTRYPOINT]["cached-only"] = "json:loads"
+    (tmp_path / PLUGINS_CACHE_FILE_NAME).write_text(json.dumps(cache))
+    providers = get_providers(StorageProviderProtocol, STORATE_PROVIDERS_ENTRYPOINT, cache_dir=tmp_path)
+    assert set(providers.entries) >= {"local", "cached-only"}
+
+    cache["fingerprint"] = "outdated"
+    (tmp_path / PLUGINS_CACHE_FILE_NAME).write_text(json.dumps(cache))
+    providers = get_providers(StorageProviderProtocol, STORATE_PROVIDERS_ENTRYPOINT, cache_dir=tmp_path)
+    assert "cached-only" not in providers.entries
+
+    # a malformed cache is a miss - it's scanned and written again
+    (tmp_path / PLUGINS_CACHE_FILE_NAME).write_text(json.dumps({**cache, "groups": {STORATE_PROVIDERS_ENTRYPOINT: []}}))
+    providers = get_providers(StorageProviderProtocol, STORATE_PROVIDERS_ENTRYPOINT, cache_dir=tmp_path)
+    assert "local" in providers
+    assert (
+        "local" in json.loads((tmp_path / PLUGINS_CACHE_FILE_NAME).read_text())["groups"][STORATE_PROVIDERS_ENTRYPOINT]
+    )
+
+
+def test_plugins_are_imported_on_lookup():
+    loaded = []
+
+    def validate(name, plugin):
+        loaded.append(name)
+        return plugin if callable(plugin) else None
+
+    registry = LazyPluginRegistry("test", {"dumps": "json:dumps", "invalid": "json:__name__"}, validate)
+    assert registry["dumps"] is json.dumps
+    assert loaded == ["dumps"]
+    assert "invalid" not in registry
+    assert list(registry) == ["dumps"]
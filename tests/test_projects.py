@@ -0,0 +1,55 @@
+import httpx
+import pytest
+import typer
+import yaml
+
+from terraflex.cli.cli import parse_projects
+from terraflex.server.app import app, build_projects, close_projects, state
+from terraflex.utils.dependency_manager import DependenciesManager
+
+
+def _write_project(directory, storage_config):
+    directory.mkdir()
+    config = {
+        "storage_providers": {"states": storage_config},
+        "transformers": {},
+        "stacks": {
+            "main": {"state_storage": {"provider": "states", "params": {"path": directory.name}}, "transformers": []},
+        },
+    }
+    (directory / "terraflex.yaml").write_text(yaml.safe_dump(config))
+
+
+def test_parse_projects(tmp_path):
+    assert parse_projects(f"infra={tmp_path},apps=.") == {"infra": tmp_path, "apps": tmp_path.cwd()}
+
+    for value in ["infra", "a/b=.", "infra=.,infra=."]:
+        with pytest.raises(typer.BadParameter):
+            parse_projects(value)
+
+
+@pytest.mark.anyio
+async def test_projects_share_identical_components(tmp_path):
+    _write_project(tmp_path / "first", {"type": "memory"})
+    _write_project(tmp_path / "second", {"type": "memory"})
+    _write_project(tmp_path / "third", {"type": "memory", "name": "other"})
+
+    directories = {name: tmp_path / name for name in ["first", "second", "third"]}
+    projects = await build_projects(directories, DependenciesManager([], dest_folder=tmp_path))
+    first, second, third = (projects[name].builder for name in directories)
+    assert await first.storage_provider("states") is await second.storage_provider("states")
+    assert await first.storage_provider("states") is not await third.storage_provider("states")
+
+    state["projects"] = projects
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        lock = {"ID": "lock", "Operation": "apply", "Who": "me", "Version": "1", "Created": "2000-01-01T00:00:00Z"}
+        assert (await client.put("/first/main/lock", json=lock)).status_code == 200
+        response = await client.post("/first/main/state", params={"ID": "lock"}, json={"version": 4, "serial": 1})
+        assert response.status_code == 200
+        assert (await client.get("/first/main/state")).json() == {"version": 4, "serial": 1}
+        assert (await client.get("/second/main/state")).status_code == 404
+        assert (await client.get("/missing/main/state")).status_code == 404
+        assert (await client.get("/main/state")).status_code == 404
+
+    state["projects"] = {}
+    await close_projects(list(projects.values()))
@@ -0,0 +1,139 @@
+import asyncio
+
+import httpx
+import pytest
+import yaml
+
+from terraflex.server.app import app, apply_config, state
+from terraflex.server.components import ComponentsBuilder
+from terraflex.server.config import ConfigFile
+from terraflex.server.reload import ConfigReloader, unchanged_components
+from terraflex.server.tf_state_lock_controller import TFStateLockController
+from terraflex.utils.dependency_manager import DependenciesManager
+
+RAW_CONFIG = {
+    "storage_providers": {
+        "states": {"type": "memory"},
+        "keys": {"type": "memory"},
+    },
+    "transformers": {
+        "encryption": {"type": "encryption", "key_type": "age", "import_from_storage": {"provider": "keys"}},
+    },
+    "stacks": {
+        "plain": {"state_storage": {"provider": "states", "params": {"path": "plain"}}, "transformers": []},
+        "encrypted": {
+            "state_storage": {"provider": "states", "params": {"path": "encrypted"}},
+            "transformers": ["encryption"],
+        },
+    },
+}
+
+
+def _config(**changes) -> ConfigFile:
+    raw_config = yaml.safe_load(yaml.safe_dump(RAW_CONFIG))
+    for path, value in changes.items():
+        *parents, key = path.split("__")
+        item = raw_config
+        for parent in parents:
+            item = item[parent]
+
+        item[key] = value
+
+    return ConfigFile.model_validate(raw_config)
+
+
+def test_unchanged_components():
+    config = _config()
+    assert len(unchanged_components(config, _config())) == 5
+
+    # a changed storage provider changes everything depending on it
+    changed = unchanged_components(config, _config(storage_providers__keys={"type": "memory", "extra": 1}))
+    assert changed == {("storage provider", "states"), ("stack", "plain")}
+
+    changed = unchanged_components(config, _config(stacks__plain__state_storage={"provider": "keys"}))
+    assert ("stack", "plain") not in changed
+    assert ("stack", "encrypted") in changed
+
+
+def test_unchanged_template_stacks():
+    template = {"state_storage": {"provider": "states", "params": {"path": "{name}"}}, "transformers": []}
+    config = _config(stacks={"env-*": template})
+    # stacks resolved from templates are compared by the config they resolve to
+    changed = unchanged_components(config, _config(stacks={"env-*": template, "other": template}), ["env-dev"])
+    assert ("stack", "env-dev") in changed
+
+    moved = {**template, "state_storage": {"provider": "keys", "params": {"path": "{name}"}}}
+    assert ("stack", "env-dev") not in unchanged_components(config, _config(stacks={"env-*": moved}), ["env-dev"])
+    assert ("stack", "env-dev") not in unchanged_components(config, _config(stacks={}), ["env-dev"])
+
+
+@pytest.mark.anyio
+async def test_apply_config_reuses_unchanged_components(tmp_path):
+    raw_config = {
+        "storage_providers": {"first": {"type": "memory"}, "second": {"type": "memory"}},
+        "transformers": {},
+        "stacks": {
+            name: {"state_storage": {"provider": name, "params": {"path": name}}, "transformers": []}
+            for name in ["first", "second"]
+        },
+    }
+    config = ConfigFile.model_validate(raw_config)
+    builder = ComponentsBuilder(config, DependenciesManager([], dest_folder=tmp_path), workdir=tmp_path)
+    previous_controller = TFStateLockController(stacks=await builder.build_all())
+    state["controller"], state["builder"] = previous_controller, builder
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        lock = {"ID": "lock", "Operation": "apply", "Who": "me", "Version": "1", "Created": "2000-01-01T00:00:00Z"}
+        assert (await client.put("/first/lock", json=lock)).status_code == 200
+        response = await client.post("/first/state", params={"ID": "lock"}, json={"version": 4, "serial": 1})
+        assert response.status_code == 200
+
+        new_config = ConfigFile.model_validate(
+            {
+                **raw_config,
+                "storage_providers": {**raw_config["storage_providers"], "second": {"type": "memory", "extra": 1}},
+                "stacks": {**raw_config["stacks"], "third": raw_config["stacks"]["first"]},
+            }
+        )
+        # a request served by the previous controller delays closing it - not the swap
+        state["in_flight"].enter(previous_controller)
+        reload = asyncio.create_task(apply_config(new_config))
+        while state["controller"] is previous_controller:
+            await asyncio.sleep(0.01)
+
+        assert not reload.done()
+        state["in_flight"].exit(previous_controller)
+        await reload
+
+        # the stored state and the held lock survive - their storage provider was reused
+        assert (await client.get("/first/state")).json() == {"version": 4, "serial": 1}
+        assert (await client.get("/third/state")).json() == {"version": 4, "serial": 1}
+        assert (await client.put("/first/lock", json=lock)).status_code == 409
+
+    assert state["builder"] is not builder
+    assert await state["builder"].storage_provider("first") is await builder.storage_provider("first")
+    assert await state["builder"].storage_provider("second") is not await builder.storage_provider("second")
+
+    await state["builder"].close()
+    state["controller"], state["builder"] = None, None
+
+
+@pytest.mark.anyio
+async def test_config_reloader(tmp_path):
+    config_file = tmp_path / "terraflex.yaml"
+    config_file.write_text(yaml.safe_dump(RAW_CONFIG))
+    applied: list[ConfigFile] = []
+
+    async def apply(config: ConfigFile) -> None:
+        applied.append(config)
+
+    reloader = ConfigReloader(config_file, config_file.read_bytes(), apply)
+    assert not await reloader.check()
+
+    # an invalid config is not applied
+    config_file.write_text("stacks: [")
+    assert not await reloader.check()
+
+    config_file.write_text(yaml.safe_dump({**RAW_CONFIG, "stacks": {}}))
+    assert await reloader.check()
+    assert applied == [ConfigFile.model_validate({**RAW_CONFIG, "stacks": {}})]
@@ -0,0 +1,65 @@
+import sys
+
+import pytest
+
+from terraflex.cli import runner
+from terraflex.cli.runner import COMMAND_NOT_STARTED, format_summary, run_stacks
+
+SCRIPT = """
+import os
+import sys
+
+print("stack", os.environ["STACK"])
+print("in", os.path.basename(os.getcwd()))
+sys.exit(0 if os.environ["STACK"] == "dev" else 2)
+"""
+
+
+@pytest.mark.anyio
+async def test_run_stacks(tmp_path, capsys):
+    (tmp_path / "dev").mkdir()
+    (tmp_path / "prod").mkdir()
+
+    runs = await run_stacks(
+        [sys.executable, "-c", SCRIPT],
+        ["dev", "prod", "missing"],
+        str(tmp_path / "{stack}"),
+        parallel=2,
+        environment=lambda stack_name: {"STACK": stack_name},
+    )
+
+    assert [(run.stack_name, run.returncode) for run in runs] == [
+        ("dev", 0),
+        ("prod", 2),
+        ("missing", COMMAND_NOT_STARTED),
+    ]
+
+    output = capsys.readouterr().out.splitlines()
+    assert "[dev    ] stack dev" in output
+    assert "[dev    ] in dev" in output
+    assert "[prod   ] in prod" in output
+    assert any(line.startswith("[missing] Error:") for line in output)
+
+    summary = format_summary(runs)
+    assert "dev      ok" in summary
+    assert "prod     failed (2)" in summary
+    assert summary.endswith("1 succeeded, 2 failed")
+
+
+@pytest.mark.anyio
+async def test_long_lines_are_printed_in_parts(tmp_path, capsys, monkeypatch):
+    monkeypatch.setattr(runner, "MAX_LINE_LENGTH", 16)
+    line = "".join(str(index % 10) for index in range(50))
+
+    await run_stacks(
+        [sys.executable, "-c", f"print({line!r}); print('short', end='')"],
+        ["dev"],
+        str(tmp_path),
+        parallel=1,
+        environment=lambda _: {},
+    )
+
+    output = [printed.removeprefix("[dev] ") for printed in capsys.readouterr().out.splitlines()]
+    assert len(output) > 2
+    assert "".join(output[:-1]) == line
+    assert output[-1] == "short"
@@ -0,0 +1,196 @@
+import asyncio
+import gzip
+import json
+
+import httpx
+import pytest
+
+from terraflex.plugins.memory_storage_provider.memory_storage_provider import (
+    MemoryStorageProvider,
+    MemoryStorageProviderItemIdentifier,
+)
+from terraflex.server.app import app, state
+from terraflex.server.base_state_lock_provider import LockBody, LockingError
+from terraflex.server.tf_state_lock_controller import TFStack, TFStateLockController
+
+STATE = {"version": 4, "serial": 1, "resources": [{"name": f"resource-{i}"} for i in range(200)]}
+LOCK = LockBody(ID="lock-id", Operation="apply", Who="me", Version="1", Created="2000-01-01T00:00:00Z")
+
+
+@pytest.fixture
+async def client():
+    state["controller"] = TFStateLockController(
+        stacks={
+            "stack": TFStack(
+                name="stack",
+                data_transformers=[],
+                storage_driver=MemoryStorageProvider(),
+                state_file_storage_identifier=MemoryStorageProviderItemIdentifier(path="stack.tfstate"),
+            )
+        }
+    )
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+    state["controller"] = None
+    state["compressed_responses"].clear()
+
+
+@pytest.mark.anyio
+async def test_compressed_state_round_trip(client):
+    (await client.put("/stack/lock", json=LOCK.model_dump())).raise_for_status()
+    response = await client.post(
+        "/stack/state",
+        params={"ID": LOCK.ID},
+        content=gzip.compress(json.dumps(STATE).encode()),
+        headers={"Content-Encoding": "gzip", "Content-Type": "application/json"},
+    )
+    response.raise_for_status()
+
+    for _ in range(2):
+        # the second read is served from the compressed responses cache
+        response = await client.get("/stack/state", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert response.json() == STATE
+
+    response = await client.get("/stack/state", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in response.headers
+    assert response.json() == STATE
+
+
+@pytest.mark.anyio
+async def test_invalid_encoded_body(client):
+    (await client.put("/stack/lock", json=LOCK.model_dump())).raise_for_status()
+    response = await client.post(
+        "/stack/state", params={"ID": LOCK.ID}, content=b"not gzip", headers={"Content-Encoding": "gzip"}
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.anyio
+async def test_etag(client):
+    (await client.put("/stack/lock", json=LOCK.model_dump())).raise_for_status()
+    (await client.post("/stack/state", params={"ID": LOCK.ID}, json=STATE)).raise_for_status()
+
+    response = await client.get("/stack/state")
+    etag = response.headers["ETag"]
+    controller = state["controller"]
+    original_get_raw = controller.get_raw
+
+    async def get_raw(*_):
+        raise AssertionError("State content should not be read")
+
+    controller.get_raw = get_raw
+    response = await client.get("/stack/state", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    controller.get_raw = original_get_raw
+
+    # the ETag of an encoded response matches as well
+    response = await client.get("/stack/state", headers={"Accept-Encoding": "gzip"})
+    response = await client.get("/stack/state", headers={"If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 304
+
+    (await client.post("/stack/state", params={"ID": LOCK.ID}, json={**STATE, "serial": 2})).raise_for_status()
+    storage = controller.stacks["stack"].storage_driver
+    versions = 0
+    original_get_file_version = storage.get_file_version
+
+    async def get_file_version(*args):
+        nonlocal versions
+        versions += 1
+        return await original_get_file_version(*args)
+
+    storage.get_file_version = get_file_version
+    response = await client.get("/stack/state", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    # the version is taken once - for both the If-None-Match check and the ETag
+    assert versions == 1
+    storage.get_file_version = original_get_file_version
+
+
+@pytest.mark.anyio
+async def test_skip_no_op_and_stale_writes(client):
+    controller = state["controller"]
+    storage = controller.stacks["stack"].storage_driver
+    writes = 0
+    original_put_file = storage.put_file
+
+    async def put_file(*args):
+        nonlocal writes
+        writes += 1
+        await original_put_file(*args)
+
+    storage.put_file = put_file
+    (await client.put("/stack/lock", json=LOCK.model_dump())).raise_for_status()
+    for _ in range(2):
+        (await client.post("/stack/state", params={"ID": LOCK.ID}, json=STATE)).raise_for_status()
+
+    assert writes == 1
+
+    # still rejected without holding the lock
+    response = await client.post("/stack/state", params={"ID": "other"}, json=STATE)
+    assert response.status_code == 409
+
+    response = await client.post("/stack/state", params={"ID": LOCK.ID}, json={**STATE, "serial": 0})
+    assert response.status_code == 409
+    assert response.json()["stored_serial"] == 1
+
+    # the lock is checked before the serial - the stored serial is not disclosed to others
+    response = await client.post("/stack/state", params={"ID": "other"}, json={**STATE, "serial": 0})
+    assert response.status_code == 409
+    assert response.json()["ID"] == "other"
+
+    # the state was changed behind the server's back - the fingerprint is not trusted anymore
+    await original_put_file(controller.stacks["stack"].state_file_storage_identifier, b"{}")
+    (await client.post("/stack/state", params={"ID": LOCK.ID}, json=STATE)).raise_for_status()
+    assert writes == 2
+
+
+class SlowTransformer:
+    def __init__(self):
+        self.started = asyncio.Event()
+        self.cancelled = False
+
+    async def transform_write_file_content(self, file_identifier: str, content: bytes) -> bytes:
+        self.started.set()
+        try:
+            await asyncio.sleep(1)
+
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+        return content
+
+    async def transform_read_file_content(self, file_identifier: str, content: bytes) -> bytes:
+        return content
+
+
+@pytest.mark.anyio
+async def test_transformation_runs_during_lock_check():
+    transformer = SlowTransformer()
+    storage = MemoryStorageProvider()
+    key = MemoryStorageProviderItemIdentifier(path="stack.tfstate")
+    controller = TFStateLockController(
+        stacks={
+            "stack": TFStack(
+                name="stack", data_transformers=[transformer], storage_driver=storage, state_file_storage_identifier=key
+            )
+        }
+    )
+    await storage.acquire_lock(key, LOCK)
+    original_read_lock = storage.read_lock
+
+    async def read_lock(item_identifier):
+        # the lock check finishes only once the transformation is already running
+        await asyncio.wait_for(transformer.started.wait(), timeout=1)
+        return await original_read_lock(item_identifier)
+
+    storage.read_lock = read_lock
+    with pytest.raises(LockingError):
+        await controller.put("stack", "other-lock-id", STATE)
+
+    assert transformer.cancelled
+    with pytest.raises(FileNotFoundError):
+        await storage.get_file(key)
@@ -0,0 +1,97 @@
+import asyncio
+import urllib.request
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+import pytest
+from fastapi import FastAPI
+from uvicorn import Config
+
+from terraflex.cli.forwarder import UnixSocketForwarder
+from terraflex.cli.server_process import ForkedServer, ServerStartupError, ThreadedServer
+from terraflex.server.transport import bind_socket, bind_unix_socket
+
+SERVER_TYPES = [ThreadedServer, ForkedServer]
+
+
+def create_app(startup_delay: float = 0, fail: bool = False) -> FastAPI:
+    @asynccontextmanager
+    async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+        await asyncio.sleep(startup_delay)
+        if fail:
+            raise RuntimeError("startup failed")
+
+        yield
+
+    app = FastAPI(lifespan=lifespan)
+
+    @app.get("/ready")
+    def ready() -> str:
+        return "Ready"
+
+    return app
+
+
+def create_config(app: FastAPI) -> Config:
+    return Config(app=app, lifespan="on", log_level="critical")
+
+
+def create_server(server_type, app: FastAPI):
+    return server_type(create_config(app), bind_socket("127.0.0.1", 0))
+
+
+@pytest.mark.parametrize("server_type", SERVER_TYPES)
+def test_server_is_ready_on_an_ephemeral_port(server_type):
+    first = create_server(server_type, create_app())
+    second = create_server(server_type, create_app())
+    port = first.socket.getsockname()[1]
+    assert port != second.socket.getsockname()[1]
+
+    first.start(timeout=10)
+    try:
+        # ready means serving - no polling needed
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/ready") as response:
+            assert response.read() == b'"Ready"'
+
+    finally:
+        first.stop()
+        second.stop()
+
+
+@pytest.mark.parametrize("server_type", SERVER_TYPES)
+def test_server_startup_failure(server_type):
+    server = create_server(server_type, create_app(fail=True))
+    with pytest.raises(ServerStartupError, match="failed to start"):
+        server.start(timeout=10)
+
+
+@pytest.mark.parametrize("server_type", SERVER_TYPES)
+def test_server_startup_timeout(server_type):
+    server = create_server(server_type, create_app(startup_delay=30))
+    with pytest.raises(ServerStartupError, match="did not start within"):
+        server.start(timeout=0.2)
+
+
+@pytest.mark.parametrize("server_type", SERVER_TYPES)
+def test_unix_socket_server_through_forwarder(server_type, tmp_path):
+    socket_path = tmp_path / "sockets" / "server.sock"
+    server = server_type(create_config(create_app()), bind_unix_socket(socket_path))
+    assert socket_path.stat().st_mode & 0o777 == 0o600
+
+    server.start(timeout=10)
+    forwarder = UnixSocketForwarder(socket_path)
+    forwarder.start()
+    try:
+        for _ in range(3):
+            with urllib.request.urlopen(f"http://127.0.0.1:{forwarder.port}/ready") as response:
+                assert response.read() == b'"Ready"'
+
+        with pytest.raises(FileExistsError):
+            bind_unix_socket(socket_path)
+
+    finally:
+        forwarder.stop()
+        server.stop()
+
+    # the socket file of a server that is gone is replaced
+    bind_unix_socket(socket_path).close()
@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+from terraflex.plugins.compression_transformation.compression_transformation_provider import (
+    CompressionTransformation,
+)
+
+STATE = json.dumps({"version": 4, "resources": [{"type": "null_resource", "name": f"r{i}"} for i in range(100)]})
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("codec", ["gzip", "zstd"])
+async def test_round_trip(codec):
+    if codec == "zstd":
+        pytest.importorskip("zstandard")
+
+    transformation = CompressionTransformation(codec=codec)
+    compressed = await transformation.transform_write_file_content("test", STATE.encode())
+    assert len(compressed) < len(STATE) / 5
+
+    # any codec is readable regardless of the configured one
+    reader = CompressionTransformation(codec="gzip")
+    assert await reader.transform_read_file_content("test", compressed) == STATE.encode()
+
+
+@pytest.mark.anyio
+async def test_uncompressed_content_is_read_as_is():
+    transformation = CompressionTransformation(codec="gzip")
+    assert await transformation.transform_read_file_content("test", STATE.encode()) == STATE.encode()
+
+
+@pytest.mark.anyio
+async def test_dictionary():
+    pytest.importorskip("zstandard")
+    dictionary = STATE.encode()[:512]
+    transformation = CompressionTransformation(codec="zstd", dictionary=dictionary)
+    compressed = await transformation.transform_write_file_content("test", STATE.encode())
+    assert await transformation.transform_read_file_content("test", compressed) == STATE.encode()
+
+    with pytest.raises(ValueError):
+        await CompressionTransformation(codec="zstd").transform_read_file_content("test", compressed)
+
+
+@pytest.mark.anyio
+async def test_gzip_level_zero_stores_uncompressed():
+    transformation = CompressionTransformation(codec="gzip", level=0)
+    compressed = await transformation.transform_write_file_content("test", STATE.encode())
+    # level 0 is a setting - it stores the content instead of falling back to the default level
+    assert len(compressed) > len(STATE)
+    assert await transformation.transform_read_file_content("test", compressed) == STATE.encode()